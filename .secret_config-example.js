@@ -1,5 +1,8 @@
 module.exports = {
     "server": "SERVER_ADDRESS_HERE",
+    "api": "http://localhost:3000",
+    "workers": 4,
+    "subscribe": false,
     "accounts": {
         "ACCOUNT_ADDRESS_HERE": {
             "apiKey": "RANDOM_STRING_HERE",
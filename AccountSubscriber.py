@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+import websocket
+
+RIPPLE_EPOCH = 946684800  # Seconds between the Unix epoch and the Ripple epoch
+
+
+def toTransaction(message: dict) -> dict:
+    ''' Converts a validated XRP payment from a rippled transaction stream
+    message into the transaction format returned by xrp-api. Returns None for
+    any other kind of transaction
+    '''
+    tx = message['transaction']
+    meta = message['meta']
+    delivered = meta.get('delivered_amount', tx.get('Amount'))
+    if tx['TransactionType'] != 'Payment' or not isinstance(delivered, str) \
+       or not delivered.isdigit():
+        return None
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(tx.get('date', time.time() - RIPPLE_EPOCH) + RIPPLE_EPOCH))
+    source = {'address': tx['Account']}
+    destination = {'address': tx['Destination']}
+    if 'SourceTag' in tx:
+        source['tag'] = tx['SourceTag']
+    if 'DestinationTag' in tx:
+        destination['tag'] = tx['DestinationTag']
+    return {'type': 'payment',
+            'address': tx['Account'],
+            'sequence': tx['Sequence'],
+            'id': tx['hash'],
+            'specification': {'source': source, 'destination': destination},
+            'outcome': {'result': meta['TransactionResult'],
+                        'timestamp': timestamp,
+                        'fee': f"{int(tx['Fee']) / 1e6:.6f}",
+                        'ledgerVersion': message['ledger_index'],
+                        'indexInLedger': meta['TransactionIndex'],
+                        'deliveredAmount': {'currency': 'XRP',
+                                            'value': f'{int(delivered) / 1e6:.6f}'}}}
+
+
+def getFinalBalance(message: dict, account: str) -> str:
+    ''' Returns the balance of an account after the streamed transaction, in
+    drops, or None if the transaction did not modify it
+    '''
+    for node in message['meta'].get('AffectedNodes', []):
+        entry = node.get('ModifiedNode') or node.get('CreatedNode')
+        if entry is None or entry['LedgerEntryType'] != 'AccountRoot':
+            continue
+        fields = entry.get('FinalFields') or entry.get('NewFields', {})
+        if fields.get('Account') == account and 'Balance' in fields:
+            return fields['Balance']
+    return None
+
+
+class AccountSubscriber:
+    ''' Subscribes to the account streams of a rippled WebSocket server and
+    reports every validated transaction that affects the subscribed accounts.
+    The connection is reopened with exponential backoff when it drops, moving
+    on to the next server when a list of them is given
+    '''
+    reconnectDelay = 1
+    maxReconnectDelay = 60
+
+    def __init__(self, url, accounts: list, onTransaction, onReconnect=None):
+        self.urls = [url] if isinstance(url, str) else list(url)
+        self.url = self.urls[0]
+        self.accounts = list(accounts)
+        self.onTransaction = onTransaction
+        self.onReconnect = onReconnect
+        self.ws = None
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        ws = self.ws
+        if ws is not None:
+            ws.close()
+
+    def run(self):
+        delay = self.reconnectDelay
+        connected = False
+        while not self.stopEvent.is_set():
+            try:
+                self.ws = websocket.create_connection(self.url)
+                self.ws.send(json.dumps({'id': 'zerpy', 'command': 'subscribe',
+                                         'accounts': self.accounts}))
+                if connected and self.onReconnect is not None:
+                    # Transactions may have been missed while disconnected
+                    self.onReconnect()
+                connected = True
+                delay = self.reconnectDelay
+                while not self.stopEvent.is_set():
+                    self.handleMessage(json.loads(self.ws.recv()))
+            except (websocket.WebSocketException, OSError, ValueError):
+                pass
+            finally:
+                if self.ws is not None:
+                    self.ws.close()
+                    self.ws = None
+            if self.stopEvent.wait(delay):
+                break
+            self.url = self.urls[(self.urls.index(self.url) + 1) % len(self.urls)]
+            delay = min(delay * 2, self.maxReconnectDelay)
+
+    def handleMessage(self, message: dict):
+        if message.get('type') != 'transaction' or not message.get('validated'):
+            return
+        tx = message['transaction']
+        affected = {tx.get('Account'), tx.get('Destination')}
+        transaction = toTransaction(message)
+        for account in self.accounts:
+            balance = getFinalBalance(message, account)
+            if account in affected or balance is not None:
+                self.onTransaction(account, transaction, balance)
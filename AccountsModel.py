@@ -0,0 +1,33 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+
+AddressRole = Qt.UserRole
+
+
+class AccountsModel(QAbstractListModel):
+    ''' List model over the configured accounts, shown as "address  (alias)",
+    with the address as item data and an address to row lookup
+    '''
+    def __init__(self, accounts: dict):
+        super().__init__()
+        self.addresses = list(accounts)
+        self.labels = [f"{address}  ({accounts[address]['alias']})"
+                       if 'alias' in accounts[address] else address
+                       for address in self.addresses]
+        self.rows = {address: row for row, address in enumerate(self.addresses)}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.addresses)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.labels[index.row()]
+        elif role == AddressRole:
+            return self.addresses[index.row()]
+        return None
+
+    def getRow(self, address: str) -> int:
+        ''' Returns the row of an address, or -1 if it is not configured
+        '''
+        return self.rows.get(address, -1)
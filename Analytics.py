@@ -0,0 +1,116 @@
+from TransactionHistory import TransactionHistory
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+
+
+class AccountAnalytics:
+    ''' Balance history, daily net flow and per counterparty totals of an
+    account, computed over the history columns with NumPy and updated
+    incrementally as the history grows. All amounts are int64 drops.
+
+    The balance history is rebuilt backwards from the current balance with
+    the amounts and fees of the successful transactions of the history, so
+    fees of failed transactions and other balance changes are not included.
+    Days are UTC days
+    '''
+    def __init__(self, history: TransactionHistory, balance: int):
+        self.account = history.account
+        self.clear()
+        self.update(history, balance)
+
+    def clear(self):
+        self.origin = None
+        self.length = 0
+        self.times = np.empty(0, dtype=np.int64)
+        self.deltas = np.empty(0, dtype=np.int64)
+        self.balances = np.empty(0, dtype=np.int64)
+        self.days = np.empty(0, dtype='datetime64[D]')
+        self.dailyIn = np.empty(0, dtype=np.int64)
+        self.dailyOut = np.empty(0, dtype=np.int64)
+        self.addresses = []
+        self.counterpartyIn = np.empty(0, dtype=np.int64)
+        self.counterpartyOut = np.empty(0, dtype=np.int64)
+        self.counterpartyCounts = np.empty(0, dtype=np.int64)
+
+    @property
+    def dailyNet(self) -> np.ndarray:
+        return self.dailyIn + self.dailyOut
+
+    def update(self, history: TransactionHistory, balance: int):
+        ''' Takes in the transactions added to the history since the last
+        update, or recomputes everything if the history was reread
+        '''
+        if history.origin is not self.origin or len(history) < self.length:
+            self.clear()
+            self.origin = history.origin
+        start = self.length
+        if len(history) == start:
+            return
+
+        # The new rows of the history columns, oldest first. They are copied, as
+        # the columns are shared with the histories that append to them
+        end = len(history)
+        times = np.frombuffer(history.times[start:end], dtype=np.int64)
+        drops = np.frombuffer(history.drops[start:end], dtype=np.int64)
+        fees = np.frombuffer(history.fees[start:end], dtype=np.int64)
+        counterparties = np.frombuffer(history.counterparties[start:end], dtype=np.uint32)
+        deltas = drops - fees
+
+        # Balance after every transaction
+        if start == 0:
+            after = np.cumsum(deltas[::-1])[::-1]
+            balances = balance - after + deltas
+        else:
+            balances = self.balances[-1] + np.cumsum(deltas)
+
+        # Daily totals. Times are sorted, so days come in runs
+        days = (times // SECONDS_PER_DAY).astype('datetime64[D]')
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        dailyIn = np.add.reduceat(np.where(deltas > 0, deltas, 0), starts)
+        dailyOut = np.add.reduceat(np.where(deltas < 0, deltas, 0), starts)
+        days = days[starts]
+        if len(self.days) and days[0] == self.days[-1]:
+            self.dailyIn[-1] += dailyIn[0]
+            self.dailyOut[-1] += dailyOut[0]
+            days, dailyIn, dailyOut = days[1:], dailyIn[1:], dailyOut[1:]
+
+        # Per counterparty totals. bincount would sum the weights as float64
+        addresses = list(history.addresses)  # Grows as the history is extended
+        counterpartyIn = np.zeros(len(addresses), dtype=np.int64)
+        counterpartyOut = np.zeros(len(addresses), dtype=np.int64)
+        np.add.at(counterpartyIn, counterparties, np.where(drops > 0, drops, 0))
+        np.add.at(counterpartyOut, counterparties, np.where(drops < 0, drops, 0))
+        counts = np.bincount(counterparties, minlength=len(addresses))
+        grow = len(addresses) - len(self.addresses)
+
+        self.times = np.concatenate((self.times, times))
+        self.deltas = np.concatenate((self.deltas, deltas))
+        self.balances = np.concatenate((self.balances, balances))
+        self.days = np.concatenate((self.days, days))
+        self.dailyIn = np.concatenate((self.dailyIn, dailyIn))
+        self.dailyOut = np.concatenate((self.dailyOut, dailyOut))
+        self.addresses = addresses
+        self.counterpartyIn = np.pad(self.counterpartyIn, (0, grow)) + counterpartyIn
+        self.counterpartyOut = np.pad(self.counterpartyOut, (0, grow)) + counterpartyOut
+        self.counterpartyCounts = np.pad(self.counterpartyCounts, (0, grow)) + counts
+        self.length = len(history)
+
+    def getDailyBalances(self) -> tuple:
+        ''' Returns the days with transactions and the balance at the end of
+        each of them
+        '''
+        if not len(self.times):
+            return self.days, self.balances
+        days = (self.times // SECONDS_PER_DAY).astype('datetime64[D]')
+        last = np.flatnonzero(np.r_[days[1:] != days[:-1], True])
+        return days[last], self.balances[last]
+
+    def getTopCounterparties(self, count: int=None) -> list:
+        ''' Returns (address, received, sent, transactions) tuples of the
+        counterparties with the largest volume first, with amounts in drops
+        '''
+        volume = self.counterpartyIn - self.counterpartyOut
+        order = np.argsort(-volume, kind='stable')[:count]
+        return [(self.addresses[i], int(self.counterpartyIn[i]), int(self.counterpartyOut[i]),
+                 int(self.counterpartyCounts[i])) for i in order]
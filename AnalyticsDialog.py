@@ -0,0 +1,120 @@
+import numpy as np
+from PyQt5.QtCore import Qt, QPointF
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QPen
+from PyQt5.QtWidgets import (QDialog, QHeaderView, QLabel, QTableWidget, QTableWidgetItem,
+                             QTabWidget, QVBoxLayout, QWidget)
+
+
+class BalanceChart(QWidget):
+    ''' Line chart of the end of day balances
+    '''
+    margin = 40
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.days = np.empty(0, dtype='datetime64[D]')
+        self.balances = np.empty(0, dtype=np.int64)
+        self.setMinimumHeight(200)
+
+    def setData(self, days: np.ndarray, balances: np.ndarray):
+        self.days, self.balances = days, balances
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QColor('#f2f2f2'))
+        if len(self.balances) < 2:
+            painter.drawText(self.rect(), Qt.AlignCenter, 'Not enough transactions')
+            return
+
+        width, height = self.width() - 2 * self.margin, self.height() - 2 * self.margin
+        # Keeps at most one point per pixel
+        points = np.unique(np.linspace(0, len(self.balances) - 1, min(len(self.balances), width),
+                                       dtype=np.int64))
+        balances = self.balances[points] / 1e6
+        low, high = balances.min(), balances.max()
+        span = high - low or 1
+        xs = self.margin + np.arange(len(points)) * width / max(1, len(points) - 1)
+        ys = self.margin + (high - balances) * height / span
+
+        path = QPainterPath(QPointF(xs[0], ys[0]))
+        for x, y in zip(xs[1:], ys[1:]):
+            path.lineTo(x, y)
+        painter.drawText(4, self.margin - 8, f'{high:,.6f} XRP')
+        painter.drawText(4, self.height() - self.margin + 16, f'{low:,.6f} XRP')
+        painter.drawText(self.margin, self.height() - 8, str(self.days[0]))
+        painter.drawText(self.width() - self.margin - 70, self.height() - 8, str(self.days[-1]))
+        painter.setPen(QPen(QColor('#0066cc'), 2))
+        painter.drawPath(path)
+
+
+class AnalyticsDialog(QDialog):
+    ''' Shows the balance history, daily net flow and counterparty totals of
+    the active account, refreshed whenever new data arrives
+    '''
+    def __init__(self, controller, newDataSignal, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.newDataSignal = newDataSignal
+
+        self.setWindowTitle('Analytics')
+        self.resize(700, 500)
+
+        self.infoLabel = QLabel()
+        self.infoLabel.setAlignment(Qt.AlignCenter)
+
+        self.chart = BalanceChart()
+
+        self.dailyTable = QTableWidget(0, 4)
+        self.dailyTable.setHorizontalHeaderLabels(['Day (UTC)', 'Received', 'Sent', 'Net flow'])
+        self.counterpartyTable = QTableWidget(0, 4)
+        self.counterpartyTable.setHorizontalHeaderLabels(['Counterparty', 'Received', 'Sent',
+                                                          'Transactions'])
+        for table in (self.dailyTable, self.counterpartyTable):
+            table.verticalHeader().setVisible(False)
+            table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        tabs = QTabWidget()
+        tabs.addTab(self.chart, 'Balance')
+        tabs.addTab(self.dailyTable, 'Daily flow')
+        tabs.addTab(self.counterpartyTable, 'Counterparties')
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.infoLabel)
+        layout.addWidget(tabs)
+        self.setLayout(layout)
+
+        self.newDataSignal.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self):
+        analytics = self.controller.getAnalytics()
+        if analytics is None:
+            self.infoLabel.setText('No account data yet')
+            return
+        self.infoLabel.setText(f'{analytics.account}  ({analytics.length} transactions)')
+        self.chart.setData(*analytics.getDailyBalances())
+
+        # Newest days first
+        rows = zip(analytics.days[::-1], analytics.dailyIn[::-1], analytics.dailyOut[::-1])
+        self.fillTable(self.dailyTable, [(str(day), f'{received / 1e6:.6f}', f'{sent / 1e6:.6f}',
+                                          f'{(received + sent) / 1e6:+.6f}')
+                                         for day, received, sent in rows])
+        self.fillTable(self.counterpartyTable,
+                       [(address, f'{received / 1e6:.6f}', f'{sent / 1e6:.6f}', str(count))
+                        for address, received, sent, count in analytics.getTopCounterparties()])
+
+    def fillTable(self, table: QTableWidget, rows: list):
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for column, text in enumerate(row):
+                item = QTableWidgetItem(text)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(i, column, item)
+
+    def done(self, result: int):
+        self.newDataSignal.disconnect(self.refresh)
+        super().done(result)
@@ -0,0 +1,346 @@
+from Metrics import metrics
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RetryBudget:
+    ''' Limits retries to a fraction of the requests made, so a failing server
+    does not get multiplied load from retrying clients
+    '''
+    def __init__(self, ratio: float=0.2, maxTokens: float=10.0):
+        self.ratio = ratio
+        self.maxTokens = maxTokens
+        self.tokens = maxTokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.maxTokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class Server:
+    ''' Health and latency of one xrp-api server. The latency is a moving
+    average of the probes and of the requests served. A server that failed
+    is unhealthy until it serves a request or a probe again, or for cooldown
+    seconds, after which it is tried again like a healthy one
+    '''
+    smoothing = 0.3
+    cooldown = 30.0
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.latency = None
+        self.failedAt = None
+        self.lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        with self.lock:
+            return self.failedAt is None or time.monotonic() - self.failedAt >= self.cooldown
+
+    def record(self, seconds: float):
+        with self.lock:
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += self.smoothing * (seconds - self.latency)
+            self.failedAt = None
+
+    def fail(self):
+        with self.lock:
+            self.failedAt = time.monotonic()
+
+
+class ApiClient:
+    ''' Client for the xrp-api REST server. Keeps a pool of keep-alive
+    connections, applies timeouts to every call and retries idempotent
+    requests with jittered exponential backoff within a retry budget.
+
+    Given several server URLs, requests go to the fastest healthy server and
+    fail over to the next one when a server cannot be reached or answers
+    with a server error. Servers are probed every probeInterval seconds.
+    With a hedgeDelay, account reads still unanswered after that many
+    seconds are also sent to the second fastest server, and the first
+    successful answer wins.
+
+    With a ResponseCache, account info, the first page of account
+    transactions and transactions by id are served from it while fresh.
+
+    Every method returns the decoded response with an added 'status' entry
+    that is either 'ok' or 'error'
+    '''
+    retryStatusCodes = {429, 500, 502, 503, 504}
+    probePath = '/v3/servers/info'
+
+    def __init__(self, url='http://localhost:3000', poolSize: int=8,
+                 timeout: tuple=(3.05, 20), maxRetries: int=3,
+                 backoffBase: float=0.25, backoffCap: float=4.0,
+                 probeInterval: float=30.0, hedgeDelay: float=None, cache=None):
+        urls = [url] if isinstance(url, str) else list(url)
+        self.servers = [Server(url) for url in urls]
+        self.timeout = timeout
+        self.maxRetries = maxRetries
+        self.backoffBase = backoffBase
+        self.backoffCap = backoffCap
+        self.probeInterval = probeInterval
+        self.hedgeDelay = hedgeDelay
+        self.cache = cache
+        self.retryBudget = RetryBudget()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(urls), pool_maxsize=poolSize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=poolSize)
+        # Hedged reads wait on their own pool, as they may be called from the main one
+        self.hedgeExecutor = ThreadPoolExecutor(max_workers=2 * poolSize)
+        self.stopEvent = threading.Event()
+        if len(self.servers) > 1:
+            threading.Thread(target=self.runProbes, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return self.getServers()[0].url
+
+    def getServers(self) -> list:
+        ''' Returns the servers from the best to the worst: healthy ones
+        first, by latency, with unmeasured ones in configuration order
+        '''
+        return sorted(self.servers, key=lambda server: (not server.healthy,
+                                                        server.latency or 0))
+
+    def probe(self, server: Server):
+        try:
+            started = time.perf_counter()
+            response = self.session.get(server.url + self.probePath, timeout=self.timeout)
+            seconds = time.perf_counter() - started
+        except requests.exceptions.RequestException:
+            server.fail()
+        else:
+            if response.ok:
+                server.record(seconds)
+            else:
+                server.fail()
+        metrics.increment('zerpy_api_probes_total', healthy=str(server.healthy).lower())
+
+    def runProbes(self):
+        while not self.stopEvent.is_set():
+            for server in self.servers:
+                self.probe(server)
+            self.stopEvent.wait(self.probeInterval)
+
+    def request(self, method: str, path: str, timeout: tuple=None, idempotent: bool=True,
+                endpoint: str=None, server: Server=None, **kwargs) -> dict:
+        ''' endpoint names the call in the metrics, the path by default.
+        server is the server tried first, the best one by default
+        '''
+        timeout = timeout if timeout is not None else self.timeout
+        endpoint = endpoint or path
+        servers = self.getServers()
+        if server is not None:
+            servers.remove(server)
+            servers.insert(0, server)
+        self.retryBudget.deposit()
+        attempt = 0
+        while True:
+            server = servers[attempt % len(servers)]
+            try:
+                started = time.perf_counter()
+                with metrics.span('zerpy_api_request_seconds', endpoint=endpoint):
+                    response = self.session.request(method, server.url + path, timeout=timeout, **kwargs)
+                metrics.increment('zerpy_api_received_bytes_total', len(response.content),
+                                  endpoint=endpoint)
+                retry = idempotent and response.status_code in self.retryStatusCodes
+                error = None
+                if response.status_code >= 500:
+                    server.fail()
+                else:
+                    server.record(time.perf_counter() - started)
+            except requests.exceptions.ConnectTimeout as e:
+                # The request never reached the server, so it is always safe to retry
+                retry, error = True, e
+                server.fail()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                retry, error = idempotent, e
+                server.fail()
+            except requests.exceptions.RequestException as e:
+                retry, error = False, e
+
+            if not retry or attempt >= self.maxRetries:
+                break
+            attempt += 1
+            if attempt < len(servers):
+                # Fails over to a server not tried yet, without waiting
+                metrics.increment('zerpy_api_failovers_total', endpoint=endpoint)
+                continue
+            if not self.retryBudget.withdraw():
+                break
+            delay = min(self.backoffCap, self.backoffBase * 2 ** (attempt - len(servers)))
+            time.sleep(random.uniform(0, delay))
+            metrics.increment('zerpy_api_retries_total', endpoint=endpoint)
+
+        if error is not None:
+            metrics.increment('zerpy_api_errors_total', endpoint=endpoint)
+            return {'status': 'error', 'message': f'Could not reach {server.url}: {error}'}
+        try:
+            with metrics.span('zerpy_api_decode_seconds', endpoint=endpoint):
+                data = response.json()
+        except ValueError:
+            data = {'message': response.text}
+        if isinstance(data, list):
+            data = {'transactions': data}
+        data['status'] = 'ok' if response.ok else 'error'
+        if not response.ok:
+            metrics.increment('zerpy_api_errors_total', endpoint=endpoint)
+        return data
+
+    def hedgedRequest(self, method: str, path: str, timeout: tuple=None,
+                      endpoint: str=None, **kwargs) -> dict:
+        ''' Sends an idempotent request to the best server and, if it has not
+        answered after hedgeDelay seconds, to the second best too. Returns the
+        first successful response, or the last error
+        '''
+        servers = [server for server in self.getServers() if server.healthy]
+        if self.hedgeDelay is None or len(servers) < 2:
+            return self.request(method, path, timeout, endpoint=endpoint, **kwargs)
+
+        pending = {self.hedgeExecutor.submit(self.request, method, path, timeout,
+                                             endpoint=endpoint, server=servers[0], **kwargs)}
+        done, _ = wait(pending, self.hedgeDelay)
+        if not done:
+            metrics.increment('zerpy_api_hedged_total', endpoint=endpoint)
+            pending.add(self.hedgeExecutor.submit(self.request, method, path, timeout,
+                                                  endpoint=endpoint, server=servers[1], **kwargs))
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            results = [future.result() for future in done]
+            for result in results:
+                if result['status'] == 'ok':
+                    # The slower request is left to finish, updating its server latency
+                    return result
+            if not pending:
+                return results[-1]
+
+    def submit(self, method, *args, **kwargs):
+        ''' Runs a client method in the connection pool and returns its future
+        '''
+        return self.executor.submit(method, *args, **kwargs)
+
+    def map(self, method, *iterables) -> list:
+        ''' Runs a client method concurrently for every set of arguments
+        '''
+        return list(self.executor.map(method, *iterables))
+
+    def cached(self, key: tuple, load) -> dict:
+        if self.cache is None:
+            return load()
+        return self.cache.get(key, load)
+
+    def get_account_info(self, address: str, timeout: tuple=None, fresh: bool=False) -> dict:
+        ''' Returns the account info of an address. A fresh request bypasses
+        the cache, neither reading nor filling it
+        '''
+        def load():
+            return self.hedgedRequest('GET', f'/v3/accounts/{address}/info', timeout,
+                                      endpoint='account_info')
+        if fresh:
+            return load()
+        return self.cached(('account_info', address), load)
+
+    def get_account_transactions(self, address: str, minLedgerVersion: int=None,
+                                 start: str=None, limit: int=None, earliestFirst: bool=False,
+                                 timeout: tuple=None) -> dict:
+        params = {}
+        if minLedgerVersion is not None:
+            params['minLedgerVersion'] = minLedgerVersion
+        if start is not None:
+            params['start'] = start
+        if limit is not None:
+            params['limit'] = limit
+        if earliestFirst:
+            params['earliestFirst'] = 'true'
+
+        def load():
+            return self.hedgedRequest('GET', f'/v3/accounts/{address}/transactions', timeout,
+                                      endpoint='account_transactions', params=params)
+        if start is not None:
+            # Later pages are only read once per sync, so they are not cached
+            return load()
+        return self.cached(('account_transactions', address, minLedgerVersion, limit,
+                            earliestFirst), load)
+
+    def iter_account_transactions(self, address: str, minLedgerVersion: int=0,
+                                  pageSize: int=200, timeout: tuple=None):
+        ''' Yields the transactions of an account from minLedgerVersion on,
+        oldest first, one response per page. Stops after an error response
+        '''
+        start = None
+        while True:
+            page = self.get_account_transactions(address, minLedgerVersion, start, pageSize,
+                                                 earliestFirst=True, timeout=timeout)
+            if page['status'] == 'error':
+                yield page
+                return
+            transactions = page['transactions']
+            complete = len(transactions) < pageSize
+            if start is not None and transactions and transactions[0]['id'] == start:
+                page = dict(page, transactions=transactions[1:])
+            yield page
+            if complete or not page['transactions']:
+                return
+            start = page['transactions'][-1]['id']
+
+    def get_transaction(self, id: str, timeout: tuple=None) -> dict:
+        return self.cached(('transaction', id),
+                           lambda: self.request('GET', f'/v3/transactions/{id}', timeout,
+                                                endpoint='transaction'))
+
+    def submit_payment(self, source_address: str, destination_address: str, amount: str,
+                       api_key: str, source_tag: str='', destination_tag: str='',
+                       sequence: int=None, maxLedgerVersion: int=None,
+                       timeout: tuple=None) -> dict:
+        payment = {'source_address': source_address,
+                   'source_amount': {'value': str(amount), 'currency': 'XRP'},
+                   'destination_address': destination_address,
+                   'destination_amount': {'value': str(amount), 'currency': 'XRP'}}
+        if source_tag:
+            payment['source_tag'] = int(source_tag)
+        if destination_tag:
+            payment['destination_tag'] = int(destination_tag)
+        body = {'payment': payment, 'submit': True}
+        instructions = {}
+        if sequence is not None:
+            instructions['sequence'] = sequence
+        if maxLedgerVersion is not None:
+            instructions['maxLedgerVersion'] = maxLedgerVersion
+        if instructions:
+            body['instructions'] = instructions
+        result = self.request('POST', '/v3/payments', timeout, idempotent=False,
+                              endpoint='payments', json=body,
+                              headers={'Authorization': f'Bearer {api_key}'})
+        engineResult = result.get('engine_result', 'tesSUCCESS')
+        if not (engineResult.startswith('tes') or engineResult == 'terQUEUED'):
+            result['status'] = 'error'
+            result.setdefault('message', result.get('engine_result_message', engineResult))
+        return result
+
+    def get_error_message(self, response: dict) -> str:
+        if 'errors' in response and response['errors']:
+            return '\n'.join(error.get('message', str(error)) for error in response['errors'])
+        return response.get('message', 'Unknown error')
+
+    def close(self):
+        self.stopEvent.set()
+        self.executor.shutdown(wait=False)
+        self.hedgeExecutor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,122 @@
+from BatchPayments import BatchPayment, loadPayments
+import threading
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QBrush, QColor
+from PyQt5.QtWidgets import (QDialog, QFileDialog, QHeaderView, QHBoxLayout, QLabel,
+                             QMessageBox, QPushButton, QTableWidget, QTableWidgetItem,
+                             QVBoxLayout)
+
+stateColors = {'paid': '#c4df9b',
+               'failed': '#f6989d',
+               'error': '#f6989d'}
+
+
+class BatchPaymentDialog(QDialog):
+    ''' Loads a CSV file of payments and sends them from the active account,
+    showing the progress of every payment
+    '''
+    progressSignal = pyqtSignal(dict)
+    finishedSignal = pyqtSignal(str)
+
+    def __init__(self, controller, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.account = controller.activeAccount
+        self.batch = None
+        self.rows = {}
+
+        self.setWindowTitle('Batch payment')
+        self.resize(700, 500)
+
+        self.infoLabel = QLabel(f'From {self.account}')
+        self.infoLabel.setAlignment(Qt.AlignCenter)
+
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(['Line', 'Destination', 'Amount', 'Tag', 'State'])
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        self.openButton = QPushButton('Open CSV...')
+        self.openButton.clicked.connect(self.on_open_clicked)
+        self.sendButton = QPushButton('Send')
+        self.sendButton.setEnabled(False)
+        self.sendButton.clicked.connect(self.on_send_clicked)
+        self.stopButton = QPushButton('Stop')
+        self.stopButton.setEnabled(False)
+        self.stopButton.clicked.connect(self.on_stop_clicked)
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(self.openButton)
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(self.stopButton)
+        buttonLayout.addWidget(self.sendButton)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.infoLabel)
+        layout.addWidget(self.table)
+        layout.addLayout(buttonLayout)
+        self.setLayout(layout)
+
+        self.progressSignal.connect(self.on_progress)
+        self.finishedSignal.connect(self.on_finished)
+
+    def on_open_clicked(self):
+        fileName, _ = QFileDialog.getOpenFileName(self, 'Open payments', '', 'CSV files (*.csv)')
+        if not fileName:
+            return
+        try:
+            payments = loadPayments(fileName)
+        except (ValueError, OSError) as e:
+            QMessageBox.critical(self, 'Batch payment', str(e))
+            return
+
+        self.batch = BatchPayment(self.controller, self.account, payments,
+                                  fileName + '.journal', onProgress=self.progressSignal.emit)
+        self.table.setRowCount(len(payments))
+        for i, payment in enumerate(payments):
+            self.rows[payment['key']] = i
+            for column, text in enumerate([str(payment['line']), payment['destination'],
+                                           payment['amount'], payment['tag'], payment['state']]):
+                self.table.setItem(i, column, QTableWidgetItem(text))
+        total = sum(float(payment['amount']) for payment in payments)
+        self.infoLabel.setText(f'From {self.account}: {len(payments)} payments, {total:.6f} XRP')
+        self.sendButton.setEnabled(bool(payments))
+
+    def on_send_clicked(self):
+        result = QMessageBox.warning(self, 'Batch payment',
+                                     f'{self.infoLabel.text()}\n'
+                                     'Payments already sent in a previous run are skipped.\n'
+                                     'Continue?',
+                                     QMessageBox.Cancel | QMessageBox.Ok)
+        if result != QMessageBox.Ok:
+            return
+        self.openButton.setEnabled(False)
+        self.sendButton.setEnabled(False)
+        self.stopButton.setEnabled(True)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def on_stop_clicked(self):
+        self.stopButton.setEnabled(False)
+        self.batch.stop()
+
+    def run(self):
+        try:
+            payments = self.batch.run()
+        except RuntimeError as e:
+            self.finishedSignal.emit(str(e))
+            return
+        states = [payment['state'] for payment in payments]
+        self.finishedSignal.emit(', '.join(f'{states.count(state)} {state}'
+                                           for state in sorted(set(states))))
+
+    def on_progress(self, payment: dict):
+        item = self.table.item(self.rows[payment['key']], 4)
+        item.setText(f"{payment['state']} {payment['message']}".strip())
+        if payment['state'] in stateColors:
+            item.setForeground(QBrush(QColor(stateColors[payment['state']])))
+
+    def on_finished(self, summary: str):
+        self.stopButton.setEnabled(False)
+        self.openButton.setEnabled(True)
+        QMessageBox.information(self, 'Batch payment', summary)
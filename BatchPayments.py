@@ -0,0 +1,265 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import json
+import os
+import re
+import threading
+import time
+
+addressRegex = re.compile(r'^r[A-HJ-NP-Za-km-z1-9]{24,34}$')
+amountRegex = re.compile(r'^[0-9]+\.?[0-9]{0,6}$')
+tagRegex = re.compile(r'^\d*$')
+
+# Submission results that do not consume the sequence number, so the
+# payments with later sequences cannot be applied until it is reused
+notAppliedPrefixes = ('tem', 'tel', 'tef')
+
+
+def loadPayments(fileName: str) -> list:
+    ''' Loads a CSV file with destination, amount and optional destination tag
+    columns. A header row is allowed. Raises ValueError on invalid rows
+    '''
+    payments = []
+    occurrences = {}
+    with open(fileName, newline='') as infile:
+        for lineNumber, row in enumerate(csv.reader(infile), 1):
+            row = [field.strip() for field in row]
+            if not row or not any(row):
+                continue
+            if lineNumber == 1 and len(row) > 1 and not amountRegex.match(row[1]):
+                continue  # Header
+            destination, amount = row[0], row[1] if len(row) > 1 else ''
+            tag = row[2] if len(row) > 2 else ''
+            if not addressRegex.match(destination) or not amountRegex.match(amount) \
+               or not tagRegex.match(tag):
+                raise ValueError(f'Invalid payment in line {lineNumber} of "{fileName}": {",".join(row)}')
+            # Identical payments are told apart by their occurrence, so the key
+            # survives reordering the file between runs
+            occurrence = occurrences.get((destination, amount, tag), 0)
+            occurrences[(destination, amount, tag)] = occurrence + 1
+            payments.append({'key': f'{destination}:{amount}:{tag}:{occurrence}',
+                             'line': lineNumber,
+                             'destination': destination,
+                             'amount': amount,
+                             'tag': tag,
+                             'state': 'pending',
+                             'sequence': None,
+                             'maxLedger': None,
+                             'message': ''})
+    return payments
+
+
+class BatchPayment:
+    ''' Submits a list of payments from one account through a pipeline of
+    concurrent submissions, assigning sequence numbers locally.
+
+    Every submission carries a maxLedgerVersion, and every state change is
+    appended to a journal before it takes effect, so an interrupted batch can
+    be resumed: a payment whose outcome is unknown keeps its sequence number
+    until the ledger shows whether it was applied, or the sequence is known to
+    be used by another transaction, or a validated ledger is past its
+    maxLedgerVersion. As a sequence number can only be consumed once, a
+    payment is never applied twice.
+
+    Payment states are pending, submitting, submitted, paid, failed and error
+    '''
+    ledgerOffset = 20  # Ledgers a submission may take to be applied, about a minute
+    ledgerRefresh = 10  # Seconds between reads of the validated ledger
+    confirmTimeout = 60
+
+    def __init__(self, controller, account: str, payments: list, journalFileName: str,
+                 window: int=8, onProgress=None):
+        self.controller = controller
+        self.account = account
+        self.payments = payments
+        self.journalFileName = journalFileName
+        self.window = window
+        self.onProgress = onProgress
+        self.apiKey = controller.config.data['accounts'][account]['apiKey']
+        self.journalLock = threading.Lock()
+        self.ledgerLock = threading.Lock()
+        self.ledger = None
+        self.ledgerTime = float('-inf')
+        self.stopEvent = threading.Event()
+
+    def readJournal(self) -> dict:
+        entries = {}
+        if os.path.isfile(self.journalFileName):
+            with open(self.journalFileName) as infile:
+                for line in infile:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Line truncated by an interruption
+                    entries[entry['key']] = entry
+        return entries
+
+    def setState(self, payment: dict, state: str, message: str=''):
+        payment['state'] = state
+        payment['message'] = message
+        payment['time'] = time.time()
+        with self.journalLock:
+            with open(self.journalFileName, 'a') as outfile:
+                outfile.write(json.dumps({key: payment[key] for key in
+                                          ('key', 'sequence', 'maxLedger', 'state', 'message',
+                                           'time')}) + '\n')
+                outfile.flush()
+                os.fsync(outfile.fileno())
+        if self.onProgress is not None:
+            self.onProgress(payment)
+
+    def stop(self):
+        ''' Stops submitting new payments. Payments already sent are confirmed
+        '''
+        self.stopEvent.set()
+
+    def getAccountState(self) -> tuple:
+        ''' Returns the next sequence number of the account and the validated
+        ledger it was read from
+        '''
+        self.controller.invalidateAccount(self.account)
+        info = self.controller.api.get_account_info(self.account)
+        if info['status'] == 'error':
+            raise RuntimeError(self.controller.api.get_error_message(info))
+        if 'ledger_index' not in info:
+            raise RuntimeError('The server did not report the validated ledger of the account')
+        return info['account_data']['Sequence'], info['ledger_index']
+
+    def getMaxLedger(self) -> int:
+        ''' Returns the last ledger a payment submitted now may be applied in
+        '''
+        with self.ledgerLock:
+            if time.monotonic() - self.ledgerTime > self.ledgerRefresh:
+                self.ledger = self.getAccountState()[1]
+                self.ledgerTime = time.monotonic()
+            return self.ledger + self.ledgerOffset
+
+    def sync(self):
+        self.controller.invalidateAccount(self.account)
+        result = self.controller.syncStore(self.account)
+        if result['status'] == 'error':
+            raise RuntimeError(self.controller.api.get_error_message(result))
+
+    def checkLedger(self, payment: dict) -> bool:
+        ''' Updates a payment from the ledger. Returns whether it was found
+        '''
+        tx = self.controller.store.getBySequence(self.account, payment['sequence'])
+        if tx is None:
+            return False
+        if tx['specification']['destination']['address'] != payment['destination']:
+            return False
+        if tx['outcome']['result'] == 'tesSUCCESS':
+            self.setState(payment, 'paid', tx['id'])
+        else:
+            self.setState(payment, 'failed', tx['outcome']['result'])
+        return True
+
+    def recover(self, nextSequence: int, ledger: int):
+        ''' Restores the journaled state of the payments and resolves the ones
+        whose outcome was unknown when the batch was interrupted, given the
+        account state read before the last sync
+        '''
+        journal = self.readJournal()
+        for payment in self.payments:
+            entry = journal.get(payment['key'])
+            if entry is None:
+                continue
+            payment.update(entry)
+            if payment['state'] in ('submitting', 'submitted'):
+                if self.checkLedger(payment):
+                    continue
+                if payment['sequence'] < nextSequence or \
+                   (payment['maxLedger'] is not None and ledger > payment['maxLedger']):
+                    # Its sequence was used by another transaction, or it can
+                    # no longer be applied. Otherwise it is sent again with the
+                    # same sequence
+                    payment['sequence'] = None
+                    payment['maxLedger'] = None
+                    payment['state'] = 'pending'
+            elif payment['state'] == 'error':
+                payment['sequence'] = None
+                payment['maxLedger'] = None
+                payment['state'] = 'pending'
+            if self.onProgress is not None:
+                self.onProgress(payment)
+
+    def assignSequences(self, nextSequence: int) -> list:
+        ''' Gives the pending payments the lowest free sequence numbers and
+        returns the payments to submit, in sequence order
+        '''
+        reserved = {payment['sequence'] for payment in self.payments
+                    if payment['state'] in ('submitting', 'submitted')}
+        sequence = nextSequence
+        for payment in self.payments:
+            if payment['state'] == 'pending':
+                while sequence in reserved:
+                    sequence += 1
+                payment['sequence'] = sequence
+                sequence += 1
+        toSubmit = [payment for payment in self.payments
+                    if payment['state'] in ('pending', 'submitting', 'submitted')]
+        return sorted(toSubmit, key=lambda payment: payment['sequence'])
+
+    def submit(self, payment: dict):
+        if self.stopEvent.is_set():
+            return
+        # A payment sent before may still be applied with that submission
+        resent = payment['state'] in ('submitting', 'submitted')
+        try:
+            payment['maxLedger'] = max(payment['maxLedger'] or 0, self.getMaxLedger())
+        except RuntimeError as e:
+            self.setState(payment, payment['state'], str(e))
+            self.stopEvent.set()
+            return
+        self.setState(payment, 'submitting')
+        response = self.controller.api.submit_payment(source_address=self.account,
+                                                      destination_address=payment['destination'],
+                                                      amount=payment['amount'],
+                                                      api_key=self.apiKey,
+                                                      destination_tag=payment['tag'],
+                                                      sequence=payment['sequence'],
+                                                      maxLedgerVersion=payment['maxLedger'])
+        engineResult = response.get('engine_result', '')
+        if response['status'] == 'error' and engineResult.startswith(notAppliedPrefixes) \
+           and engineResult != 'tefPAST_SEQ':
+            self.setState(payment, 'submitting' if resent else 'error',
+                          self.controller.api.get_error_message(response))
+            # The later sequences are stuck behind this one, stop and let a resume reassign them
+            self.stopEvent.set()
+        elif response['status'] == 'error' and not engineResult:
+            # The request may or may not have reached the server
+            self.setState(payment, 'submitting', self.controller.api.get_error_message(response))
+        else:
+            self.setState(payment, 'submitted', engineResult)
+
+    def confirm(self):
+        ''' Waits until the submitted payments show up in validated ledgers
+        '''
+        deadline = time.time() + self.confirmTimeout
+        while True:
+            self.sync()
+            waiting = [payment for payment in self.payments
+                       if payment['state'] in ('submitting', 'submitted')
+                       and not self.checkLedger(payment)]
+            if not waiting or time.time() > deadline:
+                return
+            time.sleep(4)
+
+    def run(self) -> list:
+        ''' Runs or resumes the batch and returns the payments with their final
+        states. Payments left as submitting or submitted are unconfirmed and
+        are resolved by running the batch again
+        '''
+        # Read before the sync, so every payment applied with a lower sequence
+        # is in the store after it
+        nextSequence, ledger = self.getAccountState()
+        self.sync()
+        self.recover(nextSequence, ledger)
+        with self.ledgerLock:
+            self.ledger, self.ledgerTime = ledger, time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.window) as executor:
+            # map keeps at most a window of submissions in flight at a time
+            list(executor.map(self.submit, self.assignSequences(nextSequence)))
+        self.confirm()
+        return self.payments
+
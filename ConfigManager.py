@@ -1,8 +1,23 @@
 import json
 import os
 import re
-import sys
-from MessageBox import showMessageBox
+
+addressRegex = re.compile(r'^r[A-HJ-NP-Za-km-z1-9]{24,34}$')
+prefix = 'module.exports = '
+
+
+def isURLs(value, scheme: str) -> bool:
+    ''' Returns whether value is a URL, or a non-empty list of URLs, matching
+    the scheme regex
+    '''
+    urls = [value] if isinstance(value, str) else value
+    return isinstance(urls, list) and len(urls) > 0 and \
+        all(isinstance(url, str) and re.match(scheme, url) for url in urls)
+
+
+class ConfigError(Exception):
+    ''' Raised when the configuration file cannot be loaded
+    '''
 
 
 class ConfigManager:
@@ -10,52 +25,108 @@ class ConfigManager:
     '''
     def __init__(self, accounts: dict={},
                  server: str='wss://s.altnet.rippletest.net:51233',
-                 fileName: str='.secret_config.js'):
+                 fileName: str='.secret_config.js', workers: int=4,
+                 subscribe: bool=False, api: str='http://localhost:3000',
+                 metricsPort: int=None, hedgeDelay: float=None, refreshRate: float=None,
+                 worker: bool=False):
         self.accounts = accounts
         self.server = server
+        self.api = api
         self.fileName = fileName
+        self.workers = workers
+        self.subscribe = subscribe
+        self.metricsPort = metricsPort
+        self.hedgeDelay = hedgeDelay
+        self.refreshRate = refreshRate
+        self.worker = worker
 
     @classmethod
     def fromFile(cls, fileName: str='.secret_config.js') -> 'ConfigManager':
+        ''' Loads and validates a configuration file. Raises ConfigError
+        '''
         if not os.path.isfile(fileName):
             message = f'Configuration file "{fileName}" is not a file.'
-            showMessageBox('Error', message, 'critical')
-            sys.exit('Error: ' + message)
+            raise ConfigError(message)
 
         with open(fileName, 'r') as infile:
-            data = infile.read() \
-                         .replace('\n', '')
+            data = infile.read().strip()
 
-            if re.match(re.compile("^module.exports = {.*}$"), data) is None:
+            if not data.startswith(prefix + '{') or not data.endswith('}'):
                 message = 'Configuration file must have the format: module.exports = {...}.'
-                showMessageBox('Error', message, 'critical')
-                sys.exit('Error: ' + message)
+                raise ConfigError(message)
 
-            data = data.replace('module.exports = ', '')
+            data = data[len(prefix):]
             data = re.sub(r',(\s*)}', r'\1}', data)  # Remove unnecesary commas that invalidate json files
             try:
                 data = json.loads(data)
             except json.JSONDecodeError:
                 message = f'Configuration file "{fileName}" is not a valid json file.'
-                showMessageBox('Error', message, 'critical')
-                sys.exit('Error: ' + message)
+                raise ConfigError(message)
             if 'server' not in data or 'accounts' not in data:
                 message = f'Configuration file "{fileName}" must contain "server" and "accounts" entries.'
-                showMessageBox('Error', message, 'critical')
-                sys.exit('Error: ' + message)
-            for i in data['accounts']:
-                if 'apiKey' not in data['accounts'][i] or \
-                'secret' not in data['accounts'][i]:
+                raise ConfigError(message)
+            if not isURLs(data['server'], r'^wss?://'):
+                message = f'"server" entry in configuration file "{fileName}" must be a WebSocket URL or a list of them.'
+                raise ConfigError(message)
+            if not isinstance(data['accounts'], dict) or not data['accounts']:
+                message = f'"accounts" entry in configuration file "{fileName}" must contain at least one account.'
+                raise ConfigError(message)
+            # A single pass over the accounts, so configurations with thousands load fast
+            for address, account in data['accounts'].items():
+                if 'apiKey' not in account or 'secret' not in account:
                     message = f'All accounts in configuration file "{fileName}" must contain "apiKey" and "secret" entries'
-                    showMessageBox('Error', message, 'critical')
-                    sys.exit('Error: ' + message)
-            return cls(data['accounts'], data['server'], fileName)
+                    raise ConfigError(message)
+                if not addressRegex.match(address):
+                    message = f'"{address}" in configuration file "{fileName}" is not a valid account address.'
+                    raise ConfigError(message)
+            workers = data.get('workers', 4)
+            if not isinstance(workers, int) or workers < 1:
+                message = f'"workers" entry in configuration file "{fileName}" must be a positive integer.'
+                raise ConfigError(message)
+            subscribe = data.get('subscribe', False)
+            if not isinstance(subscribe, bool):
+                message = f'"subscribe" entry in configuration file "{fileName}" must be true or false.'
+                raise ConfigError(message)
+            api = data.get('api', 'http://localhost:3000')
+            if not isURLs(api, r'^https?://'):
+                message = f'"api" entry in configuration file "{fileName}" must be an http(s) URL or a list of them.'
+                raise ConfigError(message)
+            metricsPort = data.get('metricsPort')
+            if metricsPort is not None and (not isinstance(metricsPort, int) or
+                                            not 0 < metricsPort < 65536):
+                message = f'"metricsPort" entry in configuration file "{fileName}" must be a port number.'
+                raise ConfigError(message)
+            hedgeDelay = data.get('hedgeDelay')
+            if hedgeDelay is not None and (isinstance(hedgeDelay, bool) or
+                                           not isinstance(hedgeDelay, (int, float)) or
+                                           hedgeDelay <= 0):
+                message = f'"hedgeDelay" entry in configuration file "{fileName}" must be a positive number of seconds.'
+                raise ConfigError(message)
+            refreshRate = data.get('refreshRate')
+            if refreshRate is not None and (isinstance(refreshRate, bool) or
+                                            not isinstance(refreshRate, (int, float)) or
+                                            refreshRate <= 0):
+                message = f'"refreshRate" entry in configuration file "{fileName}" must be a positive number of refreshes per second.'
+                raise ConfigError(message)
+            worker = data.get('worker', False)
+            if not isinstance(worker, bool):
+                message = f'"worker" entry in configuration file "{fileName}" must be true or false.'
+                raise ConfigError(message)
+            return cls(data['accounts'], data['server'], fileName, workers, subscribe, api,
+                       metricsPort, hedgeDelay, refreshRate, worker)
 
 
     def get_data(self):
         return {'server': self.server,
                 'accounts': self.accounts,
-                'fileName': self.fileName}
+                'fileName': self.fileName,
+                'workers': self.workers,
+                'subscribe': self.subscribe,
+                'api': self.api,
+                'metricsPort': self.metricsPort,
+                'hedgeDelay': self.hedgeDelay,
+                'refreshRate': self.refreshRate,
+                'worker': self.worker}
 
     data = property(get_data)
 
@@ -65,7 +136,10 @@ class ConfigManager:
             outfile.write('module.exports = ' + json.dumps(self.data, indent=4))
 
     def __str__(self):
-        data = {'server': self.server, 'accounts': self.accounts}
+        data = {'server': self.server, 'accounts': self.accounts,
+                'workers': self.workers, 'subscribe': self.subscribe, 'api': self.api,
+                'metricsPort': self.metricsPort, 'hedgeDelay': self.hedgeDelay,
+                'refreshRate': self.refreshRate, 'worker': self.worker}
         return f'<{self.fileName}>\nmodule.exports = ' + json.dumps(data, indent=4)
 
     def __repr__(self):
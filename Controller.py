@@ -1,34 +1,316 @@
-from xrpApiWrapper import XRPAPI
+from ApiClient import ApiClient
+from Metrics import metrics
+from ResponseCache import ResponseCache
+from TransactionHistory import TransactionHistory, parseQuery
+from TransactionStore import TransactionStore
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
 import webbrowser
-from datetime import datetime
-from dateutil import tz
-from MessageBox import showMessageBox
-import sys
 
 
 class Controller:
     ''' Controller contains all functions that retrieve info from the XRPL,
     configuration info and keeps track of the active account in the UI
     '''
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, store: TransactionStore=None):
         self.config = config
-        self.activeAccount = list(self.config.data['accounts'].keys())[0]
-        self.api = XRPAPI()
-        if self.api.error:
-            showMessageBox('Error', self.api.errorMessage, 'critical')
-            sys.exit('Error: ' + self.api.errorMessage)
-        self.update()
-
-    def setActiveAccount(self, account: str):
+        self.activeAccount = next(iter(self.config.accounts))
+        if store is None:
+            configDir = os.path.dirname(os.path.abspath(self.config.fileName))
+            store = TransactionStore(os.path.join(configDir, '.zerpy_store.db'))
+        self.store = store
+        self.snapshots = {}
+        self.snapshotsLock = threading.Lock()
+        self.histories = {}
+        self.query = {}
+        self.view = None
+        self.analytics = {}
+        self.formatCache = OrderedDict()
+        self.formatCacheSize = 100000
+        self.prefetching = set()
+        self.maxPrefetch = 8
+        # Apart from the API pool, so prefetches never delay the requests the
+        # user waits for
+        self.prefetchExecutor = ThreadPoolExecutor(max_workers=2)
+        self.validationTimeout = 60
+        self.validationPoll = 4
+        self.validationExecutor = ThreadPoolExecutor(max_workers=4)
+        self.validationStopped = threading.Event()
+        self.subscriber = None
+        self.refresher = None
+        self.worker = None
+        self.cache = ResponseCache()
+        self.api = ApiClient(self.config.api, poolSize=2 * self.config.workers,
+                             hedgeDelay=self.config.hedgeDelay, cache=self.cache)
+        self.account_info = {'status': 'error', 'message': 'Not fetched yet'}
+        self.transactions = {'status': 'error', 'message': 'Not fetched yet'}
+        # Error of the last refresh of the active account, whose data is then
+        # the one fetched at fetchTime, as a Unix time, or None if unknown
+        self.fetchError = None
+        self.fetchTime = None
+
+    def getSnapshot(self, account: str) -> dict:
+        ''' Returns the last snapshot of an account, from memory or, after a
+        restart, from the local store. Returns None if there is none
+        '''
+        with self.snapshotsLock:
+            snapshot = self.snapshots.get(account)
+        if snapshot is not None:
+            return snapshot
+        info = self.store.getAccountInfo(account)
+        if info is None:
+            return None
+        snapshot = {'account_info': info,
+                    'transactions': {'status': 'ok',
+                                     'transactions': self.loadHistory(account)},
+                    'time': float('-inf'),
+                    'error': None}
+        with self.snapshotsLock:
+            return self.snapshots.setdefault(account, snapshot)
+
+    def setActiveAccount(self, account: str, load: bool=True) -> bool:
+        ''' Sets the active account and loads its last snapshot, if any.
+        Returns whether a snapshot was available.
+
+        With load False, a snapshot that is not in memory is not loaded from
+        the store, as its history can take seconds to read: only the stored
+        account info is set, if any, and the transactions are left
+        unavailable until a later call
+        '''
         self.activeAccount = account
+        if self.refresher is not None:
+            self.refresher.setActive(account)
+        if load:
+            snapshot = self.getSnapshot(account)
+        else:
+            with self.snapshotsLock:
+                snapshot = self.snapshots.get(account)
+        if snapshot is not None:
+            self.account_info = snapshot['account_info']
+            self.transactions = snapshot['transactions']
+            self.fetchError = snapshot['error']
+            self.fetchTime = None
+            if snapshot['time'] > float('-inf'):
+                self.fetchTime = time.time() - (time.monotonic() - snapshot['time'])
+        elif not load:
+            info = self.store.getAccountInfo(account)
+            self.account_info = info or {'status': 'error', 'message': 'Not fetched yet'}
+            self.transactions = {'status': 'error', 'message': 'Loading the stored transactions'}
+            self.fetchError, self.fetchTime = None, None
+        return snapshot is not None
+
+    def fetchAccount(self, account: str) -> dict:
+        ''' Retrieves the account info and transactions of an account and keeps
+        them as the account snapshot, unless a fetch started later already
+        stored a newer one. Safe to call from any thread, as it does not touch
+        the active account data.
+
+        A failed fetch keeps the data of the last snapshot and records the
+        error message in its 'error' entry. The snapshot returned is the one
+        fetched, with the error responses
+        '''
+        started = time.monotonic()
+        with metrics.span('zerpy_fetch_account_seconds'):
+            if self.worker is not None:
+                accountInfo, transactions = self.fetchInWorker(account)
+            else:
+                accountInfo = self.api.submit(self.api.get_account_info, account)
+                transactions = self.syncTransactions(account)
+                accountInfo = accountInfo.result()
+            failed = [response for response in (accountInfo, transactions)
+                      if response['status'] == 'error']
+            snapshot = {'transactions': transactions,
+                        'account_info': accountInfo,
+                        'time': started,
+                        'error': self.api.get_error_message(failed[0]) if failed else None}
+        if snapshot['account_info']['status'] == 'ok':
+            self.store.setAccountInfo(account, snapshot['account_info'])
+        with self.snapshotsLock:
+            current = self.snapshots.get(account)
+            if current is None or current['time'] <= started:
+                if failed and current is not None:
+                    self.snapshots[account] = dict(current, error=snapshot['error'])
+                else:
+                    self.snapshots[account] = snapshot
+        return snapshot
+
+    def fetchInWorker(self, account: str) -> tuple:
+        ''' Syncs an account in the worker process and returns its account
+        info and transactions. The first history of an account is built by
+        the worker and only the new rows are read here afterwards
+        '''
+        with self.snapshotsLock:
+            loaded = account in self.histories
+        accountInfo, transactions, state = self.worker.fetch(account, withHistory=not loaded)
+        if transactions['status'] == 'error':
+            return accountInfo, transactions
+        if state is not None:
+            history = TransactionHistory.fromState(self.store, account, 'tesSUCCESS', state)
+            with self.snapshotsLock:
+                current = self.histories.get(account)
+                if current is None or len(current) <= len(history):
+                    self.histories[account] = history
+        return accountInfo, {'status': 'ok', 'transactions': self.loadHistory(account)}
+
+    def startWorker(self):
+        ''' Moves account fetches to a worker process, see SyncWorker
+        '''
+        from SyncWorker import SyncWorker
+        self.worker = SyncWorker(self.config, self.store.fileName)
+
+    def stopWorker(self):
+        if self.worker is not None:
+            self.worker.close()
+            self.worker = None
 
     def update(self):
-        self.account_info = self.api.get_account_info(self.activeAccount)
-        self.transactions = self.api.get_account_transactions(self.activeAccount)
+        account = self.activeAccount
+        self.fetchAccount(account)
+        if account == self.activeAccount:
+            self.setActiveAccount(account)
+
+    def updateAll(self, accounts: list=None):
+        ''' Refreshes the snapshots of the given accounts, all configured ones
+        by default, in parallel using up to config.workers concurrent fetches.
+        Call setActiveAccount afterwards to load the refreshed snapshot of the
+        active account
+        '''
+        if accounts is None:
+            accounts = list(self.config.accounts)
+        with ThreadPoolExecutor(max_workers=self.config.workers) as executor:
+            list(executor.map(self.fetchAccount, accounts))
+
+    def subscribe(self, onUpdate):
+        ''' Listens to the account streams of all configured accounts on the
+        configured server. onUpdate(account) is called from a background
+        thread after each pushed change has been applied to the snapshots;
+        the active account data is left to the caller to reload.
+
+        Pushed changes are applied on the listener thread, in order. The
+        resync after a reconnection runs in the API pool, so it does not hold
+        up the messages that arrive meanwhile
+        '''
+        from AccountSubscriber import AccountSubscriber  # Not needed by headless use
+
+        def onTransaction(account, transaction, balance):
+            self.applyStreamTransaction(account, transaction, balance)
+            onUpdate(account)
+
+        def resync():
+            self.cache.clear()
+            self.updateAll()
+            onUpdate(self.activeAccount)
+
+        def onReconnect():
+            self.api.submit(resync)
+
+        self.subscriber = AccountSubscriber(self.config.server,
+                                            self.config.accounts.keys(),
+                                            onTransaction, onReconnect)
+        self.subscriber.start()
+
+    def unsubscribe(self):
+        if self.subscriber is not None:
+            self.subscriber.stop()
+            self.subscriber = None
+
+    def autoRefresh(self, onUpdate, onStale=None, rate: float=0.5):
+        ''' Keeps the snapshots of all configured accounts fresh in the
+        background with at most rate account refreshes per second, see
+        RefreshScheduler. onUpdate(account) and onStale(account) are called
+        from background threads; the active account data is left to the
+        caller to reload
+        '''
+        from RefreshScheduler import RefreshScheduler
+        self.refresher = RefreshScheduler(self, rate, onRefresh=onUpdate, onStale=onStale)
+        self.refresher.start()
+
+    def stopAutoRefresh(self):
+        if self.refresher is not None:
+            self.refresher.stop()
+            self.refresher = None
+
+    def applyStreamTransaction(self, account: str, transaction: dict, balance: str):
+        ''' Applies a pushed transaction and balance to the store and to the
+        account snapshot without refetching the account
+        '''
+        history = None
+        self.invalidateAccount(account)
+        if transaction is not None:
+            self.store.add(account, [transaction])
+            history = self.loadHistory(account)
+        with self.snapshotsLock:
+            snapshot = self.snapshots.get(account)
+            if snapshot is None:
+                return
+            snapshot = dict(snapshot, time=time.monotonic())
+            info = snapshot['account_info']
+            if balance is not None and info['status'] != 'error':
+                snapshot['account_info'] = dict(info, account_data=dict(info['account_data'],
+                                                                       Balance=balance))
+            if history is not None and snapshot['transactions']['status'] != 'error':
+                snapshot['transactions'] = {'status': 'ok', 'transactions': history}
+            self.snapshots[account] = snapshot
 
-    def sendPayment(self, amount: float, destination_account: str, destination_tag: str) -> dict:
-        api_key = self.config.data['accounts'][self.activeAccount]['apiKey']
-        payment = self.api.submit_payment(source_address=self.activeAccount,
+    def syncTransactions(self, account: str) -> dict:
+        ''' Pages the transactions from the last synced ledger on into the local
+        store and returns the stored history of successful transactions
+        '''
+        result = self.syncStore(account)
+        if result['status'] == 'error':
+            return result
+        return {'status': 'ok', 'transactions': self.loadHistory(account)}
+
+    def syncStore(self, account: str) -> dict:
+        ''' Pages the transactions from the last synced ledger on into the local
+        store. Returns the error response, if any, or an ok status
+        '''
+        syncedLedger = self.store.getSyncedLedger(account)
+        for page in self.api.iter_account_transactions(account, minLedgerVersion=syncedLedger):
+            if page['status'] == 'error':
+                return page
+            if page['transactions']:
+                metrics.increment('zerpy_store_rows_added_total',
+                                  self.store.add(account, page['transactions']))
+                self.store.setSyncedLedger(account, page['transactions'][-1]['outcome']['ledgerVersion'])
+        return {'status': 'ok'}
+
+    def loadHistory(self, account: str) -> TransactionHistory:
+        ''' Returns the history of successful transactions of an account,
+        reading from the store only what was added since the last call
+        '''
+        with self.snapshotsLock:
+            history = self.histories.get(account)
+        if history is None:
+            history = TransactionHistory(self.store, account, 'tesSUCCESS')
+        else:
+            history = history.refresh()
+        with self.snapshotsLock:
+            current = self.histories.get(account)
+            if current is None or len(current) <= len(history):
+                self.histories[account] = history
+        return history
+
+    def invalidateAccount(self, account: str):
+        ''' Drops the cached responses of an account, so its next reads
+        request the data of the last validated ledger
+        '''
+        self.cache.invalidate(account)
+
+    def sendPayment(self, amount: float, destination_account: str, destination_tag: str,
+                    onValidated=None, watch: bool=True) -> dict:
+        ''' Submits a payment from the active account. Once it is in a
+        validated ledger, the cached data of both accounts is dropped and
+        onValidated() is called from a background thread, see awaitValidation.
+        With watch false, as for a one-off command that exits right away, the
+        validation is not awaited
+        '''
+        source = self.activeAccount
+        api_key = self.config.data['accounts'][source]['apiKey']
+        payment = self.api.submit_payment(source_address=source,
                                           destination_address=destination_account,
                                           source_tag='',
                                           destination_tag=destination_tag,
@@ -37,45 +319,186 @@ class Controller:
         if payment['status'] == 'error':
             result['status'] = 'error'
             result['message'] = self.api.get_error_message(payment)
+        elif watch:
+            sequence = payment.get('tx_json', {}).get('Sequence')
+            self.validationExecutor.submit(self.awaitValidation, source, destination_account,
+                                           sequence, onValidated)
         return result
 
+    def awaitValidation(self, source: str, destination: str, sequence: int,
+                        onValidated=None) -> bool:
+        ''' Waits up to validationTimeout seconds until the validated account
+        info of source shows that its transaction with a sequence number was
+        applied, then invalidates both accounts. Invalidating earlier would
+        only let the unchanged data be requested and cached again. Returns
+        whether the transaction was validated. Gives up, returning False,
+        after stopValidation
+        '''
+        deadline = time.monotonic() + self.validationTimeout
+        while True:
+            # Past the cache, which would return the data from before it
+            info = self.api.get_account_info(source, fresh=True)
+            if info['status'] == 'ok' and (sequence is None or
+                                           info['account_data']['Sequence'] > sequence):
+                break
+            if time.monotonic() > deadline or self.validationStopped.wait(self.validationPoll):
+                return False
+        self.invalidateAccount(source)
+        self.invalidateAccount(destination)
+        if onValidated is not None:
+            onValidated()
+        return True
+
+    def stopValidation(self):
+        ''' Stops awaiting the validation of the payments sent, so the process
+        can exit without waiting for them
+        '''
+        self.validationStopped.set()
+        self.validationExecutor.shutdown(wait=False, cancel_futures=True)
+
     def getBalance(self):
+        if self.account_info['status'] == 'error':
+            return '-'
         balance = float(self.account_info['account_data']['Balance'])
         return f'{balance / 1e6:.6f}'
 
+    def setFilter(self, text: str):
+        ''' Restricts the transactions shown to the ones matching a filter,
+        see TransactionHistory.parseQuery. An empty filter shows them all
+        '''
+        self.query = parseQuery(text)
+        self.view = None
+
+    def getHistory(self) -> TransactionHistory:
+        ''' Returns the active account transactions that match the filter, or
+        None while they are unavailable
+        '''
+        if self.transactions['status'] == 'error':
+            return None
+        history = self.transactions['transactions']
+        if not self.query:
+            return history
+        if self.view is None or self.view.history is not history:
+            with metrics.span('zerpy_search_seconds'):
+                self.view = history.search(**self.query)
+        return self.view
+
+    def getAnalytics(self):
+        ''' Returns the AccountAnalytics of the active account, brought up to
+        date with its history, or None while the account data is unavailable
+        '''
+        from Analytics import AccountAnalytics  # NumPy is only needed here
+        if self.account_info['status'] == 'error' or self.transactions['status'] == 'error':
+            return None
+        history = self.transactions['transactions']
+        balance = int(self.account_info['account_data']['Balance'])
+        analytics = self.analytics.get(self.activeAccount)
+        with metrics.span('zerpy_analytics_seconds'):
+            if analytics is None:
+                analytics = self.analytics[self.activeAccount] = AccountAnalytics(history, balance)
+            else:
+                analytics.update(history, balance)
+        return analytics
+
+    def getTransactionCount(self) -> int:
+        if self.transactions['status'] == 'error':
+            return 0
+        return len(self.getHistory())
+
+    def getTotalTransactionCount(self) -> int:
+        if self.transactions['status'] == 'error':
+            return 0
+        return len(self.transactions['transactions'])
+
+    def formatTransaction(self, history: TransactionHistory, i: int) -> str:
+        ''' Returns the display row of a transaction of a history. Rows are
+        memoized by account and transaction id, as validated transactions never
+        change
+        '''
+        key = (history.account, history.getKey(i))
+        row = self.formatCache.get(key)
+        if row is not None:
+            self.formatCache.move_to_end(key)
+            metrics.increment('zerpy_format_cache_hits_total')
+            return row
+        metrics.increment('zerpy_rows_formatted_total')
+
+        j = history.getPosition(i)
+        amount = history.drops[j] / 1e6
+        address = history.addresses[history.counterparties[j]]
+        timeStampStr = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(history.times[j]))
+        if amount < 0:
+            icon = '\N{Wide-Headed Upwards Heavy Barb Arrow}'
+        else:
+            icon = '\N{Wide-Headed Downwards Heavy Barb Arrow}'
+
+        row = f'{icon} {amount: >+16.6f} XRP      {address}      {timeStampStr}'
+        self.formatCache[key] = row
+        if len(self.formatCache) > self.formatCacheSize:
+            self.formatCache.popitem(last=False)
+        return row
+
+    def getTransactionRecord(self, history: TransactionHistory, i: int) -> dict:
+        ''' Returns the fields of a transaction of a history shown by Zerpy, as
+        seen from the account of the history
+        '''
+        j = history.getPosition(i)
+        return {'id': history.getId(i),
+                'ledger': history.ledgers[j],
+                'time': history.times[j],
+                'amount': f'{history.drops[j] / 1e6:.6f}',
+                'counterparty': history.addresses[history.counterparties[j]],
+                'result': history.result}
+
+    def getFormattedTransaction(self, i: int) -> str:
+        return self.formatTransaction(self.getHistory(), i)
+
     def getFormattedTransactions(self):
-        data = []
-        for tx in self.transactions['transactions']:
-            if tx['outcome']['result'] == 'tesSUCCESS':
-                amount = float(tx['outcome']['deliveredAmount']['value'])
-                UTCtimeStamp = datetime.strptime(tx['outcome']['timestamp'],
-                                                 '%Y-%m-%dT%H:%M:%S.000Z')
-                UTCtimeStamp = UTCtimeStamp.replace(tzinfo=tz.tzutc())
-                localTimeStamp = UTCtimeStamp.astimezone(tz.tzlocal())
-                timeStampStr = localTimeStamp.strftime('%Y-%m-%d %H:%M:%S')
-                if tx['specification']['source']['address'] == self.activeAccount:
-                    icon = '\N{Wide-Headed Upwards Heavy Barb Arrow}'
-                    address = tx['specification']['destination']['address']
-                    amount = -amount
-                else:
-                    icon = '\N{Wide-Headed Downwards Heavy Barb Arrow}'
-                    address = tx['specification']['source']['address']
+        if self.transactions['status'] == 'error':
+            return []
+        history = self.getHistory()
+        return [self.formatTransaction(history, i) for i in range(len(history))]
 
-                data.append(f'{icon} {amount: >+16.6f} XRP      {address}      {timeStampStr}')
+    def getTransactionDetails(self, account: str, id: str) -> dict:
+        ''' Returns the full data of a transaction of an account from the API,
+        cached by id. When the API cannot be reached, returns the stored copy
+        with an added 'message'
+        '''
+        details = self.api.get_transaction(id)
+        if details['status'] == 'error':
+            stored = self.store.get(account, id)
+            if stored is not None:
+                return dict(stored, status='ok', message=f'Stored copy, the server could not be '
+                                                         f'reached: {self.api.get_error_message(details)}')
+        return details
 
-        return data
+    def getCachedTransactionDetails(self, id: str) -> dict:
+        ''' Returns the cached full data of a transaction, or None
+        '''
+        return self.cache.peek(('transaction', id))
+
+    def prefetchTransactionDetails(self, ids: list):
+        ''' Fetches the full data of transactions into the cache in the
+        background, with at most maxPrefetch fetches queued or in flight.
+        They run two at a time in their own threads, leaving the API pool free
+        '''
+        for id in ids:
+            if len(self.prefetching) >= self.maxPrefetch:
+                return
+            if id in self.prefetching or self.cache.contains(('transaction', id)):
+                continue
+            self.prefetching.add(id)
+            metrics.increment('zerpy_detail_prefetches_total')
+            future = self.prefetchExecutor.submit(self.api.get_transaction, id)
+            future.add_done_callback(lambda future, id=id: self.prefetching.discard(id))
 
     def openTransactionInBrowser(self, i: int):
-        id = self.transactions['transactions'][i]['id']
+        id = self.getTxIDByIndex(i)
         url = f'https://test.bithomp.com/explorer/{id}'
         webbrowser.open(url)
 
     def getTxAddressByIndex(self, i: int):
-        tx = self.transactions['transactions'][i]
-        if tx['specification']['source']['address'] == self.activeAccount:
-            return tx['specification']['destination']['address']
-        else:
-            return tx['specification']['source']['address']
+        return self.getHistory().getCounterparty(i)
 
     def getTxIDByIndex(self, i: int):
-        return self.transactions['transactions'][i]['id']
+        return self.getHistory().getId(i)
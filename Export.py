@@ -0,0 +1,242 @@
+from datetime import datetime
+import csv
+import glob
+import io
+import json
+import os
+import threading
+
+columns = ['id', 'ledgerVersion', 'indexInLedger', 'timestamp', 'result', 'type', 'source',
+           'destination', 'amount', 'currency', 'fee', 'sourceTag', 'destinationTag']
+
+formats = {'.csv': 'csv', '.jsonl': 'jsonl', '.parquet': 'parquet'}
+
+
+def flatten(tx: dict) -> list:
+    ''' Returns the export columns of a transaction
+    '''
+    specification, outcome = tx.get('specification', {}), tx.get('outcome', {})
+    source = specification.get('source', {})
+    destination = specification.get('destination', {})
+    amount = outcome.get('deliveredAmount') or source.get('maxAmount') or {}
+    return [tx['id'], outcome.get('ledgerVersion'), outcome.get('indexInLedger', 0),
+            outcome.get('timestamp'), outcome.get('result'), tx.get('type'),
+            source.get('address', tx.get('address')), destination.get('address'),
+            amount.get('value'), amount.get('currency'), outcome.get('fee'),
+            source.get('tag'), destination.get('tag')]
+
+
+def getKey(tx: dict) -> tuple:
+    return tx['outcome']['ledgerVersion'], tx['outcome'].get('indexInLedger', 0)
+
+
+class TextWriter:
+    ''' Appends CSV or JSON Lines batches to a file. The position is the
+    file size after the last committed batch, so a resumed export first cuts
+    off whatever a crash left half written
+    '''
+    def __init__(self, fileName: str, format: str, position: int=None):
+        self.format = format
+        if position is None:
+            self.file = open(fileName, 'wb')
+            if format == 'csv':
+                self.write([], header=True)
+        else:
+            self.file = open(fileName, 'r+b')
+            self.file.truncate(position)
+            self.file.seek(position)
+
+    def write(self, transactions: list, header: bool=False):
+        buffer = io.StringIO()
+        if self.format == 'csv':
+            writer = csv.writer(buffer)
+            if header:
+                writer.writerow(columns)
+            writer.writerows(flatten(tx) for tx in transactions)
+        else:
+            for tx in transactions:
+                buffer.write(json.dumps(tx))
+                buffer.write('\n')
+        self.file.write(buffer.getvalue().encode())
+
+    def commit(self) -> int:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    ''' Writes every batch as a part file of a Parquet dataset directory.
+    Parts are renamed into place once complete, and the position is the
+    number of parts
+    '''
+    def __init__(self, directory: str, position: int=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('Parquet export needs pyarrow: pip install pyarrow')
+        self.pyarrow = pyarrow
+        self.directory = directory
+        self.parts = position or 0
+        os.makedirs(directory, exist_ok=True)
+        for fileName in glob.glob(os.path.join(directory, 'part-*.parquet*')):
+            part = os.path.basename(fileName).split('.')[0]
+            if fileName.endswith('.tmp') or int(part[5:]) >= self.parts:
+                os.remove(fileName)
+        self.schema = pyarrow.schema([('id', pyarrow.string()),
+                                      ('ledgerVersion', pyarrow.int64()),
+                                      ('indexInLedger', pyarrow.int64()),
+                                      ('timestamp', pyarrow.timestamp('s', tz='UTC')),
+                                      ('result', pyarrow.string()),
+                                      ('type', pyarrow.string()),
+                                      ('source', pyarrow.string()),
+                                      ('destination', pyarrow.string()),
+                                      ('amount', pyarrow.string()),
+                                      ('currency', pyarrow.string()),
+                                      ('fee', pyarrow.string()),
+                                      ('sourceTag', pyarrow.int64()),
+                                      ('destinationTag', pyarrow.int64())])
+
+    def write(self, transactions: list):
+        rows = [flatten(tx) for tx in transactions]
+        for row in rows:
+            if row[3] is not None:
+                row[3] = datetime.fromisoformat(row[3])
+        data = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+        table = self.pyarrow.Table.from_pydict(data, schema=self.schema)
+        fileName = os.path.join(self.directory, f'part-{self.parts:05d}.parquet')
+        self.pyarrow.parquet.write_table(table, fileName + '.tmp')
+        os.replace(fileName + '.tmp', fileName)
+        self.parts += 1
+
+    def commit(self) -> int:
+        return self.parts
+
+    def close(self):
+        pass
+
+
+class Export:
+    ''' Streams the whole history of an account, oldest first, from the local
+    store or from the API to a CSV file, a JSON Lines file with the full
+    transactions, or a Parquet dataset directory, holding at most one batch
+    in memory.
+
+    Progress is saved next to the output after every batch, so an
+    interrupted export resumes after the last written transaction
+    '''
+    def __init__(self, controller, account: str, fileName: str, format: str=None,
+                 source: str='store', batchSize: int=10000, onProgress=None):
+        if format is None:
+            format = formats.get(os.path.splitext(fileName)[1].lower())
+        if format not in formats.values():
+            raise ValueError(f'Unknown export format for "{fileName}", '
+                             f'use one of {", ".join(formats)}')
+        if source not in ('store', 'api'):
+            raise ValueError(f'Unknown export source "{source}"')
+        self.controller = controller
+        self.account = account
+        self.fileName = fileName
+        self.format = format
+        self.source = source
+        self.batchSize = batchSize
+        self.onProgress = onProgress
+        self.stateFileName = fileName.rstrip('/\\') + '.export'
+        self.stopped = threading.Event()
+        self.complete = False
+
+    def readState(self) -> dict:
+        ''' Returns the progress of an interrupted export of the same account,
+        format and source to the same file, or None
+        '''
+        try:
+            with open(self.stateFileName) as infile:
+                state = json.load(infile)
+        except (OSError, ValueError):
+            return None
+        if (state.get('account'), state.get('format'), state.get('source')) != \
+           (self.account, self.format, self.source) or not os.path.exists(self.fileName):
+            return None
+        return state
+
+    def writeState(self, state: dict):
+        with open(self.stateFileName + '.tmp', 'w') as outfile:
+            json.dump(state, outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(self.stateFileName + '.tmp', self.stateFileName)
+
+    def getPages(self, after: tuple):
+        ''' Yields the transactions after the given (ledgerVersion,
+        indexInLedger) key, a page at a time. Raises RuntimeError on API errors
+        '''
+        if self.source == 'store':
+            while True:
+                page = self.controller.store.getTransactionsAfter(self.account, *after,
+                                                                  limit=self.batchSize)
+                if not page:
+                    return
+                yield page
+                after = getKey(page[-1])
+        else:
+            api = self.controller.api
+            for page in api.iter_account_transactions(self.account, max(0, after[0])):
+                if page['status'] == 'error':
+                    raise RuntimeError(api.get_error_message(page))
+                yield [tx for tx in page['transactions'] if getKey(tx) > after]
+
+    def getTotal(self) -> int:
+        ''' Returns the number of transactions to export, or None if unknown
+        '''
+        if self.source == 'store':
+            return self.controller.store.count(self.account)
+        return None
+
+    def run(self, resume: bool=True) -> int:
+        ''' Exports the history, resuming an interrupted export unless resume
+        is false. Returns the number of exported transactions
+        '''
+        state = self.readState() if resume else None
+        if state is None:
+            state = {'account': self.account, 'format': self.format, 'source': self.source,
+                     'position': None, 'after': [-1, -1], 'rows': 0}
+        if self.format == 'parquet':
+            writer = ParquetWriter(self.fileName, state['position'])
+        else:
+            writer = TextWriter(self.fileName, self.format, state['position'])
+        total = self.getTotal()
+
+        try:
+            batch = []
+            for page in self.getPages(tuple(state['after'])):
+                if self.stopped.is_set():
+                    # The batch in progress is exported again on resume
+                    return state['rows']
+                batch.extend(page)
+                if len(batch) >= self.batchSize:
+                    self.writeBatch(writer, batch, state, total)
+                    batch = []
+            if batch:
+                self.writeBatch(writer, batch, state, total)
+        finally:
+            writer.close()
+        if os.path.exists(self.stateFileName):
+            os.remove(self.stateFileName)
+        self.complete = True
+        return state['rows']
+
+    def writeBatch(self, writer, batch: list, state: dict, total: int):
+        writer.write(batch)
+        state['position'] = writer.commit()
+        state['after'] = list(getKey(batch[-1]))
+        state['rows'] += len(batch)
+        self.writeState(state)
+        if self.onProgress is not None:
+            self.onProgress(state['rows'], total)
+
+    def stop(self):
+        self.stopped.set()
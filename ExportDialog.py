@@ -0,0 +1,109 @@
+from Export import Export
+import os
+import threading
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (QDialog, QFileDialog, QHBoxLayout, QLabel, QMessageBox,
+                             QProgressBar, QPushButton, QVBoxLayout)
+
+fileFilters = {'CSV files (*.csv)': '.csv',
+               'JSON Lines files (*.jsonl)': '.jsonl',
+               'Parquet datasets (*.parquet)': '.parquet'}
+
+
+class ExportDialog(QDialog):
+    ''' Exports the full history of the active account from the local store,
+    showing the progress, and resumes an interrupted export to the same file
+    '''
+    progressSignal = pyqtSignal(int, int)
+    finishedSignal = pyqtSignal(str)
+
+    def __init__(self, controller, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.account = controller.activeAccount
+        self.export = None
+
+        self.setWindowTitle('Export transactions')
+        self.resize(500, 120)
+
+        self.infoLabel = QLabel(f'Full history of {self.account}')
+        self.infoLabel.setAlignment(Qt.AlignCenter)
+        self.progressBar = QProgressBar()
+        self.progressBar.setFormat('%v of %m transactions')
+
+        self.exportButton = QPushButton('Export to...')
+        self.exportButton.clicked.connect(self.on_export_clicked)
+        self.stopButton = QPushButton('Stop')
+        self.stopButton.setEnabled(False)
+        self.stopButton.clicked.connect(self.on_stop_clicked)
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(self.exportButton)
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(self.stopButton)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.infoLabel)
+        layout.addWidget(self.progressBar)
+        layout.addLayout(buttonLayout)
+        self.setLayout(layout)
+
+        self.progressSignal.connect(self.on_progress)
+        self.finishedSignal.connect(self.on_finished)
+
+    def on_export_clicked(self):
+        fileName, fileFilter = QFileDialog.getSaveFileName(self, 'Export transactions',
+                                                           f'{self.account}.csv',
+                                                           ';;'.join(fileFilters))
+        if not fileName:
+            return
+        extension = fileFilters.get(fileFilter, '.csv')
+        if not fileName.lower().endswith(extension):
+            fileName += extension
+
+        self.export = Export(self.controller, self.account, fileName,
+                             onProgress=self.progressSignal.emit)
+        resume = False
+        if self.export.readState() is not None:
+            answer = QMessageBox.question(self, 'Export transactions',
+                                          f'An export to "{os.path.basename(fileName)}" was '
+                                          'interrupted. Resume it?',
+                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            resume = answer == QMessageBox.Yes
+
+        self.infoLabel.setText(f'Exporting to {fileName}')
+        self.progressBar.setMaximum(max(1, self.export.getTotal()))
+        self.progressBar.setValue(0)
+        self.exportButton.setEnabled(False)
+        self.stopButton.setEnabled(True)
+        threading.Thread(target=self.run, args=(resume,), daemon=True).start()
+
+    def run(self, resume: bool):
+        try:
+            rows = self.export.run(resume)
+        except (RuntimeError, ValueError, OSError) as e:
+            self.finishedSignal.emit(f'Export failed: {e}')
+            return
+        if not self.export.complete:
+            self.finishedSignal.emit(f'Export stopped after {rows} transactions, '
+                                     'export to the same file to resume it')
+        else:
+            self.finishedSignal.emit(f'Exported {rows} transactions')
+
+    def on_progress(self, rows: int, total: int):
+        self.progressBar.setMaximum(max(total, rows))
+        self.progressBar.setValue(rows)
+
+    def on_stop_clicked(self):
+        self.stopButton.setEnabled(False)
+        self.export.stop()
+
+    def on_finished(self, message: str):
+        self.infoLabel.setText(message)
+        self.exportButton.setEnabled(True)
+        self.stopButton.setEnabled(False)
+
+    def reject(self):
+        if self.export is not None:
+            self.export.stop()
+        super().reject()
@@ -0,0 +1,182 @@
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import bisect
+import json
+import threading
+import time
+
+# Upper bounds in seconds of the latency histogram buckets
+latencyBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def formatLabels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets: tuple=latencyBuckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        ''' Approximates a quantile by the upper bound of its bucket
+        '''
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    ''' Registry of counters and latency histograms, identified by a name and
+    a set of labels, that can be exported in the Prometheus text format or
+    as JSON
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.server = None
+
+    def increment(self, name: str, value: float=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        ''' Times the enclosed block into the histogram of the given name
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def drain(self) -> tuple:
+        ''' Returns the counters and histograms recorded since the last drain
+        and clears them, for merge in another process
+        '''
+        with self.lock:
+            delta = (self.counters, self.histograms)
+            self.counters, self.histograms = {}, {}
+        return delta
+
+    def merge(self, delta: tuple):
+        ''' Adds the counters and histograms returned by drain
+        '''
+        counters, histograms = delta
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(other.buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, other.counts)]
+                histogram.count += other.count
+                histogram.sum += other.sum
+
+    def toDict(self) -> dict:
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{'name': name, 'labels': dict(labels), 'count': histogram.count,
+                           'sum': histogram.sum,
+                           'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                           'buckets': dict(zip([str(bound) for bound in histogram.buckets] + ['+Inf'],
+                                               histogram.counts))}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return {'counters': counters, 'histograms': histograms}
+
+    def toJSON(self) -> str:
+        return json.dumps(self.toDict(), indent=4)
+
+    def toPrometheus(self) -> str:
+        lines, types = [], set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in types:
+                    types.add(name)
+                    lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name}{formatLabels(labels)} {value}')
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in types:
+                    types.add(name)
+                    lines.append(f'# TYPE {name} histogram')
+                seen = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    seen += count
+                    bucketLabels = labels + (('le', bound),)
+                    lines.append(f'{name}_bucket{formatLabels(bucketLabels)} {seen}')
+                lines.append(f'{name}_sum{formatLabels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{formatLabels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, fileName: str):
+        with open(fileName, 'w') as outfile:
+            outfile.write(self.toJSON())
+
+    def serve(self, port: int, host: str='localhost'):
+        ''' Serves the metrics on http://host:port/metrics in the Prometheus
+        text format and on /metrics.json as JSON
+        '''
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, contentType = registry.toPrometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, contentType = registry.toJSON(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', contentType)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+metrics = Metrics()
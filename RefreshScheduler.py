@@ -0,0 +1,260 @@
+from Metrics import metrics
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import random
+import threading
+import time
+
+
+class AccountState:
+    ''' Refresh interval and freshness of one account
+    '''
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.nextTime = 0.0
+        self.added = time.monotonic()
+        self.lastSuccess = float('-inf')
+        self.failures = 0
+        self.error = None
+        self.stale = False
+        self.running = False
+
+
+class RefreshScheduler:
+    ''' Keeps the snapshots of all configured accounts fresh from a background
+    thread, within a global budget of rate account refreshes per second.
+
+    The active account is refreshed every minInterval seconds. Other accounts
+    go back to twice that after their data changed and slow down by half
+    again after every refresh that found nothing new, up to maxInterval.
+    Accounts whose snapshot is already recent, from a manual refresh or a
+    pushed transaction, are not fetched. Errors back off the account
+    exponentially and halve the global rate, which recovers gradually.
+
+    An account is stale when its last successful refresh, or its addition
+    if it had none, is older than twice its interval plus minInterval.
+    onRefresh(account) is called after a refresh that changed the account or
+    brought it back from stale, and onStale(account) when an account goes
+    stale, both from background threads
+    '''
+    sweepInterval = 5.0
+    minRateFactor = 1 / 16
+
+    def __init__(self, controller, rate: float=0.5, minInterval: float=30.0,
+                 maxInterval: float=900.0, onRefresh=None, onStale=None, workers: int=None):
+        self.controller = controller
+        self.rate = rate
+        self.rateFactor = 1.0
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.onRefresh = onRefresh
+        self.onStale = onStale
+        self.workers = workers or controller.config.workers
+        self.states = {}
+        self.queue = []
+        self.tokens = 1.0
+        self.tokensTime = time.monotonic()
+        self.condition = threading.Condition()
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.stopEvent = threading.Event()
+        self.executor = None
+        self.thread = None
+
+        now = time.monotonic()
+        for account in controller.config.accounts:
+            state = self.states[account] = AccountState(2 * minInterval)
+            snapshot = self.getSnapshot(account)
+            if self.isValid(snapshot):
+                state.lastSuccess = snapshot['time']
+            # Spread the first refreshes over the first interval
+            self.push(account, now + random.uniform(0, state.interval))
+        self.setActive(controller.activeAccount)
+
+    def getSnapshot(self, account: str) -> dict:
+        ''' Returns the snapshot of an account in memory, or None, without
+        loading it from the store
+        '''
+        with self.controller.snapshotsLock:
+            return self.controller.snapshots.get(account)
+
+    def isValid(self, snapshot: dict) -> bool:
+        return snapshot is not None and snapshot['account_info']['status'] == 'ok' and \
+            snapshot['transactions']['status'] == 'ok'
+
+    def push(self, account: str, nextTime: float):
+        state = self.states[account]
+        state.nextTime = nextTime
+        heapq.heappush(self.queue, (nextTime, account))
+
+    def start(self):
+        self.stopEvent.clear()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        with self.condition:
+            self.condition.notify()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def setActive(self, account: str):
+        ''' Refreshes an account every minInterval from now on, and right away
+        if its data is older than that
+        '''
+        with self.condition:
+            state = self.states.get(account)
+            if state is None:
+                return
+            for other in self.states.values():
+                if other.interval < 2 * self.minInterval:
+                    other.interval = 2 * self.minInterval
+            state.interval = self.minInterval
+            self.push(account, max(time.monotonic(), state.lastSuccess + self.minInterval))
+            self.condition.notify()
+
+    def getStatus(self, account: str) -> dict:
+        ''' Returns the seconds since the last successful refresh of an
+        account, or None if there was none, its current interval, whether it
+        is stale and since when, as a Unix time, and the number of failed
+        refreshes in a row with the last error
+        '''
+        with self.condition:
+            state = self.states[account]
+            now = time.monotonic()
+            age = now - state.lastSuccess if state.lastSuccess > float('-inf') else None
+            staleSince = None
+            if state.stale:
+                since = now - self.getFreshTime(state)
+                staleSince = time.time() - (since - self.getStaleAfter(state))
+            return {'age': age, 'interval': state.interval,
+                    'stale': state.stale, 'staleSince': staleSince,
+                    'failures': state.failures, 'error': state.error}
+
+    def getStaleAfter(self, state: AccountState) -> float:
+        return 2 * state.interval + self.minInterval
+
+    def getFreshTime(self, state: AccountState) -> float:
+        ''' Returns the time staleness is measured from
+        '''
+        return state.lastSuccess if state.lastSuccess > float('-inf') else state.added
+
+    def takeToken(self) -> float:
+        ''' Takes a token from the rate budget. Returns 0, or the seconds to
+        wait for the next token if there is none
+        '''
+        now = time.monotonic()
+        rate = self.rate * self.rateFactor
+        self.tokens = min(1.0, self.tokens + (now - self.tokensTime) * rate)
+        self.tokensTime = now
+        if self.tokens < 1:
+            return (1 - self.tokens) / rate
+        self.tokens -= 1
+        return 0
+
+    def run(self):
+        lastSweep = time.monotonic()
+        while not self.stopEvent.is_set():
+            now = time.monotonic()
+            if now - lastSweep >= self.sweepInterval:
+                self.sweep(now)
+                lastSweep = now
+
+            account = None
+            with self.condition:
+                while self.queue and (self.queue[0][0] != self.states[self.queue[0][1]].nextTime or
+                                      self.states[self.queue[0][1]].running):
+                    heapq.heappop(self.queue)  # Superseded entries
+                wait = self.queue[0][0] - now if self.queue else self.sweepInterval
+                if wait <= 0 and self.isRecent(self.queue[0][1]):
+                    continue
+                if wait <= 0:
+                    wait = self.takeToken()
+                    if wait == 0:
+                        account = heapq.heappop(self.queue)[1]
+                        self.states[account].running = True
+                if account is None:
+                    self.condition.wait(min(wait, self.sweepInterval))
+                    continue
+
+            self.slots.acquire()
+            try:
+                self.executor.submit(self.refresh, account)
+            except RuntimeError:  # Stopped
+                return
+
+    def refresh(self, account: str):
+        try:
+            self.fetch(account)
+        finally:
+            self.slots.release()
+
+    def isRecent(self, account: str) -> bool:
+        ''' Reschedules a due account, without using the budget, if it was
+        refreshed meanwhile by other means
+        '''
+        state = self.states[account]
+        snapshot = self.getSnapshot(account)
+        if not self.isValid(snapshot) or time.monotonic() - snapshot['time'] >= state.interval:
+            return False
+        state.lastSuccess = snapshot['time']
+        state.stale = False
+        self.push(account, snapshot['time'] + state.interval)
+        return True
+
+    def fetch(self, account: str):
+        state = self.states[account]
+        before = self.getSnapshot(account)
+        metrics.increment('zerpy_auto_refreshes_total')
+        try:
+            snapshot = self.controller.fetchAccount(account)
+            error = None
+            if not self.isValid(snapshot):
+                failed = snapshot['account_info'] if snapshot['account_info']['status'] == 'error' \
+                    else snapshot['transactions']
+                error = self.controller.api.get_error_message(failed)
+        except Exception as e:
+            snapshot, error = None, f'Refresh error: {e}'
+        now = time.monotonic()
+        with self.condition:
+            state.running = False
+            if error is not None:
+                metrics.increment('zerpy_auto_refresh_errors_total')
+                state.failures += 1
+                state.error = error
+                self.rateFactor = max(self.minRateFactor, self.rateFactor / 2)
+                delay = min(self.maxInterval, self.minInterval * 2 ** state.failures)
+                self.push(account, now + random.uniform(delay / 2, delay))
+                return
+
+            changed = not self.isValid(before) or \
+                before['account_info']['account_data']['Balance'] != \
+                snapshot['account_info']['account_data']['Balance'] or \
+                len(before['transactions']['transactions']) != len(snapshot['transactions']['transactions'])
+            wasStale = state.stale
+            state.failures, state.error, state.stale = 0, None, False
+            state.lastSuccess = snapshot['time']
+            self.rateFactor = min(1.0, self.rateFactor * 1.5)
+            if account != self.controller.activeAccount:
+                if changed:
+                    state.interval = 2 * self.minInterval
+                else:
+                    state.interval = min(self.maxInterval, state.interval * 1.5)
+            self.push(account, now + state.interval)
+        if (changed or wasStale) and self.onRefresh is not None:
+            self.onRefresh(account)
+
+    def sweep(self, now: float):
+        ''' Marks the accounts that went stale since the last sweep
+        '''
+        stale = []
+        with self.condition:
+            for account, state in self.states.items():
+                if not state.stale and now - self.getFreshTime(state) > self.getStaleAfter(state):
+                    state.stale = True
+                    stale.append(account)
+        for account in stale:
+            metrics.increment('zerpy_stale_accounts_total')
+            if self.onStale is not None:
+                self.onStale(account)
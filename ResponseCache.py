@@ -0,0 +1,132 @@
+from Metrics import metrics
+from collections import OrderedDict
+from concurrent.futures import Future
+import threading
+import time
+
+
+def getSize(value) -> int:
+    ''' Returns roughly the size in bytes of a decoded JSON value
+    '''
+    if isinstance(value, dict):
+        return 2 + sum(len(key) + 4 + getSize(item) for key, item in value.items())
+    if isinstance(value, list):
+        return 2 + sum(getSize(item) + 1 for item in value)
+    if isinstance(value, str):
+        return len(value) + 2
+    return 8
+
+
+class ResponseCache:
+    ''' Least recently used cache of API responses, bounded by their
+    estimated size, with a time to live per endpoint. Identical requests made
+    while one is in flight wait for its response instead of sending their own.
+
+    Keys are (endpoint, account or id, ...) tuples. Only successful
+    responses are kept, and they are shared, so they must not be modified
+    '''
+    # Validated transactions never change
+    ttls = {'account_info': 5.0, 'account_transactions': 5.0, 'transaction': float('inf')}
+
+    def __init__(self, maxBytes: int=16 * 2 ** 20, ttls: dict=None):
+        self.maxBytes = maxBytes
+        self.ttls = dict(self.ttls, **(ttls or {}))
+        self.entries = OrderedDict()
+        self.size = 0
+        self.inFlight = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple, load) -> dict:
+        ''' Returns the cached response for key, or the one of the identical
+        request in flight, or calls load() to request it
+        '''
+        endpoint, account = key[:2]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                metrics.increment('zerpy_cache_hits_total', endpoint=endpoint)
+                return entry[2]
+            future = self.inFlight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inFlight[key] = Future()
+                generation = self.generations.get(account, 0)
+        if not leader:
+            metrics.increment('zerpy_cache_coalesced_total', endpoint=endpoint)
+            return future.result()
+
+        metrics.increment('zerpy_cache_misses_total', endpoint=endpoint)
+        try:
+            response = load()
+        except BaseException as e:
+            with self.lock:
+                self.finish(key, future)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.finish(key, future)
+            # A response requested before an invalidation may already be stale
+            if response['status'] == 'ok' and self.generations.get(account, 0) == generation:
+                self.put(key, response)
+        future.set_result(response)
+        return response
+
+    def peek(self, key: tuple) -> dict:
+        ''' Returns the fresh cached response for key, or None, without
+        requesting it
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self.entries.move_to_end(key)
+            return entry[2]
+
+    def contains(self, key: tuple) -> bool:
+        ''' Returns whether a fresh response for key is cached or in flight
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            return key in self.inFlight or entry is not None and entry[0] > time.monotonic()
+
+    def finish(self, key: tuple, future: Future):
+        if self.inFlight.get(key) is future:
+            del self.inFlight[key]
+
+    def put(self, key: tuple, response: dict):
+        size = getSize(response)
+        if size > self.maxBytes:
+            return
+        self.remove(key)
+        self.entries[key] = (time.monotonic() + self.ttls.get(key[0], 0), size, response)
+        self.size += size
+        while self.size > self.maxBytes:
+            _, (_, size, _) = self.entries.popitem(last=False)
+            self.size -= size
+            metrics.increment('zerpy_cache_evictions_total')
+
+    def remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def invalidate(self, account: str):
+        ''' Drops the responses of an account. Requests for it already in
+        flight are neither cached nor joined by new ones
+        '''
+        with self.lock:
+            self.generations[account] = self.generations.get(account, 0) + 1
+            for key in [key for key in self.entries if key[1] == account]:
+                self.remove(key)
+            for key in [key for key in self.inFlight if key[1] == account]:
+                del self.inFlight[key]
+
+    def clear(self):
+        with self.lock:
+            for account in {key[1] for key in self.entries} | {key[1] for key in self.inFlight}:
+                self.generations[account] = self.generations.get(account, 0) + 1
+            self.entries.clear()
+            self.inFlight.clear()
+            self.size = 0
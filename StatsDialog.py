@@ -0,0 +1,69 @@
+from Metrics import metrics
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (QDialog, QFileDialog, QHeaderView, QHBoxLayout, QPushButton,
+                             QTableWidget, QTableWidgetItem, QVBoxLayout)
+
+
+class StatsDialog(QDialog):
+    ''' Shows the counters and latency histograms collected by Metrics,
+    refreshed every second
+    '''
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Statistics')
+        self.resize(700, 400)
+
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(['Metric', 'Count / value', 'Mean', 'p50', 'p95'])
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        self.resetButton = QPushButton('Reset')
+        self.resetButton.clicked.connect(self.on_reset_clicked)
+        self.saveButton = QPushButton('Save JSON...')
+        self.saveButton.clicked.connect(self.on_save_clicked)
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(self.resetButton)
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(self.saveButton)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addLayout(buttonLayout)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        data = metrics.toDict()
+        rows = []
+        for counter in data['counters']:
+            rows.append([self.getName(counter), f"{counter['value']:g}", '', '', ''])
+        for histogram in data['histograms']:
+            mean = histogram['sum'] / histogram['count'] if histogram['count'] else 0
+            rows.append([self.getName(histogram), str(histogram['count']),
+                         f'{mean * 1000:.2f} ms', f"≤ {histogram['p50'] * 1000:g} ms",
+                         f"≤ {histogram['p95'] * 1000:g} ms"])
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for column, text in enumerate(row):
+                self.table.setItem(i, column, QTableWidgetItem(text))
+
+    def getName(self, metric: dict) -> str:
+        labels = ', '.join(f'{key}={value}' for key, value in metric['labels'].items())
+        return f"{metric['name']} ({labels})" if labels else metric['name']
+
+    def on_reset_clicked(self):
+        metrics.reset()
+        self.refresh()
+
+    def on_save_clicked(self):
+        fileName, _ = QFileDialog.getSaveFileName(self, 'Save statistics', 'zerpy_metrics.json',
+                                                  'JSON files (*.json)')
+        if fileName:
+            metrics.dump(fileName)
@@ -0,0 +1,112 @@
+from Metrics import metrics
+from concurrent.futures import Future, ThreadPoolExecutor
+import itertools
+import multiprocessing
+import threading
+
+
+def serve(connection, config, storeFileName: str):
+    ''' Main loop of the worker process. Fetches accounts into the store with
+    its own Controller and answers each request with the account info, the
+    sync status and, when asked for, the history columns, along with the
+    metrics recorded here since the last answer
+    '''
+    from Controller import Controller
+    from TransactionStore import TransactionStore
+
+    controller = Controller(config, TransactionStore(storeFileName))
+    # Invalidations happen in the GUI process, so nothing is cached here
+    controller.api.cache = None
+    lock = threading.Lock()
+
+    def fetch(id: int, account: str, withHistory: bool):
+        try:
+            accountInfo = controller.api.submit(controller.api.get_account_info, account)
+            transactions = controller.syncStore(account)
+            state = None
+            if transactions['status'] == 'ok' and withHistory:
+                state = controller.loadHistory(account).getState()
+            result = (accountInfo.result(), transactions, state)
+        except Exception as e:
+            error = {'status': 'error', 'message': f'Worker error: {e}'}
+            result = (error, error, None)
+        with lock:
+            connection.send((id, result, metrics.drain()))
+
+    with ThreadPoolExecutor(max_workers=config.workers) as executor:
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            executor.submit(fetch, *message)
+    controller.api.close()
+
+
+class SyncWorker:
+    ''' Runs account fetches in a separate process: the API requests, the
+    JSON decoding and the store updates, and the first history load of an
+    account, which comes back as column bytes. This keeps that work off the
+    GIL of the GUI process. The metrics the worker records, such as the API
+    request counts and latencies, are merged into the ones of this process.
+
+    fetch is safe to call from several threads at once
+    '''
+    def __init__(self, config, storeFileName: str):
+        context = multiprocessing.get_context('spawn')
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=serve, args=(child, config, storeFileName),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.ids = itertools.count()
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.receive, daemon=True)
+        self.thread.start()
+
+    def fetch(self, account: str, withHistory: bool=False) -> tuple:
+        ''' Syncs an account in the worker. Returns its account info, the sync
+        status and, if withHistory, the state of its history for
+        TransactionHistory.fromState
+        '''
+        future = Future()
+        with self.lock:
+            id = next(self.ids)
+            self.futures[id] = future
+            try:
+                self.connection.send((id, account, withHistory))
+            except (OSError, ValueError) as e:
+                del self.futures[id]
+                error = {'status': 'error', 'message': f'Worker process unavailable: {e}'}
+                return error, error, None
+        return future.result()
+
+    def receive(self):
+        while True:
+            try:
+                id, result, delta = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            metrics.merge(delta)
+            with self.lock:
+                future = self.futures.pop(id)
+            future.set_result(result)
+        error = {'status': 'error', 'message': 'Worker process exited'}
+        with self.lock:
+            futures, self.futures = self.futures, {}
+        for future in futures.values():
+            future.set_result((error, error, None))
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
@@ -0,0 +1,108 @@
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class Task(QRunnable):
+    ''' Runs a function in the thread pool and reports its result through
+    signals, unless the task was cancelled in the meantime
+    '''
+    def __init__(self, key: str, group: str, generation: int, function):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.key = key
+        self.group = group
+        self.generation = generation
+        self.function = function
+        self.signals = TaskSignals()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            if self.cancelled.is_set():
+                return
+            try:
+                result = self.function()
+            except Exception as e:
+                if not self.cancelled.is_set():
+                    self.signals.failed.emit(str(e))
+                return
+            if not self.cancelled.is_set():
+                self.signals.finished.emit(result)
+        finally:
+            self.done.set()
+
+
+class TaskScheduler(QObject):
+    ''' Runs background tasks in a QThreadPool and hands their results back to
+    the GUI thread.
+
+    Tasks are identified by a key: scheduling a key that is already running
+    attaches the callbacks to the running task instead of starting another
+    one. A task that finished, even if its result was not delivered yet,
+    is not joined, as its signals may have been emitted already. Tasks can belong to a group, where scheduling a new key cancels the
+    tasks of the previous generations, so a superseded fetch never delivers
+    its stale result
+    '''
+    def __init__(self, maxThreads: int=4):
+        super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(maxThreads)
+        self.tasks = {}
+        self.cancelled = []  # Kept alive until the pool is done with them
+        self.replaced = []  # Finished tasks kept alive until their result is delivered
+        self.generations = {}
+
+    def schedule(self, key: str, function, callback=None, errback=None, group: str=None) -> Task:
+        self.cancelled = [task for task in self.cancelled if not task.done.is_set()]
+        task = self.tasks.get(key)
+        if task is None or task.cancelled.is_set() or task.done.is_set():
+            if task is not None and not task.cancelled.is_set():
+                self.replaced.append(task)
+            generation = None
+            if group is not None:
+                generation = self.generations.get(group, 0) + 1
+                self.generations[group] = generation
+                self.cancelGroup(group, generation)
+            task = Task(key, group, generation, function)
+            task.signals.finished.connect(lambda result, task=task: self.on_done(task))
+            task.signals.failed.connect(lambda message, task=task: self.on_done(task))
+            self.tasks[key] = task
+            self.pool.start(task)
+        if callback is not None:
+            task.signals.finished.connect(callback)
+        if errback is not None:
+            task.signals.failed.connect(errback)
+        return task
+
+    def cancelGroup(self, group: str, generation: int=None):
+        ''' Cancels the tasks of a group older than the given generation
+        '''
+        for key, task in list(self.tasks.items()):
+            if task.group == group and (generation is None or task.generation < generation):
+                self.cancel(key)
+
+    def cancel(self, key: str):
+        task = self.tasks.pop(key, None)
+        if task is not None:
+            task.cancelled.set()
+            if not self.pool.tryTake(task):
+                self.cancelled.append(task)
+
+    def cancelAll(self):
+        for key in list(self.tasks):
+            self.cancel(key)
+
+    def isRunning(self, key: str) -> bool:
+        return key in self.tasks
+
+    def on_done(self, task: Task):
+        if self.tasks.get(task.key) is task:
+            del self.tasks[task.key]
+        elif task in self.replaced:
+            self.replaced.remove(task)
@@ -0,0 +1,377 @@
+from TransactionStore import TransactionStore
+from array import array
+from datetime import datetime
+import bisect
+import heapq
+import re
+import threading
+
+ID_SIZE = 32  # Transaction ids are 256 bit hashes
+
+amountRegex = re.compile(r'^(?P<operator>[<>]=?)?(?P<amount>\d+(\.\d{0,6})?)$')
+amountRangeRegex = re.compile(r'^(?P<low>\d+(\.\d{0,6})?)\.\.(?P<high>\d+(\.\d{0,6})?)$')
+dateRegex = re.compile(r'^(?P<low>\d{4}-\d{2}(-\d{2})?)(\.\.(?P<high>\d{4}-\d{2}(-\d{2})?))?$')
+
+
+def parseDate(text: str, end: bool=False) -> int:
+    ''' Converts a local YYYY-MM or YYYY-MM-DD date to epoch seconds, at its
+    start or, with end, at the start of the next month or day
+    '''
+    if len(text) == 7:
+        date = datetime.strptime(text, '%Y-%m')
+        if end:
+            date = date.replace(year=date.year + date.month // 12, month=date.month % 12 + 1)
+    else:
+        date = datetime.strptime(text, '%Y-%m-%d')
+        if end:
+            date = datetime.fromordinal(date.toordinal() + 1)
+    return int(date.timestamp())
+
+
+def parseQuery(text: str) -> dict:
+    ''' Parses a filter like "rAbc 2020-06-01..2020-06-30 >100" into the
+    arguments of TransactionHistory.search. Amounts are absolute XRP values:
+    ">100", "<=5", "10..20" or "42". Dates are local days or months, or ranges
+    of them. Any other word must be part of the counterparty address.
+    Transactions must match every word, so repeated amounts and dates narrow
+    the range and repeated words must all be part of the address
+    '''
+    query = {}
+
+    def narrow(low: str, high: str, lowValue: int=None, highValue: int=None):
+        if lowValue is not None:
+            query[low] = max(query.get(low, lowValue), lowValue)
+        if highValue is not None:
+            query[high] = min(query.get(high, highValue), highValue)
+
+    for word in text.split():
+        match = amountRangeRegex.match(word)
+        if match:
+            narrow('minDrops', 'maxDrops', round(float(match['low']) * 1e6),
+                   round(float(match['high']) * 1e6))
+            continue
+        match = amountRegex.match(word)
+        if match:
+            drops = round(float(match['amount']) * 1e6)
+            operator = match['operator']
+            narrow('minDrops', 'maxDrops',
+                   drops + (operator == '>') if operator in (None, '>=', '>') else None,
+                   drops - (operator == '<') if operator in (None, '<=', '<') else None)
+            continue
+        match = dateRegex.match(word)
+        if match:
+            try:
+                narrow('since', 'until', parseDate(match['low']),
+                       parseDate(match['high'] or match['low'], end=True))
+                continue
+            except ValueError:
+                pass
+        query.setdefault('counterparty', []).append(word)
+    return query
+
+
+class TransactionHistory:
+    ''' Compact, read-only view of the stored transactions of an account with
+    a given result, newest first.
+
+    Only the fields Zerpy shows are kept in memory, as columns: ids as 32 raw
+    bytes, ledger versions, epoch timestamps, amounts in signed drops (negative
+    for payments sent by the account), fees paid by the account in drops and
+    counterparties as indexes into a list of interned addresses. The full
+    transaction is read from the store on demand. Columns are stored oldest
+    first so new transactions append. A refreshed history appends them to the
+    columns it shares with the history it extends, which keeps its length
+    '''
+    def __init__(self, store: TransactionStore, account: str, result: str='tesSUCCESS'):
+        self.store = store
+        self.account = account
+        self.result = result
+        self.ids = bytearray()
+        self.ledgers = array('q')
+        self.times = array('q')
+        self.drops = array('q')
+        self.fees = array('q')
+        self.counterparties = array('I')
+        self.addresses = []
+        self.addressIndexes = {}
+        self.length = 0
+        self.lastKey = (-1, -1)  # (ledgerVersion, indexInLedger) of the newest row
+        self.origin = object()  # Shared by the histories extended from this one
+        self.lock = threading.Lock()  # Guards the columns shared with them
+        self.byCounterparty = None
+        self.amountOrder = None
+        self.sortedAmounts = None
+        rows, self.lastRow = store.getColumnsSince(account, result)
+        self.append(rows)
+
+    def append(self, rows: list):
+        if len(rows) > 1000:
+            # Cheaper to rebuild the search indexes when they are next needed
+            self.byCounterparty = self.amountOrder = self.sortedAmounts = None
+        for id, ledger, indexInLedger, timestamp, drops, fee, source, destination in rows:
+            if source == self.account:
+                counterparty, drops, fee = destination, -(drops or 0), fee or 0
+            else:
+                counterparty, drops, fee = source, drops or 0, 0
+            index = self.addressIndexes.get(counterparty)
+            if index is None:
+                index = self.addressIndexes[counterparty] = len(self.addresses)
+                self.addresses.append(counterparty)
+            if self.byCounterparty is not None:
+                self.index(len(self.ledgers), index, drops)
+            self.ids += bytes.fromhex(id)
+            self.ledgers.append(ledger)
+            self.times.append(timestamp or 0)
+            self.drops.append(drops)
+            self.fees.append(fee)
+            self.counterparties.append(index)
+        if rows:
+            self.lastKey = (rows[-1][1], rows[-1][2])
+        self.length = len(self.ledgers)
+
+    def copy(self) -> 'TransactionHistory':
+        ''' Returns a history with its own columns, holding the rows of this one
+        '''
+        length = self.length
+        history = TransactionHistory.__new__(TransactionHistory)
+        history.__dict__.update(self.__dict__)
+        history.lock = threading.Lock()
+        with self.lock:
+            history.ids = self.ids[:length * ID_SIZE]
+            history.ledgers = self.ledgers[:length]
+            history.times = self.times[:length]
+            history.drops = self.drops[:length]
+            history.fees = self.fees[:length]
+            history.counterparties = self.counterparties[:length]
+            history.addresses = self.addresses[:]
+            history.addressIndexes = dict(self.addressIndexes)
+            if self.byCounterparty is not None:
+                history.byCounterparty = [positions[:bisect.bisect_left(positions, length)]
+                                          for positions in self.byCounterparty]
+                history.amountOrder = array('q', (position for position in self.amountOrder
+                                                  if position < length))
+                history.sortedAmounts = array('q', (abs(self.drops[position])
+                                                    for position in history.amountOrder))
+        return history
+
+    def extend(self, rows: list, lastRow: int) -> 'TransactionHistory':
+        ''' Returns a history with the given rows appended. The columns are
+        shared unless another history already appended to them
+        '''
+        with self.lock:
+            if self.length == len(self.ledgers):
+                history = TransactionHistory.__new__(TransactionHistory)
+                history.__dict__.update(self.__dict__)
+                history.append(rows)
+                history.lastRow = lastRow
+                return history
+        history = self.copy()
+        history.append(rows)
+        history.lastRow = lastRow
+        return history
+
+    def getState(self) -> dict:
+        ''' Returns the columns as bytes, to rebuild the history in another
+        process with fromState
+        '''
+        length = self.length
+        with self.lock:
+            return {'ids': bytes(self.ids[:length * ID_SIZE]),
+                    'ledgers': self.ledgers[:length].tobytes(),
+                    'times': self.times[:length].tobytes(), 'drops': self.drops[:length].tobytes(),
+                    'fees': self.fees[:length].tobytes(),
+                    'counterparties': self.counterparties[:length].tobytes(),
+                    'addresses': self.addresses[:], 'lastKey': self.lastKey,
+                    'lastRow': self.lastRow}
+
+    @classmethod
+    def fromState(cls, store: TransactionStore, account: str, result: str,
+                  state: dict) -> 'TransactionHistory':
+        history = cls.__new__(cls)
+        history.store = store
+        history.account = account
+        history.result = result
+        history.ids = bytearray(state['ids'])
+        for name, typecode in (('ledgers', 'q'), ('times', 'q'), ('drops', 'q'), ('fees', 'q'),
+                               ('counterparties', 'I')):
+            column = array(typecode)
+            column.frombytes(state[name])
+            setattr(history, name, column)
+        history.addresses = list(state['addresses'])
+        history.addressIndexes = {address: i for i, address in enumerate(history.addresses)}
+        history.length = len(history.ledgers)
+        history.lastKey = tuple(state['lastKey'])
+        history.lastRow = state['lastRow']
+        history.origin = object()
+        history.lock = threading.Lock()
+        history.byCounterparty = history.amountOrder = history.sortedAmounts = None
+        return history
+
+    def refresh(self) -> 'TransactionHistory':
+        ''' Returns the history with the transactions stored since it was read,
+        which is this same object when there are none. The history is reread
+        when transactions older than the newest one were stored meanwhile
+        '''
+        rows, lastRow = self.store.getColumnsSince(self.account, self.result, self.lastRow)
+        if not rows:
+            self.lastRow = lastRow  # Rows of other accounts
+            return self
+        if (rows[0][1], rows[0][2]) <= self.lastKey:
+            return TransactionHistory(self.store, self.account, self.result)
+        return self.extend(rows, lastRow)
+
+    def __len__(self):
+        return self.length
+
+    def getPosition(self, i: int) -> int:
+        ''' Maps a newest first index to its position in the columns
+        '''
+        length = self.length
+        if i < 0:
+            i += length
+        if not 0 <= i < length:
+            raise IndexError('transaction index out of range')
+        return length - 1 - i
+
+    def getKey(self, i: int) -> bytes:
+        j = self.getPosition(i) * ID_SIZE
+        return bytes(self.ids[j:j + ID_SIZE])
+
+    def getId(self, i: int) -> str:
+        return self.getKey(i).hex().upper()
+
+    def getLedger(self, i: int) -> int:
+        return self.ledgers[self.getPosition(i)]
+
+    def getTime(self, i: int) -> int:
+        return self.times[self.getPosition(i)]
+
+    def getDrops(self, i: int) -> int:
+        return self.drops[self.getPosition(i)]
+
+    def getFee(self, i: int) -> int:
+        return self.fees[self.getPosition(i)]
+
+    def getCounterparty(self, i: int) -> str:
+        return self.addresses[self.counterparties[self.getPosition(i)]]
+
+    def __getitem__(self, i: int) -> dict:
+        ''' Returns the full transaction, read from the store
+        '''
+        return self.store.get(self.account, self.getId(i))
+
+    def buildIndexes(self):
+        ''' Builds the indexes used by search the first time it needs them.
+        Histories never change, so they stay valid for the history lifetime.
+        They are shared with the histories extended from this one, which add
+        their positions, past the length of this one
+        '''
+        with self.lock:
+            if self.byCounterparty is not None:
+                return
+            byCounterparty = [array('q') for _ in self.addresses]
+            counterparties = self.counterparties
+            for position in range(self.length):
+                byCounterparty[counterparties[position]].append(position)
+            self.amountOrder = array('q', sorted(range(self.length),
+                                                 key=lambda position: abs(self.drops[position])))
+            self.sortedAmounts = array('q', (abs(self.drops[position])
+                                             for position in self.amountOrder))
+            self.byCounterparty = byCounterparty
+
+    def index(self, position: int, counterparty: int, drops: int):
+        ''' Adds an appended transaction to the search indexes
+        '''
+        if counterparty == len(self.byCounterparty):
+            self.byCounterparty.append(array('q'))
+        self.byCounterparty[counterparty].append(position)
+        i = bisect.bisect_right(self.sortedAmounts, abs(drops))
+        self.sortedAmounts.insert(i, abs(drops))
+        self.amountOrder.insert(i, position)
+
+    def search(self, counterparty='', since: int=None, until: int=None,
+               minDrops: int=None, maxDrops: int=None) -> 'TransactionHistory':
+        ''' Returns a view of the transactions with a counterparty containing
+        the given text, or all the texts of a list, case insensitively, a
+        timestamp in [since, until) and an absolute amount in drops in
+        [minDrops, maxDrops]
+        '''
+        self.buildIndexes()
+        with self.lock:
+            return self.find(counterparty, since, until, minDrops, maxDrops)
+
+    def find(self, counterparty, since: int, until: int, minDrops: int, maxDrops: int):
+        ''' Runs search once the indexes are built, with the columns locked
+        '''
+        # Timestamps grow with the ledger version, so a time range is a slice
+        length = self.length
+        low = 0 if since is None else bisect.bisect_left(self.times, since, 0, length)
+        high = length if until is None else bisect.bisect_left(self.times, until, 0, length)
+        hasAmount = minDrops is not None or maxDrops is not None
+
+        texts = [counterparty] if isinstance(counterparty, str) else counterparty
+        texts = [text.lower() for text in texts if text]
+        if texts:
+            # Addresses may have been added by a history that does not index them
+            addresses = self.addresses[:len(self.byCounterparty)]
+            matches = {index for index, address in enumerate(addresses)
+                       if all(text in address.lower() for text in texts)}
+            if len(matches) <= 8:
+                lists = [self.byCounterparty[index] for index in matches]
+                lists = [positions[bisect.bisect_left(positions, low):
+                                   bisect.bisect_left(positions, high)]
+                         for positions in lists]
+                candidates = lists[0] if len(lists) == 1 else heapq.merge(*lists)
+            else:
+                counterparties = self.counterparties
+                candidates = [position for position in range(low, high)
+                              if counterparties[position] in matches]
+        elif hasAmount:
+            first = 0 if minDrops is None else bisect.bisect_left(self.sortedAmounts, minDrops)
+            last = len(self.sortedAmounts) if maxDrops is None else \
+                bisect.bisect_right(self.sortedAmounts, maxDrops)
+            if last - first < high - low:
+                candidates = sorted(position for position in self.amountOrder[first:last]
+                                    if low <= position < high)
+            else:
+                candidates = range(low, high)
+        else:
+            candidates = range(low, high)
+
+        if hasAmount:
+            minDrops = 0 if minDrops is None else minDrops
+            maxDrops = float('inf') if maxDrops is None else maxDrops
+            drops = self.drops
+            candidates = [position for position in candidates
+                          if minDrops <= abs(drops[position]) <= maxDrops]
+        positions = array('q', candidates)
+        positions.reverse()
+        return HistoryView(self, positions)
+
+    def getMemoryUsage(self) -> int:
+        ''' Returns the approximate size of the columns in bytes
+        '''
+        return (self.length * ID_SIZE + self.ledgers.itemsize * self.length * 4 +
+                self.counterparties.itemsize * self.length +
+                sum(len(address) + 49 for address in self.addresses))
+
+
+class HistoryView(TransactionHistory):
+    ''' Subset of a history, newest first, sharing its columns
+    '''
+    def __init__(self, history: TransactionHistory, positions: array):
+        self.__dict__.update(history.__dict__)
+        self.history = history
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def getPosition(self, i: int) -> int:
+        return self.positions[i]
+
+    def refresh(self) -> TransactionHistory:
+        return self.history.refresh()
+
+    def search(self, *args, **kwargs) -> TransactionHistory:
+        return self.history.search(*args, **kwargs)
@@ -0,0 +1,207 @@
+import json
+import sqlite3
+import threading
+
+
+class TransactionStore:
+    ''' On-disk SQLite store of account transactions, keyed by account and
+    transaction id, so only the history newer than the last stored ledger
+    needs to be synced
+    '''
+    schemaVersion = 1
+
+    def __init__(self, fileName: str='.zerpy_store.db'):
+        self.fileName = fileName
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(fileName, check_same_thread=False)
+        # Readers do not wait for a writer, like the sync worker process
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS transactions ('
+                            'account TEXT NOT NULL, '
+                            'id TEXT NOT NULL, '
+                            'ledgerVersion INTEGER NOT NULL, '
+                            'indexInLedger INTEGER NOT NULL, '
+                            'result TEXT NOT NULL, '
+                            'data TEXT NOT NULL, '
+                            'PRIMARY KEY (account, id))')
+            self.migrate()
+            self.db.execute('CREATE INDEX IF NOT EXISTS transactions_order '
+                            'ON transactions (account, ledgerVersion DESC, indexInLedger DESC)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS transactions_result_order '
+                            'ON transactions (account, result, ledgerVersion DESC, indexInLedger DESC)')
+            self.db.execute("CREATE INDEX IF NOT EXISTS transactions_sequence "
+                            "ON transactions (account, json_extract(data, '$.address'), "
+                            "json_extract(data, '$.sequence'))")
+            self.db.execute('CREATE TABLE IF NOT EXISTS sync ('
+                            'account TEXT PRIMARY KEY, '
+                            'ledgerVersion INTEGER NOT NULL)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS accounts ('
+                            'account TEXT PRIMARY KEY, '
+                            'info TEXT NOT NULL)')
+
+    def migrate(self):
+        ''' Brings a store written by an older Zerpy to the current schema.
+        Columns added here go last, so inserts name their columns
+        '''
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            columns = [row[1] for row in self.db.execute('PRAGMA table_info(transactions)')]
+            if 'result' not in columns:
+                self.db.execute("ALTER TABLE transactions ADD COLUMN result TEXT NOT NULL DEFAULT ''")
+                self.db.execute("UPDATE transactions SET result = json_extract(data, '$.outcome.result')")
+        if version < self.schemaVersion:
+            self.db.execute(f'PRAGMA user_version = {self.schemaVersion}')
+
+    def getSyncedLedger(self, account: str) -> int:
+        ''' Returns the last ledger up to which the history of an account is
+        complete. Transactions stored from other sources, like the account
+        stream, do not move it
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT ledgerVersion FROM sync WHERE account = ?',
+                                  (account,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def setSyncedLedger(self, account: str, ledgerVersion: int):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO sync VALUES (?, ?)', (account, ledgerVersion))
+
+    def add(self, account: str, transactions: list) -> int:
+        ''' Stores the given transactions, ignoring the ones already stored.
+        Returns the number of new transactions
+        '''
+        rows = [(account, tx['id'], tx['outcome']['ledgerVersion'],
+                 tx['outcome'].get('indexInLedger', 0), tx['outcome']['result'], json.dumps(tx))
+                for tx in transactions]
+        with self.lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany('INSERT OR IGNORE INTO transactions '
+                                '(account, id, ledgerVersion, indexInLedger, result, data) '
+                                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            return self.db.total_changes - before
+
+    def getAccountInfo(self, account: str) -> dict:
+        ''' Returns the last stored account info of an account, or None
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT info FROM accounts WHERE account = ?',
+                                  (account,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def setAccountInfo(self, account: str, info: dict):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO accounts VALUES (?, ?)',
+                            (account, json.dumps(info)))
+
+    def count(self, account: str, result: str=None) -> int:
+        query = 'SELECT COUNT(*) FROM transactions WHERE account = ?'
+        params = (account,)
+        if result is not None:
+            query += ' AND result = ?'
+            params += (result,)
+        with self.lock:
+            return self.db.execute(query, params).fetchone()[0]
+
+    def getTransactions(self, account: str, result: str=None,
+                        offset: int=0, limit: int=-1) -> list:
+        ''' Returns the stored transactions of an account, newest first,
+        optionally restricted to a result code and to a page of the history
+        '''
+        query = 'SELECT data FROM transactions WHERE account = ?'
+        params = (account,)
+        if result is not None:
+            query += ' AND result = ?'
+            params += (result,)
+        query += ' ORDER BY ledgerVersion DESC, indexInLedger DESC LIMIT ? OFFSET ?'
+        params += (limit, offset)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, account: str, id: str) -> dict:
+        ''' Returns a stored transaction of an account by id, or None
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT data FROM transactions WHERE account = ? AND id = ?',
+                                  (account, id)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    columnsQuery = ("SELECT id, ledgerVersion, indexInLedger, "
+                    "CAST(strftime('%s', json_extract(data, '$.outcome.timestamp')) AS INTEGER), "
+                    "CAST(ROUND(json_extract(data, '$.outcome.deliveredAmount.value') * 1000000) "
+                    "AS INTEGER), "
+                    "CAST(ROUND(json_extract(data, '$.outcome.fee') * 1000000) AS INTEGER), "
+                    "json_extract(data, '$.specification.source.address'), "
+                    "json_extract(data, '$.specification.destination.address') "
+                    "FROM transactions ")
+
+    def getColumns(self, account: str, result: str=None,
+                   afterLedger: int=-1, afterIndex: int=-1) -> list:
+        ''' Returns the fields of the transactions of an account stored after
+        the given ledger version and index in ledger, oldest first, as tuples of
+        (id, ledgerVersion, indexInLedger, epoch timestamp, delivered drops,
+        fee drops, source address, destination address), extracted without
+        decoding the stored JSON in Python
+        '''
+        query = self.columnsQuery + 'WHERE account = ?'
+        params = (account,)
+        if result is not None:
+            query += ' AND result = ?'
+            params += (result,)
+        # Compared as a row value, so the range is a search of the index
+        query += (' AND (ledgerVersion, indexInLedger) > (?, ?)'
+                  ' ORDER BY ledgerVersion, indexInLedger')
+        params += (afterLedger, afterIndex)
+        with self.lock:
+            return self.db.execute(query, params).fetchall()
+
+    def getColumnsSince(self, account: str, result: str=None, afterRow: int=0) -> tuple:
+        ''' Returns the fields of the transactions of an account stored since
+        the given row, like getColumns, and the last row stored, to pass as
+        afterRow next time. Rows are numbered in storing order and never
+        deleted, so the new ones are read without going through the history
+        '''
+        with self.lock:
+            lastRow = self.db.execute('SELECT MAX(rowid) FROM transactions').fetchone()[0] or 0
+            if lastRow <= afterRow:
+                return [], lastRow
+            # A "+" keeps the account off the index, so only the new rows are scanned
+            column = '' if afterRow == 0 else '+'
+            query = self.columnsQuery + f'WHERE {column}account = ?'
+            params = (account,)
+            if result is not None:
+                query += f' AND {column}result = ?'
+                params += (result,)
+            query += ' AND rowid > ? AND rowid <= ? ORDER BY ledgerVersion, indexInLedger'
+            params += (afterRow, lastRow)
+            return self.db.execute(query, params).fetchall(), lastRow
+
+    def getTransactionsAfter(self, account: str, afterLedger: int=-1, afterIndex: int=-1,
+                             limit: int=1000) -> list:
+        ''' Returns up to limit stored transactions of an account after the
+        given ledger version and index in ledger, oldest first, to page
+        through the whole history without growing offsets
+        '''
+        with self.lock:
+            rows = self.db.execute('SELECT data FROM transactions WHERE account = ? '
+                                   'AND (ledgerVersion > ? OR (ledgerVersion = ? AND indexInLedger > ?)) '
+                                   'ORDER BY ledgerVersion, indexInLedger LIMIT ?',
+                                   (account, afterLedger, afterLedger, afterIndex, limit)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def getBySequence(self, account: str, sequence: int) -> dict:
+        ''' Returns the stored transaction sent by an account with the given
+        sequence number, or None
+        '''
+        with self.lock:
+            row = self.db.execute("SELECT data FROM transactions WHERE account = ? "
+                                  "AND json_extract(data, '$.address') = ? "
+                                  "AND json_extract(data, '$.sequence') = ?",
+                                  (account, account, sequence)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
@@ -0,0 +1,145 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QBrush, QColor
+
+hex_colors = {'green': '#c4df9b',
+              'red': '#f6989d',
+              'white': '#ffffff'}
+
+brushes = {color: QBrush(QColor(hex_colors[color])) for color in hex_colors}
+
+
+def getRuns(flags: list) -> list:
+    ''' Returns the (first, last) index pairs of the runs of true flags
+    '''
+    runs = []
+    for i, flag in enumerate(flags):
+        if not flag:
+            continue
+        if runs and runs[-1][1] == i - 1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
+
+
+class TransactionsModel(QAbstractTableModel):
+    ''' Table model over the active account transactions that exposes the
+    history in pages as the view scrolls and formats rows only when the view
+    asks for them.
+
+    The rows refer to the history shown last. update moves them to the
+    current history of the controller by transaction id, inserting and
+    removing only the rows that differ, so the view keeps its selection.
+    Meanwhile rows maps every row to its history and index, so the model is
+    consistent after each step for the views and listeners of its signals
+    '''
+    pageSize = 200
+
+    def __init__(self, controller):
+        super().__init__()
+        self.controller = controller
+        self.history = None
+        self.loadedRows = 0
+        self.rows = None
+
+    def getHistory(self):
+        if self.controller.transactions['status'] == 'error':
+            return None
+        return self.controller.getHistory()
+
+    def getCount(self) -> int:
+        return len(self.history) if self.history is not None else 0
+
+    def reset(self):
+        self.beginResetModel()
+        self.history = self.getHistory()
+        self.loadedRows = min(self.pageSize, self.getCount())
+        self.endResetModel()
+
+    def update(self, anchor: int=-1) -> int:
+        ''' Brings the rows up to date with the current history. Returns the
+        new row of the transaction at row anchor, or -1 if it is gone
+        '''
+        old, history = self.history, self.getHistory()
+        if history is old:
+            return anchor
+        if old is None or history is None or old.account != history.account or \
+           not self.loadedRows or not len(history):
+            self.reset()
+            return -1
+
+        # Usually the new history only adds transactions on top
+        added = len(history) - len(old)
+        if added >= 0 and history.getKey(added) == old.getKey(0) and \
+           history.getKey(len(history) - 1) == old.getKey(len(old) - 1):
+            if added:
+                self.beginInsertRows(QModelIndex(), 0, added - 1)
+                self.history, self.loadedRows = history, self.loadedRows + added
+                self.endInsertRows()
+            else:
+                self.history = history
+            return anchor + added if anchor >= 0 else anchor
+
+        # Otherwise, diffs the loaded rows by id. Both are in the same order
+        oldKeys = [old.getKey(i) for i in range(self.loadedRows)]
+        self.rows = [(old, i) for i in range(self.loadedRows)]
+        newKeys = [history.getKey(i) for i in range(min(len(history),
+                                                        self.loadedRows + max(0, added)))]
+        anchorKey = oldKeys[anchor] if 0 <= anchor < len(oldKeys) else None
+        kept = set(newKeys).intersection(oldKeys)
+        for first, last in reversed(getRuns([key not in kept for key in oldKeys])):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.rows[first:last + 1]
+            self.loadedRows -= last - first + 1
+            self.endRemoveRows()
+        # Kept rows are in the same order in both, so the rows before each
+        # inserted run are already the new ones
+        for first, last in getRuns([key not in kept for key in newKeys]):
+            self.beginInsertRows(QModelIndex(), first, last)
+            self.rows[first:first] = [(history, i) for i in range(first, last + 1)]
+            self.loadedRows += last - first + 1
+            self.endInsertRows()
+        self.history, self.rows = history, None
+        if anchorKey in kept:
+            return newKeys.index(anchorKey)
+        return -1
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loadedRows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.rows is None and self.loadedRows < self.getCount()
+
+    def fetchMore(self, parent=QModelIndex()):
+        rows = min(self.pageSize, self.getCount() - self.loadedRows)
+        if rows <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loadedRows, self.loadedRows + rows - 1)
+        self.loadedRows += rows
+        self.endInsertRows()
+
+    def getRow(self, row: int) -> tuple:
+        ''' Returns the history and index of the transaction at a row
+        '''
+        if self.rows is not None:
+            return self.rows[row]
+        return self.history, row
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.loadedRows:
+            return None
+        if role == Qt.DisplayRole:
+            return self.controller.formatTransaction(*self.getRow(index.row()))
+        elif role == Qt.ForegroundRole:
+            text = self.controller.formatTransaction(*self.getRow(index.row()))
+            if '+' in text:
+                return brushes['green']
+            elif '-' in text:
+                return brushes['red']
+            return brushes['white']
+        elif role == Qt.TextAlignmentRole:
+            return Qt.AlignVCenter | Qt.AlignHCenter
+        return None
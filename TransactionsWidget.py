@@ -1,9 +1,16 @@
 from pyqtspinner.spinner import WaitingSpinner
-from PyQt5.QtCore import Qt, QSize, QRegExp
-from PyQt5.QtGui import QColor, QFont, QIcon, QValidator, QRegExpValidator, QBrush
+from TransactionsModel import TransactionsModel
+from BatchPaymentDialog import BatchPaymentDialog
+from ExportDialog import ExportDialog
+from Metrics import metrics
+import json
+import threading
+import time
+from PyQt5.QtCore import Qt, QModelIndex, QSize, QRegExp, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QIcon, QValidator, QRegExpValidator
 from PyQt5.QtWidgets import (QLabel, QMessageBox, QLineEdit, QWidget, QStackedWidget,
-                            QPushButton, QVBoxLayout, QHBoxLayout, QTableWidget,
-                            QHeaderView, QTableWidgetItem, QMenu, QApplication)
+                            QPushButton, QVBoxLayout, QHBoxLayout, QTableView,
+                            QHeaderView, QMenu, QApplication, QPlainTextEdit, QSplitter)
 
 hex_colors = {'grey': '#353535',
               'green': '#c4df9b',
@@ -12,8 +19,39 @@ hex_colors = {'grey': '#353535',
               'white95': '#f2f2f2'}
 
 
+def formatDetails(tx: dict) -> str:
+    ''' Returns the main fields of a transaction followed by its full data
+    '''
+    if tx['status'] == 'error':
+        return tx.get('message', 'Unknown error')
+    specification, outcome = tx.get('specification', {}), tx.get('outcome', {})
+    source = specification.get('source', {})
+    destination = specification.get('destination', {})
+    amount = outcome.get('deliveredAmount') or source.get('maxAmount') or {}
+    fields = [('ID', tx.get('id')),
+              ('Type', tx.get('type')),
+              ('Result', outcome.get('result')),
+              ('Date', outcome.get('timestamp')),
+              ('Ledger', outcome.get('ledgerVersion')),
+              ('From', source.get('address', tx.get('address'))),
+              ('Source tag', source.get('tag')),
+              ('To', destination.get('address')),
+              ('Destination tag', destination.get('tag')),
+              ('Amount', f"{amount.get('value')} {amount.get('currency')}" if amount else None),
+              ('Fee', f"{outcome.get('fee')} XRP" if 'fee' in outcome else None),
+              ('Sequence', tx.get('sequence'))]
+    lines = [f'{name + ":":<17}{value}' for name, value in fields if value is not None]
+    if 'message' in tx:
+        lines.insert(0, tx['message'] + '\n')
+    data = {key: value for key, value in tx.items() if key not in ('status', 'message')}
+    return '\n'.join(lines) + '\n\n' + json.dumps(data, indent=2)
+
+
 class TransactionsWidget(QStackedWidget):
 
+    paymentSignal = pyqtSignal(dict)
+    detailSignal = pyqtSignal(str, dict)
+    prefetchRows = 5  # Details fetched ahead above and below the selection
     sendButtonEnableConditions = [False, False]
     spinner = None
 
@@ -29,7 +67,6 @@ class TransactionsWidget(QStackedWidget):
 
         # Balance amount label
         self.balaceAmountLabel = QLabel()
-        self.balaceAmountLabel.setText(f'{self.controller.getBalance()} XRP')
         self.balaceAmountLabel.setAlignment(Qt.AlignCenter)
         font = QFont()
         font.setPointSize(20)
@@ -42,27 +79,59 @@ class TransactionsWidget(QStackedWidget):
         balanceLayout.setContentsMargins(0, 10, 0, 10)
 
         # Transactions label
-        transactionsLabel = QLabel('Transactions')
-        transactionsLabel.setAlignment(Qt.AlignCenter)
-        transactionsLabel.setContentsMargins(0, 0, 0, 10)
+        self.transactionsLabel = QLabel('Transactions')
+        self.transactionsLabel.setAlignment(Qt.AlignCenter)
+        self.transactionsLabel.setContentsMargins(0, 0, 0, 10)
+
+        # Filter bar
+        self.filterEdit = QLineEdit()
+        self.filterEdit.setClearButtonEnabled(True)
+        self.filterEdit.setPlaceholderText('Filter: address, 2020-06 or 2020-06-01..2020-06-15, '
+                                           '>100, <=5 or 10..20 XRP')
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(150)  # Waits for a pause in typing
+        self.filterTimer.timeout.connect(self.on_filter_changed)
+        self.filterEdit.textChanged.connect(self.filterTimer.start)
 
         # Transactions table
-        self.tableWidget = QTableWidget()
-        self.tableWidget.setColumnCount(1)
-        self.tableWidget.verticalHeader().setVisible(False)
-        self.tableWidget.horizontalHeader().setVisible(False)
-        self.tableWidget.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.tableWidget.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.tableModel = TransactionsModel(self.controller)
+        self.tableView = QTableView()
+        self.tableView.setModel(self.tableModel)
+        self.tableView.verticalHeader().setVisible(False)
+        self.tableView.horizontalHeader().setVisible(False)
+        self.tableView.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.tableView.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.tableView.setSelectionBehavior(QTableView.SelectRows)
+        self.tableView.setSelectionMode(QTableView.SingleSelection)
+        self.tableView.setMouseTracking(True)  # Hovered rows are prefetched
+        self.tableView.entered.connect(self.on_row_hovered)
+        self.tableView.selectionModel().currentRowChanged.connect(self.on_row_selected)
         self.populateTable()
         monofont = QFont()
         monofont.setFamily("Courier New")
         monofont.setPointSize(10)
-        self.tableWidget.setFont(monofont)
+        self.tableView.setFont(monofont)
+
+        # Transaction detail pane
+        self.detailId = None
+        self.detailView = QPlainTextEdit()
+        self.detailView.setReadOnly(True)
+        self.detailView.setFont(monofont)
+        self.detailView.setPlaceholderText('Select a transaction to see its details')
+        self.detailSignal.connect(self.on_details)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.tableView)
+        splitter.addWidget(self.detailView)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
 
         # Transactions layout
         transactionsLayout = QVBoxLayout()
-        transactionsLayout.addWidget(transactionsLabel)
-        transactionsLayout.addWidget(self.tableWidget)
+        transactionsLayout.addWidget(self.transactionsLabel)
+        transactionsLayout.addWidget(self.filterEdit)
+        transactionsLayout.addWidget(splitter)
         transactionsLayout.setContentsMargins(0, 0, 0, 0)
 
         # Send label A
@@ -112,6 +181,25 @@ class TransactionsWidget(QStackedWidget):
         self.sendButton.setIconSize(QSize(24,24))
         self.sendButton.clicked.connect(self.on_send_clicked)
         self.sendButton.setEnabled(False)
+        self.paymentSignal.connect(self.on_payment_result)
+
+        # Batch payment button
+        self.batchButton = QPushButton()
+        self.batchButton.setMaximumSize(40, 40)
+        batchIcon = QIcon.fromTheme("document-open")
+        self.batchButton.setIcon(batchIcon)
+        self.batchButton.setIconSize(QSize(24,24))
+        self.batchButton.clicked.connect(self.on_batch_clicked)
+        self.batchButton.setToolTip('Send a batch of payments from a CSV file')
+
+        # Export button
+        self.exportButton = QPushButton()
+        self.exportButton.setMaximumSize(40, 40)
+        exportIcon = QIcon.fromTheme("document-save-as")
+        self.exportButton.setIcon(exportIcon)
+        self.exportButton.setIconSize(QSize(24,24))
+        self.exportButton.clicked.connect(lambda: ExportDialog(self.controller, self).exec_())
+        self.exportButton.setToolTip('Export the full history to CSV, JSON Lines or Parquet')
 
         # Send layout
         sendLayout = QHBoxLayout()
@@ -121,6 +209,8 @@ class TransactionsWidget(QStackedWidget):
         sendLayout.addWidget(self.sendAddress, 4)
         sendLayout.addWidget(self.sendTag, 1)
         sendLayout.addWidget(self.sendButton)
+        sendLayout.addWidget(self.batchButton)
+        sendLayout.addWidget(self.exportButton)
         sendLayout.setContentsMargins(0, 0, 0, 0)
 
         # Info layout
@@ -155,11 +245,33 @@ class TransactionsWidget(QStackedWidget):
         self.addWidget(spinnerWidget)
         self.setCurrentIndex(0)
 
-    def switchWidget(self):
-        if self.currentIndex() == 0:
-            self.setCurrentIndex(1)
-        else:
-            self.setCurrentIndex(0)
+    def showInfo(self):
+        self.setCurrentIndex(0)
+
+    def showSpinner(self):
+        self.setCurrentIndex(1)
+
+    def showStoredBalance(self):
+        ''' Shows the stored balance of the active account while its stored
+        transactions are loaded
+        '''
+        self.balaceAmountLabel.setText(f'{self.controller.getBalance()} XRP')
+        self.balaceAmountLabel.setStyleSheet('')
+        self.balaceAmountLabel.setToolTip('')
+        self.populateTable()
+        self.transactionsLabel.setText('Transactions (loading)')
+        self.showInfo()
+
+    def showStale(self, since: float, error: str=None):
+        ''' Greys out the balance of an account that could not be refreshed
+        '''
+        message = 'Not refreshed'
+        if since is not None:
+            message += f' since {time.strftime("%H:%M:%S", time.localtime(since))}'
+        if error:
+            message += f': {error}'
+        self.balaceAmountLabel.setStyleSheet(f"color: {hex_colors['grey']}")
+        self.balaceAmountLabel.setToolTip(message)
 
     def on_send_clicked(self):
         confirmAlert = QMessageBox()
@@ -173,38 +285,97 @@ class TransactionsWidget(QStackedWidget):
         result = confirmAlert.exec_()
 
         if result == QMessageBox.Ok:
-            payment = self.controller.sendPayment(self.sendAmount.text(),
-                                                  self.sendAddress.text(),
-                                                  self.sendTag.text())
-            alert = QMessageBox()
-            alert.setWindowTitle('Send payment')
-            if payment['status'] == 'ok':
-                alert.setText('Payment sent!')
-                alert.setIcon(QMessageBox.Information)
-                self.sendAmount.setText('')
-                self.sendAddress.setText('')
-                self.sendTag.setText('')
-                self.refreshSignal.emit()
-            else:
-                alert.setWindowTitle('Something went wrong')
-                alert.setText(payment['message'])
-                alert.setIcon(QMessageBox.Critical)
-            alert.exec_()
+            self.sendButton.setEnabled(False)
+            amount, address, tag = self.sendAmount.text(), self.sendAddress.text(), self.sendTag.text()
+            threading.Thread(target=lambda: self.paymentSignal.emit(
+                self.controller.sendPayment(amount, address, tag,
+                                            onValidated=self.refreshSignal.emit)),
+                             daemon=True).start()
+
+    def on_payment_result(self, payment: dict):
+        alert = QMessageBox()
+        alert.setWindowTitle('Send payment')
+        if payment['status'] == 'ok':
+            alert.setText('Payment sent!')
+            alert.setIcon(QMessageBox.Information)
+            self.sendAmount.setText('')
+            self.sendAddress.setText('')
+            self.sendTag.setText('')
+            self.refreshSignal.emit()
+        else:
+            self.sendButton.setEnabled(True)
+            alert.setWindowTitle('Something went wrong')
+            alert.setText(payment['message'])
+            alert.setIcon(QMessageBox.Critical)
+        alert.exec_()
+
+    def on_batch_clicked(self):
+        BatchPaymentDialog(self.controller, self).exec_()
+        self.refreshSignal.emit()
 
     def populateTable(self):
-        txs = self.controller.getFormattedTransactions()
-        self.tableWidget.setRowCount(len(txs))
-
-        for i in range(len(txs)):
-            item = QTableWidgetItem(txs[i])
-            if '+' in txs[i]:
-                item.setForeground(QBrush(QColor(hex_colors['green'])))
-            elif '-' in txs[i]:
-                item.setForeground(QBrush(QColor(hex_colors['red'])))
-            else:
-                item.setForeground(QBrush(QColor(hex_colors['white'])))
-            item.setTextAlignment(Qt.AlignVCenter | Qt.AlignHCenter)
-            self.tableWidget.setItem(i, 0, item)
+        self.tableModel.reset()
+        self.updateLabel()
+
+    def updateTable(self):
+        ''' Updates the table with the transactions that changed, keeping the
+        selection and, unless scrolled to the top, the rows in view
+        '''
+        scrollBar = self.tableView.verticalScrollBar()
+        top = self.tableView.rowAt(0) if scrollBar.value() > 0 else -1
+        row = self.tableModel.update(top)
+        if top >= 0 and row >= 0:
+            self.tableView.scrollTo(self.tableModel.index(row, 0), QTableView.PositionAtTop)
+        self.updateLabel()
+
+    def updateLabel(self):
+        total = self.controller.getTotalTransactionCount()
+        shown = self.controller.getTransactionCount()
+        if shown == total:
+            self.transactionsLabel.setText('Transactions')
+        else:
+            self.transactionsLabel.setText(f'Transactions ({shown} of {total})')
+
+    def on_filter_changed(self):
+        self.controller.setFilter(self.filterEdit.text())
+        self.populateTable()
+
+    def on_row_selected(self, current: QModelIndex, previous: QModelIndex):
+        row = current.row()
+        if row < 0 or row >= self.controller.getTransactionCount():
+            return
+        id = self.controller.getTxIDByIndex(row)
+        self.detailId = id
+        details = self.controller.getCachedTransactionDetails(id)
+        if details is not None:
+            self.detailView.setPlainText(formatDetails(details))
+        else:
+            self.detailView.setPlainText('Loading...')
+            account = self.controller.activeAccount
+            future = self.controller.api.submit(self.controller.getTransactionDetails, account, id)
+            future.add_done_callback(lambda future: self.on_details_done(id, future))
+
+        count = self.controller.getTransactionCount()
+        rows = [row + offset for distance in range(1, self.prefetchRows + 1)
+                for offset in (distance, -distance) if 0 <= row + offset < count]
+        self.controller.prefetchTransactionDetails([self.controller.getTxIDByIndex(i) for i in rows])
+
+    def on_row_hovered(self, index: QModelIndex):
+        if 0 <= index.row() < self.controller.getTransactionCount():
+            self.controller.prefetchTransactionDetails([self.controller.getTxIDByIndex(index.row())])
+
+    def on_details_done(self, id: str, future):
+        ''' Hands the details fetched in the API pool to the GUI thread
+        '''
+        try:
+            details = future.result()
+        except Exception as e:
+            details = {'status': 'error', 'message': f'Cannot load the transaction: {e}'}
+        self.detailSignal.emit(id, details)
+
+    def on_details(self, id: str, details: dict):
+        if id == self.detailId:
+            self.detailView.setPlainText(formatDetails(details))
 
     def contextMenuEvent(self, event):
         menu = QMenu(self)
@@ -213,8 +384,11 @@ class TransactionsWidget(QStackedWidget):
         copyIDAction = menu.addAction('Copy transaction ID')
         gp = event.globalPos()
         action = menu.exec_(gp)
-        vp_pos = self.tableWidget.viewport().mapFromGlobal(gp)
-        row = self.tableWidget.rowAt(vp_pos.y())
+        vp_pos = self.tableView.viewport().mapFromGlobal(gp)
+        row = self.tableView.rowAt(vp_pos.y())
+        # The rows shown may be left from data that is no longer available
+        if row < 0 or row >= self.controller.getTransactionCount():
+            return
 
         if action == openAction:
             self.controller.openTransactionInBrowser(row)
@@ -259,12 +433,18 @@ class TransactionsWidget(QStackedWidget):
         for data in [self.controller.account_info, self.controller.transactions]:
             if data['status'] == 'error':
                 result['status'] = 'error'
-                result['message'] = self.api.get_error_message(data)
+                result['message'] = self.controller.api.get_error_message(data)
                 break
 
         if result['status'] == 'ok':
-            self.balaceAmountLabel.setText(f'{self.controller.getBalance()} XRP')
-            self.populateTable()
+            with metrics.span('zerpy_render_seconds'):
+                self.balaceAmountLabel.setText(f'{self.controller.getBalance()} XRP')
+                self.balaceAmountLabel.setStyleSheet('')
+                self.balaceAmountLabel.setToolTip('')
+                self.updateTable()
+            if self.controller.fetchError is not None:
+                # The last refresh failed, the data shown is the one before it
+                self.showStale(self.controller.fetchTime, self.controller.fetchError)
         else:
             confirmAlert = QMessageBox()
             confirmAlert.setWindowTitle('Something went wrong')
@@ -1,14 +1,24 @@
+import time
+startTime = time.perf_counter()  # Taken before the heavy imports to measure the time to first paint
+
+from AccountsModel import AccountsModel, AddressRole
 from Controller import Controller
-from ConfigManager import ConfigManager
+from ConfigManager import ConfigManager, ConfigError
+from MessageBox import showMessageBox
+from Metrics import metrics
+from StatsDialog import StatsDialog
+from TaskScheduler import TaskScheduler
 import sys
-import threading
-import re
 import argparse
 from TransactionsWidget import TransactionsWidget
-from PyQt5.QtCore import Qt, QSize, pyqtSignal
+from PyQt5.QtCore import Qt, QModelIndex, QSize, QTimer, pyqtSignal
 from PyQt5.QtGui import QPalette, QColor, QIcon
 from PyQt5.QtWidgets import (QLabel, QMessageBox, QWidget, QPushButton, QVBoxLayout,
-                             QHBoxLayout, QComboBox, QMenu, QApplication)
+                             QHBoxLayout, QComboBox, QCompleter, QMenu, QApplication)
+
+firstPaintBudget = 0.5  # Seconds from start to the first painted window
+stallBudget = 0.05  # Seconds the event loop may be held up
+stallCheckInterval = 0.02
 
 
 class MainWindow(QWidget):
@@ -16,11 +26,58 @@ class MainWindow(QWidget):
     '''
     newDataSignal = pyqtSignal()
     refreshSignal = pyqtSignal()
+    pushSignal = pyqtSignal(str)
+    staleSignal = pyqtSignal(str)
 
-    def __init__(self, config):
+    def __init__(self, config, startTime: float=startTime):
         super().__init__()
+        self.startTime = startTime
+        self.firstPaintTime = None
+        self.refreshStarted = {}
         self.controller = Controller(config)
+        if config.worker:
+            self.controller.startWorker()
+        self.scheduler = TaskScheduler(config.workers)
         self.initUI()
+        self.showAccount(self.controller.activeAccount)
+        if config.refreshRate is not None:
+            # Also fetches the other accounts, within the refresh rate budget
+            self.controller.autoRefresh(self.pushSignal.emit, self.staleSignal.emit,
+                                        config.refreshRate)
+        else:
+            self.prefetch()
+        if config.subscribe:
+            self.controller.subscribe(self.pushSignal.emit)
+        if config.metricsPort is not None:
+            try:
+                metrics.serve(config.metricsPort)
+            except OSError as e:
+                print(f'Warning: cannot serve the metrics on port {config.metricsPort}: {e}',
+                      file=sys.stderr)
+
+        # Event loop stalls, measured as the lateness of a periodic timer
+        self.lastStallCheck = time.perf_counter()
+        self.stallTimer = QTimer(self)
+        self.stallTimer.setInterval(int(stallCheckInterval * 1000))
+        self.stallTimer.timeout.connect(self.on_stall_check)
+        self.stallTimer.start()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.firstPaintTime is None:
+            self.firstPaintTime = time.perf_counter() - self.startTime
+            metrics.observe('zerpy_first_paint_seconds', self.firstPaintTime)
+            if self.firstPaintTime > firstPaintBudget:
+                print(f'Warning: first paint took {self.firstPaintTime * 1000:.0f} ms, '
+                      f'over the {firstPaintBudget * 1000:.0f} ms budget', file=sys.stderr)
+
+    def on_stall_check(self):
+        now = time.perf_counter()
+        stall = max(0.0, now - self.lastStallCheck - stallCheckInterval)
+        self.lastStallCheck = now
+        metrics.observe('zerpy_gui_stall_seconds', stall)
+        if stall > stallBudget:
+            metrics.increment('zerpy_gui_stalls_over_budget_total')
 
     def initUI(self):
         # Window size and title
@@ -33,17 +90,30 @@ class MainWindow(QWidget):
         addressLabel = QLabel('Address')
         addressLabel.setAlignment(Qt.AlignCenter)
 
-        # Address dropdown
+        # Address dropdown, searchable by address or alias
+        self.accountsModel = AccountsModel(self.controller.config.accounts)
         self.addressDropdown = QComboBox(self)
-        for address in self.controller.config.data['accounts']:
-            item = address
-            if 'alias' in self.controller.config.data['accounts'][address]:
-                item += f"  ({self.controller.config.data['accounts'][address]['alias']})"
-            self.addressDropdown.addItem(item)
-        self.addressDropdown.setCurrentText(self.controller.activeAccount)
+        # Sized without measuring every account, and made editable before it
+        # gets the model so the default completer does not scan it either
+        self.addressDropdown.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
+        self.addressDropdown.setMinimumContentsLength(40)
+        self.addressDropdown.setEditable(True)
+        self.addressDropdown.setInsertPolicy(QComboBox.NoInsert)
+        completer = QCompleter(self.accountsModel, self.addressDropdown)
+        completer.setFilterMode(Qt.MatchContains)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        completer.activated[QModelIndex].connect(self.on_account_completed)
+        self.addressDropdown.setCompleter(completer)
+        self.addressDropdown.setModel(self.accountsModel)
+        self.addressDropdown.view().setUniformItemSizes(True)
+        self.addressDropdown.setMaxVisibleItems(20)
+        self.addressDropdown.setCurrentIndex(self.accountsModel.getRow(self.controller.activeAccount))
         self.addressDropdown.activated.connect(self.on_dropdown_change)
+        self.addressDropdown.lineEdit().editingFinished.connect(self.on_account_edited)
         self.addressDropdown.setContextMenuPolicy(Qt.CustomContextMenu)
         self.addressDropdown.customContextMenuRequested.connect(self.on_dropdown_context_menu)
+        self.addressDropdown.lineEdit().setContextMenuPolicy(Qt.CustomContextMenu)
+        self.addressDropdown.lineEdit().customContextMenuRequested.connect(self.on_dropdown_context_menu)
 
         # Refresh button
         self.refreshButton = QPushButton()
@@ -54,11 +124,31 @@ class MainWindow(QWidget):
         self.refreshButton.clicked.connect(self.refresh_data)
         self.refreshButton.setToolTip('Refresh balance and transactions')
 
+        # Statistics button
+        self.statsButton = QPushButton()
+        self.statsButton.setMaximumSize(40, 40)
+        statsIcon = QIcon.fromTheme("utilities-system-monitor")
+        self.statsButton.setIcon(statsIcon)
+        self.statsButton.setIconSize(QSize(24,24))
+        self.statsButton.clicked.connect(lambda: StatsDialog(self).exec_())
+        self.statsButton.setToolTip('Show statistics')
+
+        # Analytics button
+        self.analyticsButton = QPushButton()
+        self.analyticsButton.setMaximumSize(40, 40)
+        analyticsIcon = QIcon.fromTheme("x-office-spreadsheet")
+        self.analyticsButton.setIcon(analyticsIcon)
+        self.analyticsButton.setIconSize(QSize(24,24))
+        self.analyticsButton.clicked.connect(self.on_analytics_clicked)
+        self.analyticsButton.setToolTip('Balance history, daily flow and counterparties')
+
         # Address layout
         addressLayout = QHBoxLayout()
         addressLayout.addWidget(addressLabel, 1)
         addressLayout.addWidget(self.addressDropdown, 7)
         addressLayout.addWidget(self.refreshButton)
+        addressLayout.addWidget(self.analyticsButton)
+        addressLayout.addWidget(self.statsButton)
 
         # Transactions widget
         self.transactionsWidget = TransactionsWidget(self.controller, self.refreshSignal)
@@ -71,33 +161,120 @@ class MainWindow(QWidget):
 
         # New data signal
         self.newDataSignal.connect(self.transactionsWidget.on_new_data)
-        self.newDataSignal.connect(self.transactionsWidget.switchWidget)
+        self.newDataSignal.connect(self.transactionsWidget.showInfo)
         self.newDataSignal.connect(lambda: self.refreshButton.setDisabled(False))
         self.newDataSignal.connect(lambda: self.addressDropdown.setDisabled(False))
 
         # Refresh signal
         self.refreshSignal.connect(self.refresh_data)
 
-    def update(self):
-        self.controller.update()
-        self.newDataSignal.emit()
+        # Push signal
+        self.pushSignal.connect(self.on_push)
+        self.staleSignal.connect(self.on_stale)
+
+    def showAccount(self, account: str):
+        ''' Makes an account the active one, shows its last known data right
+        away and refreshes it in the background. A history that is only in
+        the store is loaded in the background first, with the stored balance
+        shown meanwhile
+        '''
+        if self.controller.setActiveAccount(account, load=False):
+            self.transactionsWidget.on_new_data()
+            self.refresh_data(background=True)
+        elif self.controller.account_info['status'] == 'ok':
+            self.transactionsWidget.showStoredBalance()
+            self.scheduler.schedule(f'load:{account}', lambda: self.controller.getSnapshot(account),
+                                    lambda snapshot: self.on_loaded(account),
+                                    self.on_task_failed)
+        else:
+            self.refresh_data()
+
+    def on_loaded(self, account: str):
+        if account == self.controller.activeAccount:
+            self.showAccount(account)
 
-    def refresh_data(self):
+    def prefetch(self):
+        ''' Refreshes the snapshots of the other accounts in the background
+        '''
+        accounts = [account for account in self.controller.config.accounts
+                    if account != self.controller.activeAccount]
+        self.scheduler.schedule('prefetch', lambda: self.controller.updateAll(accounts))
+
+    def refresh_data(self, background: bool=False):
         self.refreshButton.setDisabled(True)
-        self.addressDropdown.setDisabled(True)
-        self.transactionsWidget.switchWidget()
-        threading.Thread(target=self.update, daemon=True).start()
+        if not background:
+            self.addressDropdown.setDisabled(True)
+            self.transactionsWidget.showSpinner()
+        account = self.controller.activeAccount
+        self.refreshStarted.setdefault(account, time.perf_counter())
+        # Fetching another account supersedes the fetches of the previous ones
+        self.scheduler.schedule(f'fetch:{account}', lambda: self.controller.fetchAccount(account),
+                                lambda snapshot: self.on_snapshot(account),
+                                self.on_task_failed, group='activeAccount')
+
+    def on_snapshot(self, account: str):
+        if account == self.controller.activeAccount:
+            self.controller.setActiveAccount(account)
+            self.newDataSignal.emit()
+        started = self.refreshStarted.pop(account, None)
+        if started is not None:
+            # From the refresh request to the rendered result
+            metrics.observe('zerpy_refresh_seconds', time.perf_counter() - started)
+
+    def on_analytics_clicked(self):
+        from AnalyticsDialog import AnalyticsDialog  # Loads NumPy on first use
+        AnalyticsDialog(self.controller, self.newDataSignal, self).exec_()
+
+    def on_task_failed(self, message: str):
+        self.refreshStarted.clear()
+        self.transactionsWidget.showInfo()
+        self.refreshButton.setDisabled(False)
+        self.addressDropdown.setDisabled(False)
+        QMessageBox.critical(self, 'Something went wrong', message)
+
+    def on_push(self, account: str):
+        # A history still being loaded from the store is shown once loaded
+        if account == self.controller.activeAccount and \
+           self.controller.setActiveAccount(account, load=False):
+            self.transactionsWidget.on_new_data()
+
+    def on_stale(self, account: str):
+        if account == self.controller.activeAccount and self.controller.refresher is not None:
+            status = self.controller.refresher.getStatus(account)
+            self.transactionsWidget.showStale(status['staleSince'], status['error'])
+
+    def closeEvent(self, event):
+        self.scheduler.cancelAll()
+        self.controller.unsubscribe()
+        self.controller.stopAutoRefresh()
+        self.controller.stopWorker()
+        self.controller.stopValidation()
+        metrics.stop()
+        super().closeEvent(event)
+
+    def on_account_completed(self, index: QModelIndex):
+        row = self.accountsModel.getRow(index.data(AddressRole))
+        self.addressDropdown.setCurrentIndex(row)
+        self.on_dropdown_change()
+
+    def on_account_edited(self):
+        # Typed text that matches no account falls back to the active one
+        row = self.accountsModel.getRow(self.controller.activeAccount)
+        if self.addressDropdown.currentText() != self.accountsModel.labels[row]:
+            self.addressDropdown.setCurrentIndex(row)
+            self.addressDropdown.setEditText(self.accountsModel.labels[row])
 
     def on_dropdown_change(self):
-        address = str(self.addressDropdown.currentText())
-        address = re.sub(r'\s*\(.*\)', '', address)  # Remove alias
-        self.controller.setActiveAccount(address)
-        self.refresh_data()
+        address = self.addressDropdown.currentData(AddressRole)
+        if address is None:
+            return
+        # Selecting the shown account again refreshes it
+        self.showAccount(address)
 
     def on_dropdown_context_menu(self, event):
         menu = QMenu(self)
         copyAddressAction = menu.addAction('Copy account address')
-        action = menu.exec_(self.mapToGlobal(event))
+        action = menu.exec_(self.sender().mapToGlobal(event))
 
         if action == copyAddressAction:
             address = self.controller.activeAccount
@@ -127,7 +304,11 @@ if __name__ == '__main__':
     parser.add_argument('configFileName', default='.secret_config.js', nargs='?',
                         help='Configuration file')
     args = parser.parse_args()
-    cfg = ConfigManager.fromFile(args.configFileName)
+    try:
+        cfg = ConfigManager.fromFile(args.configFileName)
+    except ConfigError as e:
+        showMessageBox('Error', str(e), 'critical')
+        sys.exit(f'Error: {e}')
     app = QApplication(sys.argv)
     app.setPalette(getPalette())
     window = MainWindow(cfg)
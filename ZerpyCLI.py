@@ -0,0 +1,238 @@
+from ConfigManager import ConfigManager, ConfigError
+from datetime import datetime
+import argparse
+import json
+import sys
+
+# Controller and its dependencies are imported by the commands that need them,
+# so a call like "balance" only pays for what it uses. PyQt is never imported
+
+
+def fail(message: str, code: int=1):
+    print(f'Error: {message}', file=sys.stderr)
+    return code
+
+
+def getAccount(config: ConfigManager, account: str) -> str:
+    if account is None:
+        return next(iter(config.accounts))
+    if account not in config.accounts:
+        raise ConfigError(f'Account "{account}" is not in configuration file "{config.fileName}".')
+    return account
+
+
+def parseSince(since: str):
+    ''' Returns ('ledger', number) for a ledger version or ('time', epoch) for
+    an ISO 8601 date or datetime, in local time unless it has an offset
+    '''
+    if since.isdigit():
+        return 'ledger', int(since)
+    try:
+        return 'time', datetime.fromisoformat(since).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid ledger or date: "{since}"')
+
+
+def balance(args, config: ConfigManager) -> int:
+    from Controller import Controller
+    controller = Controller(config)
+    accounts = list(config.accounts) if args.all else [getAccount(config, args.account)]
+    infos = controller.api.map(controller.api.get_account_info, accounts)
+    result, code = {}, 0
+    for account, info in zip(accounts, infos):
+        if info['status'] == 'error':
+            code = fail(f'{account}: {controller.api.get_error_message(info)}')
+            continue
+        result[account] = {'balance': f"{int(info['account_data']['Balance']) / 1e6:.6f}",
+                           'sequence': info['account_data']['Sequence']}
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for account in result:
+            print(f"{account}  {result[account]['balance']} XRP")
+    return code
+
+
+def txs(args, config: ConfigManager) -> int:
+    from Controller import Controller
+    controller = Controller(config)
+    account = getAccount(config, args.account)
+    controller.activeAccount = account
+    if args.offline:
+        transactions = controller.loadHistory(account)
+    else:
+        response = controller.syncTransactions(account)
+        if response['status'] == 'error':
+            return fail(controller.api.get_error_message(response))
+        transactions = response['transactions']
+
+    records, rows = [], []
+    for i in range(len(transactions)):
+        record = controller.getTransactionRecord(transactions, i)
+        if args.since is not None:
+            kind, value = args.since
+            # The history is sorted newest first, so stop at the first older one
+            if (kind == 'ledger' and record['ledger'] < value) or \
+               (kind == 'time' and record['time'] < value):
+                break
+        records.append(record)
+        if not args.json:
+            rows.append(controller.formatTransaction(transactions, i))
+        if args.limit is not None and len(records) >= args.limit:
+            break
+
+    if args.json:
+        print(json.dumps(records))
+    else:
+        print('\n'.join(rows))
+    return 0
+
+
+def send(args, config: ConfigManager) -> int:
+    from Controller import Controller
+    controller = Controller(config)
+    controller.activeAccount = getAccount(config, args.account)
+    # Nothing is cached past this command, so the validation is not awaited
+    result = controller.sendPayment(args.amount, args.destination, args.tag, watch=False)
+    if args.json:
+        print(json.dumps(result))
+    if result['status'] == 'error':
+        return fail(result['message'])
+    return 0
+
+
+def batch(args, config: ConfigManager) -> int:
+    from Controller import Controller
+    from BatchPayments import BatchPayment, loadPayments
+    controller = Controller(config)
+    account = getAccount(config, args.account)
+    try:
+        payments = loadPayments(args.paymentsFileName)
+    except (ValueError, OSError) as e:
+        return fail(str(e), 2)
+
+    def onProgress(payment):
+        if args.json:
+            print(json.dumps({key: payment[key] for key in
+                              ('line', 'destination', 'amount', 'tag', 'sequence', 'state', 'message')}),
+                  flush=True)
+        else:
+            print(f"{payment['line']:>6} {payment['destination']:<35} {payment['amount']:>16} "
+                  f"{payment['state']:<10} {payment['message']}", flush=True)
+
+    batchPayment = BatchPayment(controller, account, payments,
+                                args.journal or args.paymentsFileName + '.journal',
+                                args.window, onProgress)
+    try:
+        payments = batchPayment.run()
+    except RuntimeError as e:
+        return fail(str(e))
+    if any(payment['state'] != 'paid' for payment in payments):
+        return 1
+    return 0
+
+
+def export(args, config: ConfigManager) -> int:
+    from Controller import Controller
+    from Export import Export
+    controller = Controller(config)
+    account = getAccount(config, args.account)
+
+    def onProgress(rows, total):
+        if args.json:
+            print(json.dumps({'rows': rows, 'total': total}), flush=True)
+        else:
+            print(f'\rExported {rows}' + (f' of {total}' if total is not None else '') +
+                  ' transactions', end='', file=sys.stderr, flush=True)
+
+    try:
+        exporter = Export(controller, account, args.fileName, args.format, args.source,
+                          onProgress=onProgress)
+        if args.source == 'store' and not args.offline:
+            response = controller.syncStore(account)
+            if response['status'] == 'error':
+                return fail(controller.api.get_error_message(response))
+        rows = exporter.run(resume=not args.restart)
+    except ValueError as e:
+        return fail(str(e), 2)
+    except (RuntimeError, OSError) as e:
+        return fail(str(e))
+    if not args.json:
+        print(f'\rExported {rows} transactions to {args.fileName}', file=sys.stderr)
+    return 0
+
+
+def getParser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', default='.secret_config.js', help='Configuration file')
+    common.add_argument('--json', action='store_true', help='Machine-readable output')
+    common.add_argument('--metrics', metavar='FILE',
+                        help='Write the request timings and counters to FILE as JSON')
+    parser = argparse.ArgumentParser(prog='zerpy', description='Headless Zerpy')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('balance', parents=[common], help='Show account balances')
+    command.add_argument('--account', help='Account (default: first in the configuration)')
+    command.add_argument('--all', action='store_true', help='All configured accounts')
+    command.set_defaults(function=balance)
+
+    command = commands.add_parser('txs', parents=[common],
+                                  help='Show successful transactions, newest first')
+    command.add_argument('--account', help='Account (default: first in the configuration)')
+    command.add_argument('--since', type=parseSince,
+                         help='Only from this ledger version or ISO 8601 date on')
+    command.add_argument('--limit', type=int, help='Maximum number of transactions')
+    command.add_argument('--offline', action='store_true',
+                         help='Read the local store without syncing')
+    command.set_defaults(function=txs)
+
+    command = commands.add_parser('send', parents=[common], help='Send a payment')
+    command.add_argument('amount', help='Amount in XRP')
+    command.add_argument('destination', help='Destination address')
+    command.add_argument('--tag', default='', help='Destination tag')
+    command.add_argument('--account', help='Source account (default: first in the configuration)')
+    command.set_defaults(function=send)
+
+    command = commands.add_parser('batch', parents=[common],
+                                  help='Send or resume the payments of a CSV file '
+                                       '(destination, amount, tag)')
+    command.add_argument('paymentsFileName', help='CSV file with the payments')
+    command.add_argument('--account', help='Source account (default: first in the configuration)')
+    command.add_argument('--journal', help='Journal used to resume the batch '
+                                           '(default: <paymentsFileName>.journal)')
+    command.add_argument('--window', type=int, default=8, help='Payments in flight at a time')
+    command.set_defaults(function=batch)
+
+    command = commands.add_parser('export', parents=[common],
+                                  help='Export the full history to CSV (.csv), JSON Lines '
+                                       '(.jsonl) or a Parquet dataset (.parquet), resuming an '
+                                       'interrupted export of the same file')
+    command.add_argument('fileName', help='Output file, its extension selects the format')
+    command.add_argument('--account', help='Account (default: first in the configuration)')
+    command.add_argument('--format', choices=['csv', 'jsonl', 'parquet'],
+                         help='Output format (default: from the file extension)')
+    command.add_argument('--source', choices=['store', 'api'], default='store',
+                         help='Read from the local store, synced first, or page the API directly')
+    command.add_argument('--offline', action='store_true',
+                         help='Export the local store without syncing')
+    command.add_argument('--restart', action='store_true',
+                         help='Start over instead of resuming an interrupted export')
+    command.set_defaults(function=export)
+    return parser
+
+
+def main(argv: list=None) -> int:
+    args = getParser().parse_args(argv)
+    try:
+        config = ConfigManager.fromFile(args.config)
+        return args.function(args, config)
+    except ConfigError as e:
+        return fail(str(e), 2)
+    finally:
+        if args.metrics:
+            from Metrics import metrics
+            metrics.dump(args.metrics)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
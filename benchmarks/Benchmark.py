@@ -0,0 +1,286 @@
+from MockXrpApi import MockXrpApi
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConfigManager import ConfigManager
+from Metrics import metrics
+from Controller import Controller
+from ApiClient import ApiClient
+from TransactionStore import TransactionStore
+from BatchPayments import BatchPayment
+
+
+def measure(function, repeat: int=1, setup=None) -> dict:
+    ''' Runs a function repeat times and returns its timings in seconds
+    '''
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings),
+            'max': max(timings), 'repeat': repeat}
+
+
+def getVersion() -> str:
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def benchmarkController(mock: MockXrpApi, controller: Controller, repeat: int) -> dict:
+    results = {}
+    account = controller.activeAccount
+    mockAccount = mock.accounts[account]
+    results['update_cold'] = measure(controller.update)
+    results['update_warm'] = measure(controller.update, repeat, controller.cache.clear)
+    results['update_cached'] = measure(controller.update, repeat)
+
+    def addPayments():
+        for i in range(5):
+            mockAccount.submitPayment({'destination_address': mockAccount.counterparties[i],
+                                       'source_amount': {'currency': 'XRP', 'value': '1'},
+                                       'destination_amount': {'currency': 'XRP', 'value': '1'}},
+                                      None)
+        # Payments made behind the controller back, so its cached responses are stale
+        controller.invalidateAccount(account)
+    results['update_5_new'] = measure(controller.update, repeat, addPayments)
+    results['format_cold'] = measure(controller.getFormattedTransactions, repeat,
+                                     controller.formatCache.clear)
+    results['format_warm'] = measure(controller.getFormattedTransactions, repeat)
+    return results
+
+
+def benchmarkGUI(controller: Controller, repeat: int) -> dict:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtCore import QObject, pyqtSignal
+        from PyQt5.QtWidgets import QApplication
+        from TransactionsWidget import TransactionsWidget
+    except ImportError as e:
+        return {'gui': {'skipped': str(e)}}
+
+    class Signals(QObject):
+        refreshSignal = pyqtSignal()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    signals = Signals()
+    widget = TransactionsWidget(controller, signals.refreshSignal)
+    widget.resize(750, 700)
+    widget.show()
+    app.processEvents()
+
+    def populate():
+        widget.populateTable()
+        app.processEvents()  # Lets the view query and paint the visible rows
+
+    results = {'populate_table': measure(populate, repeat)}
+
+    accounts = list(controller.config.data['accounts'])
+    controller.updateAll()
+    switches = iter(accounts * repeat)
+
+    def switch():
+        controller.setActiveAccount(next(switches))
+        widget.on_new_data()
+        app.processEvents()
+
+    results['account_switch'] = measure(switch, repeat)
+    widget.close()
+    return results
+
+
+def benchmarkStall(transactions: int, directory: str) -> dict:
+    ''' Event loop stalls while an account is fetched from scratch, with the
+    fetch in a thread and in the worker process. The mock server runs in its
+    own process, like a real one, so that it does not hold the GIL here
+    '''
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtCore import QTimer
+        from PyQt5.QtWidgets import QApplication
+    except ImportError as e:
+        return {'gui_stall': {'skipped': str(e)}}
+
+    with socket.socket() as probe:
+        probe.bind(('localhost', 0))
+        port = probe.getsockname()[1]
+    configFileName = os.path.join(directory, 'stall.js')
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), 'MockXrpApi.py'),
+                               '--transactions', str(transactions), '--port', str(port),
+                               '--config', configFileName], stdout=subprocess.PIPE, text=True)
+    server.stdout.readline()  # Serving, once the configuration is written
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = {}
+    try:
+        for mode in ('thread', 'worker'):
+            config = ConfigManager.fromFile(configFileName)
+            controller = Controller(config, TransactionStore(os.path.join(directory, f'{mode}.db')))
+            if mode == 'worker':
+                controller.startWorker()
+            stalls = []
+            last = [time.perf_counter()]
+
+            def check():
+                now = time.perf_counter()
+                stalls.append(max(0.0, now - last[0] - 0.01))
+                last[0] = now
+            timer = QTimer()
+            timer.setInterval(10)
+            timer.timeout.connect(check)
+            timer.start()
+
+            thread = threading.Thread(target=controller.fetchAccount, args=(controller.activeAccount,))
+            start = time.perf_counter()
+            thread.start()
+            while thread.is_alive():
+                app.processEvents()
+                time.sleep(0.001)
+            controller.setActiveAccount(controller.activeAccount)
+            seconds = time.perf_counter() - start
+            timer.stop()
+            controller.stopWorker()
+            stalls.sort()
+            results[f'gui_stall_{mode}'] = {'seconds': seconds, 'max_stall': stalls[-1],
+                                            'p99_stall': stalls[int(len(stalls) * 0.99)],
+                                            'transactions': controller.getTotalTransactionCount()}
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def benchmarkPayments(controller: Controller, mock: MockXrpApi, payments: int, window: int,
+                      directory: str) -> dict:
+    account = controller.activeAccount
+    counterparties = mock.accounts[account].counterparties
+    rows = [{'key': f'{i}', 'line': i + 1, 'destination': counterparties[i % len(counterparties)],
+             'amount': '1.5', 'tag': '', 'state': 'pending', 'sequence': None, 'maxLedger': None,
+             'message': ''}
+            for i in range(payments)]
+    batch = BatchPayment(controller, account, rows, os.path.join(directory, 'batch.journal'), window)
+    start = time.perf_counter()
+    batch.run()
+    seconds = time.perf_counter() - start
+    paid = sum(payment['state'] == 'paid' for payment in rows)
+    return {'payment_batch': {'seconds': seconds, 'payments': payments, 'paid': paid,
+                              'payments_per_second': payments / seconds}}
+
+
+def benchmarkServers(repeat: int) -> dict:
+    ''' Account reads from several mock servers serving the same account: one
+    that always fails, one that is slow now and then and one that is steady
+    '''
+    failing = MockXrpApi([100], errorRate=1.0)
+    erratic = MockXrpApi([100], latency=0.01, jitter=0.4)
+    steady = MockXrpApi([100], latency=0.05)
+    urls = [mock.start() for mock in (failing, erratic, steady)]
+    account = next(iter(steady.accounts))
+    results = {}
+
+    client = ApiClient([urls[0], urls[2]], maxRetries=1)
+    results['failover_read'] = measure(lambda: client.get_account_info(account), repeat)
+    client.close()
+
+    for name, hedgeDelay in (('unhedged_read', None), ('hedged_read', 0.08)):
+        client = ApiClient(urls[1:], hedgeDelay=hedgeDelay)
+        # Starts out preferring the erratic server
+        client.servers[0].latency, client.servers[1].latency = 0.0, 0.05
+        results[name] = measure(lambda: client.get_account_info(account), repeat * 4)
+        client.close()
+
+    for mock in (failing, erratic, steady):
+        mock.stop()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    ''' Returns the benchmarks whose median got slower than the baseline by
+    more than the tolerance
+    '''
+    regressions = []
+    for name, result in results['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'median' not in result or 'median' not in base:
+            continue
+        if result['median'] > base['median'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['median'] * 1000:.2f} ms, "
+                               f"baseline {base['median'] * 1000:.2f} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Zerpy benchmarks against a local mock xrp-api server')
+    parser.add_argument('--transactions', type=int, default=10000,
+                        help='Transactions in the history of the benchmarked account')
+    parser.add_argument('--accounts', type=int, default=4, help='Number of configured accounts')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--payments', type=int, default=200, help='Payments in the batch benchmark')
+    parser.add_argument('--window', type=int, default=8, help='Payments in flight at a time')
+    parser.add_argument('--no-gui', action='store_true', help='Skip the offscreen Qt benchmarks')
+    parser.add_argument('--output', help='Write the JSON results to this file')
+    parser.add_argument('--compare', help='Baseline JSON results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline, as a fraction')
+    args = parser.parse_args()
+
+    counts = [args.transactions] + [min(args.transactions, 1000)] * (args.accounts - 1)
+    mock = MockXrpApi(counts, latency=args.latency)
+    mock.start()
+    with tempfile.TemporaryDirectory() as directory:
+        config = ConfigManager.fromFile(mock.writeConfig(os.path.join(directory, 'config.js')))
+        controller = Controller(config, TransactionStore(os.path.join(directory, 'store.db')))
+
+        results = benchmarkController(mock, controller, args.repeat)
+        if not args.no_gui:
+            results.update(benchmarkGUI(controller, args.repeat))
+            results.update(benchmarkStall(args.transactions, directory))
+        controller.setActiveAccount(next(iter(config.accounts)))
+        results.update(benchmarkPayments(controller, mock, args.payments, args.window, directory))
+        mock.stop()
+    results.update(benchmarkServers(args.repeat))
+
+    output = {'version': getVersion(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'parameters': vars(args),
+              'requests': mock.requests,
+              'bytesReceived': mock.bytesSent,
+              'results': results,
+              'metrics': metrics.toDict()}
+    text = json.dumps(output, indent=4)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            outfile.write(text)
+    print(text)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            regressions = compare(output, json.load(infile), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
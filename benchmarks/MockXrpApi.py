@@ -0,0 +1,453 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import argparse
+import base64
+import bisect
+import hashlib
+import json
+import random
+import socket
+import struct
+import threading
+import time
+
+ADDRESS_ALPHABET = 'rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz'
+FIRST_LEDGER = 1000000
+RIPPLE_EPOCH = 946684800
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def makeAddress(seed: int) -> str:
+    rng = random.Random(seed)
+    return 'r' + ''.join(rng.choice(ADDRESS_ALPHABET[1:]) for _ in range(33))
+
+
+class MockAccount:
+    ''' Synthetic account history. Transaction i is derived from its index, so
+    histories of millions of transactions cost no memory until payments are
+    submitted to the account. The synthetic transactions have a ledger each,
+    then a ledger closes every ledgerSeconds with the payments submitted
+    meanwhile
+    '''
+    ledgerSeconds = 3.5
+    def __init__(self, index: int, address: str, count: int, counterparties: int=50,
+                 onApply=None):
+        self.index = index
+        self.address = address
+        self.count = count
+        # Seeded apart from the account addresses, so no account pays itself
+        self.counterparties = [makeAddress(10 ** 9 + index * 100000 + i)
+                               for i in range(counterparties)]
+        self.submitted = []
+        self.ledgers = []  # Of the submitted payments
+        self.created = time.monotonic()
+        self.held = {}
+        self.sequence = count + 1
+        self.balance = 100000 * 10 ** 6
+        self.onApply = onApply
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count + len(self.submitted)
+
+    def makeId(self, i: int) -> str:
+        return f'{self.index:08X}{i:056X}'
+
+    def parseId(self, id: str) -> int:
+        return int(id[8:], 16)
+
+    def getTransaction(self, i: int) -> dict:
+        if i >= self.count:
+            return self.submitted[i - self.count]
+        counterparty = self.counterparties[i % len(self.counterparties)]
+        outgoing = i % 3 == 0
+        source, destination = (self.address, counterparty) if outgoing else (counterparty, self.address)
+        amount = f'{(i % 997 + 1) * 1.25:.6f}'
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                                  time.gmtime(RIPPLE_EPOCH + 600000000 + i * 60))
+        return {'type': 'payment',
+                'address': source,
+                'sequence': i + 1,
+                'id': self.makeId(i),
+                'specification': {'source': {'address': source,
+                                             'maxAmount': {'currency': 'XRP', 'value': amount}},
+                                  'destination': {'address': destination}},
+                'outcome': {'result': 'tesSUCCESS' if i % 50 else 'tecUNFUNDED_PAYMENT',
+                            'timestamp': timestamp,
+                            'fee': '0.000012',
+                            'ledgerVersion': FIRST_LEDGER + i,
+                            'indexInLedger': 0,
+                            'deliveredAmount': {'currency': 'XRP', 'value': amount}}}
+
+    def getValidatedLedger(self) -> int:
+        return FIRST_LEDGER + self.count + int((time.monotonic() - self.created) / self.ledgerSeconds)
+
+    def submitPayment(self, payment: dict, sequence: int, maxLedgerVersion: int=None) -> dict:
+        ''' Applies a payment like rippled does: a sequence ahead of the account
+        is held until the missing ones arrive, a past one is rejected, and so
+        is one whose maxLedgerVersion has passed
+        '''
+        with self.lock:
+            if sequence is None:
+                sequence = self.sequence
+            if maxLedgerVersion is not None and maxLedgerVersion <= self.getValidatedLedger():
+                return {'engine_result': 'tefMAX_LEDGER',
+                        'engine_result_message': 'Ledger sequence too high.'}
+            if sequence < self.sequence or sequence in self.held:
+                return {'engine_result': 'tefPAST_SEQ',
+                        'engine_result_message': 'This sequence number has already passed.'}
+            if sequence > self.sequence:
+                self.held[sequence] = payment
+                return {'engine_result': 'terPRE_SEQ',
+                        'engine_result_message': 'Missing/inapplicable prior transaction.'}
+            self.apply(payment)
+            while self.sequence in self.held:
+                self.apply(self.held.pop(self.sequence))
+        return {'engine_result': 'tesSUCCESS',
+                'engine_result_message': 'The transaction was applied.',
+                'tx_json': {'Sequence': sequence}}
+
+    def apply(self, payment: dict):
+        i = len(self)
+        ledger = self.getValidatedLedger()
+        indexInLedger = len(self.ledgers) - bisect.bisect_left(self.ledgers, ledger)
+        self.ledgers.append(ledger)
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+        self.submitted.append({'type': 'payment',
+                               'address': self.address,
+                               'sequence': self.sequence,
+                               'id': self.makeId(i),
+                               'specification': {'source': {'address': self.address},
+                                                 'destination': {'address': payment['destination_address']}},
+                               'outcome': {'result': 'tesSUCCESS',
+                                           'timestamp': timestamp,
+                                           'fee': '0.000012',
+                                           'ledgerVersion': ledger,
+                                           'indexInLedger': indexInLedger,
+                                           'deliveredAmount': payment['destination_amount']}})
+        self.sequence += 1
+        self.balance -= int(float(payment['source_amount']['value']) * 10 ** 6) + 12
+        if self.onApply is not None:
+            self.onApply(self, self.submitted[-1])
+
+    def getPage(self, minLedgerVersion: int, start: str, limit: int, earliestFirst: bool) -> list:
+        first = max(0, minLedgerVersion - FIRST_LEDGER)
+        if first >= self.count:
+            first = self.count + bisect.bisect_left(self.ledgers, minLedgerVersion)
+        last = len(self) - 1
+        if earliestFirst:
+            begin = self.parseId(start) if start else first
+            indexes = range(begin, min(last + 1, begin + limit))
+        else:
+            begin = self.parseId(start) if start else last
+            indexes = range(begin, max(first - 1, begin - limit), -1)
+        return [self.getTransaction(i) for i in indexes]
+
+
+def makeStreamMessage(account: MockAccount, tx: dict) -> dict:
+    ''' Returns the rippled account stream message of a transaction applied
+    to a mock account
+    '''
+    drops = str(round(float(tx['outcome']['deliveredAmount']['value']) * 10 ** 6))
+    return {'type': 'transaction',
+            'validated': True,
+            'ledger_index': tx['outcome']['ledgerVersion'],
+            'transaction': {'TransactionType': 'Payment',
+                            'Account': tx['address'],
+                            'Destination': tx['specification']['destination']['address'],
+                            'Amount': drops,
+                            'Fee': '12',
+                            'Sequence': tx['sequence'],
+                            'hash': tx['id'],
+                            'date': int(time.time()) - RIPPLE_EPOCH},
+            'meta': {'TransactionResult': tx['outcome']['result'],
+                     'TransactionIndex': tx['outcome']['indexInLedger'],
+                     'delivered_amount': drops,
+                     'AffectedNodes': [{'ModifiedNode': {
+                         'LedgerEntryType': 'AccountRoot',
+                         'FinalFields': {'Account': account.address,
+                                         'Balance': str(account.balance)}}}]}}
+
+
+class MockStream:
+    ''' Local stand-in for the WebSocket server of rippled. Answers account
+    stream subscriptions and pushes the messages given to publish to the
+    clients subscribed to the accounts involved
+    '''
+    def __init__(self, host: str='localhost', port: int=0):
+        self.server = socket.create_server((host, port))
+        self.clients = {}  # Socket: subscribed accounts
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.getsockname()[:2]
+        return f'ws://{host}:{port}'
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.close()
+        self.disconnect()
+
+    def disconnect(self):
+        ''' Drops all client connections, like a server restart
+        '''
+        with self.lock:
+            clients, self.clients = list(self.clients), {}
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+    def getSubscriptions(self) -> int:
+        with self.lock:
+            return sum(1 for accounts in self.clients.values() if accounts)
+
+    def publish(self, message: dict):
+        tx = message['transaction']
+        affected = {tx['Account'], tx.get('Destination')}
+        with self.lock:
+            clients = [client for client, accounts in self.clients.items() if affected & accounts]
+        for client in clients:
+            try:
+                self.send(client, message)
+            except OSError:
+                pass
+
+    def accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve, args=(client,), daemon=True).start()
+
+    def serve(self, client: socket.socket):
+        try:
+            request = b''
+            while b'\r\n\r\n' not in request:
+                data = client.recv(4096)
+                if not data:
+                    return
+                request += data
+            headers = dict(line.split(': ', 1) for line in request.decode().split('\r\n')[1:] if ': ' in line)
+            key = headers.get('Sec-WebSocket-Key', '')
+            accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+            client.sendall(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                            f'Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+            with self.lock:
+                self.clients[client] = set()
+                self.connections += 1
+            while True:
+                opcode, payload = self.receive(client)
+                if opcode == 8:
+                    return
+                if opcode != 1:
+                    continue
+                command = json.loads(payload)
+                if command.get('command') == 'subscribe':
+                    with self.lock:
+                        if client in self.clients:
+                            self.clients[client] |= set(command.get('accounts', []))
+                self.send(client, {'id': command.get('id'), 'status': 'success',
+                                   'type': 'response', 'result': {}})
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                self.clients.pop(client, None)
+            client.close()
+
+    def receive(self, client: socket.socket) -> tuple:
+        def read(size: int) -> bytes:
+            data = b''
+            while len(data) < size:
+                chunk = client.recv(size - len(data))
+                if not chunk:
+                    raise OSError('Connection closed')
+                data += chunk
+            return data
+
+        first, second = read(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', read(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', read(8))[0]
+        mask = read(4) if second & 0x80 else bytes(4)
+        payload = read(length)
+        return first & 0x0F, bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+
+    def send(self, client: socket.socket, message: dict):
+        payload = json.dumps(message).encode()
+        if len(payload) < 126:
+            header = struct.pack('>BB', 0x81, len(payload))
+        elif len(payload) < 65536:
+            header = struct.pack('>BBH', 0x81, 126, len(payload))
+        else:
+            header = struct.pack('>BBQ', 0x81, 127, len(payload))
+        client.sendall(header + payload)
+
+
+class MockXrpApi:
+    ''' Local stand-in for the xrp-api REST server, serving synthetic
+    accounts with a configurable latency and error rate. With stream, the
+    payments applied are also pushed by a MockStream
+    '''
+    def __init__(self, transactions: list, host: str='localhost', port: int=0,
+                 latency: float=0.0, jitter: float=0.0, errorRate: float=0.0, seed: int=0,
+                 stream: bool=False):
+        self.stream = MockStream(host) if stream else None
+        self.accounts = {}
+        for i, count in enumerate(transactions):
+            address = makeAddress(seed * 1000 + i)
+            self.accounts[address] = MockAccount(i, address, count, onApply=self.publish)
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.requests = 0
+        self.bytesSent = 0
+        self.server = ThreadingHTTPServer((host, port), self.makeHandler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> str:
+        if self.stream is not None:
+            self.stream.start()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.stream is not None:
+            self.stream.stop()
+
+    def publish(self, account: MockAccount, tx: dict):
+        if self.stream is not None:
+            self.stream.publish(makeStreamMessage(account, tx))
+
+    def writeConfig(self, fileName: str, **entries):
+        ''' Writes a Zerpy configuration file for the mock accounts
+        '''
+        server = self.stream.url if self.stream is not None else 'ws://localhost:0'
+        data = {'server': server, 'api': self.url,
+                'accounts': {address: {'apiKey': 'mock', 'secret': 'mock', 'alias': f'mock{i}'}
+                             for i, address in enumerate(self.accounts)}}
+        data.update(entries)
+        with open(fileName, 'w') as outfile:
+            outfile.write('module.exports = ' + json.dumps(data, indent=4))
+        return fileName
+
+    def handle(self, method: str, path: str, query: dict, body: dict):
+        parts = path.strip('/').split('/')
+        if parts[:2] == ['v3', 'accounts'] and len(parts) == 4 and parts[2] in self.accounts:
+            account = self.accounts[parts[2]]
+            if parts[3] == 'info':
+                return 200, {'account_data': {'Account': account.address,
+                                              'Balance': str(account.balance),
+                                              'Sequence': account.sequence},
+                             'ledger_index': account.getValidatedLedger(),
+                             'validated': True}
+            if parts[3] == 'transactions':
+                return 200, account.getPage(int(query.get('minLedgerVersion', 0)),
+                                            query.get('start'), int(query.get('limit', 10)),
+                                            query.get('earliestFirst') == 'true')
+        if parts[:2] == ['v3', 'transactions'] and len(parts) == 3:
+            for account in self.accounts.values():
+                if parts[2].startswith(f'{account.index:08X}'):
+                    i = account.parseId(parts[2])
+                    if i < len(account):
+                        return 200, account.getTransaction(i)
+            return 404, {'message': 'Transaction not found'}
+        if parts == ['v3', 'payments'] and method == 'POST':
+            payment = body['payment']
+            account = self.accounts.get(payment['source_address'])
+            if account is None:
+                return 400, {'message': 'Unknown source account'}
+            instructions = body.get('instructions', {})
+            return 200, account.submitPayment(payment, instructions.get('sequence'),
+                                              instructions.get('maxLedgerVersion'))
+        if parts == ['v3', 'servers', 'info']:
+            return 200, {'info': {'server_state': 'full'}}
+        return 404, {'message': f'No route for {method} {path}'}
+
+    def makeHandler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes, which Nagle would delay
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def serve(self, method: str):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length)) if length else {}
+                delay = mock.latency + random.uniform(0, mock.jitter)
+                if delay:
+                    time.sleep(delay)
+                mock.requests += 1
+                if random.random() < mock.errorRate:
+                    code, data = 503, {'message': 'Injected failure'}
+                else:
+                    code, data = mock.handle(method, url.path, query, body)
+                payload = json.dumps(data).encode()
+                mock.bytesSent += len(payload)
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self.serve('GET')
+
+            def do_POST(self):
+                self.serve('POST')
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the xrp-api server')
+    parser.add_argument('--transactions', type=int, nargs='+', default=[10000],
+                        help='Number of transactions of every synthetic account')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--stream', action='store_true',
+                        help='Also push the submitted payments from a WebSocket account stream')
+    parser.add_argument('--config', help='Write a Zerpy configuration file for the mock accounts')
+    args = parser.parse_args()
+
+    mock = MockXrpApi(args.transactions, port=args.port, latency=args.latency,
+                      jitter=args.jitter, errorRate=args.error_rate, stream=args.stream)
+    if mock.stream is not None:
+        mock.stream.start()
+        print(f'Streaming on {mock.stream.url}', flush=True)
+    if args.config:
+        mock.writeConfig(args.config)
+    print(f'Serving {len(mock.accounts)} accounts on {mock.url}', flush=True)
+    for address, account in mock.accounts.items():
+        print(f'  {address}  {account.count} transactions', flush=True)
+    mock.server.serve_forever()
@@ -0,0 +1,63 @@
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [root, os.path.join(root, 'benchmarks')]
+
+from ConfigManager import ConfigManager  # noqa: E402
+from MockXrpApi import MockXrpApi  # noqa: E402
+import pytest  # noqa: E402
+import time  # noqa: E402
+
+
+@pytest.fixture
+def mock():
+    mock = MockXrpApi([500, 300])
+    mock.start()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture
+def config(mock, tmp_path):
+    return ConfigManager.fromFile(mock.writeConfig(str(tmp_path / 'config.js')))
+
+
+@pytest.fixture
+def controller(config):
+    from Controller import Controller
+    controller = Controller(config)
+    yield controller
+    controller.api.close()
+    controller.store.close()
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+def pay(mock, source: str, count: int, destination: str=None) -> list:
+    ''' Applies count payments of 1 XRP from a mock account. Returns their
+    engine results
+    '''
+    account = mock.accounts[source]
+    destination = destination or account.counterparties[0]
+    payment = {'destination_address': destination,
+               'source_amount': {'currency': 'XRP', 'value': '1'},
+               'destination_amount': {'currency': 'XRP', 'value': '1'}}
+    return [account.submitPayment(payment, None)['engine_result'] for _ in range(count)]
+
+
+def processEventsUntil(condition, timeout: float=5) -> bool:
+    ''' Runs the Qt event loop until condition() is true or the timeout
+    passes. Returns condition()
+    '''
+    from PyQt5.QtCore import QCoreApplication
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+    return condition()
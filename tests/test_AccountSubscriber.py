@@ -0,0 +1,91 @@
+from AccountSubscriber import AccountSubscriber
+from ConfigManager import ConfigManager
+from Controller import Controller
+from MockXrpApi import MockXrpApi
+from conftest import pay
+import pytest
+import threading
+import time
+
+
+def waitFor(condition, timeout: float=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def mock():
+    mock = MockXrpApi([200, 100], stream=True)
+    mock.start()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture
+def controller(mock, tmp_path, monkeypatch):
+    monkeypatch.setattr(AccountSubscriber, 'reconnectDelay', 0.05)
+    config = ConfigManager.fromFile(mock.writeConfig(str(tmp_path / 'config.js')))
+    controller = Controller(config)
+    controller.updateAll()
+    controller.setActiveAccount(controller.activeAccount)
+    yield controller
+    controller.unsubscribe()
+    controller.api.close()
+    controller.store.close()
+
+
+def test_pushed_transaction_is_applied(mock, controller):
+    account = controller.activeAccount
+    before = controller.getSnapshot(account)['transactions']['transactions']
+    updates = []
+    controller.subscribe(updates.append)
+    waitFor(lambda: mock.stream.getSubscriptions() == 1)
+
+    pay(mock, account, 1)
+    waitFor(lambda: updates)
+    assert updates == [account]
+    snapshot = controller.getSnapshot(account)
+    assert snapshot['account_info']['account_data']['Balance'] == str(mock.accounts[account].balance)
+    history = snapshot['transactions']['transactions']
+    assert len(history) == len(before) + 1
+    assert history.getId(0) == mock.accounts[account].submitted[-1]['id']
+    assert controller.store.getSyncedLedger(account) < history.getLedger(0)
+
+
+def test_reconnect_resyncs_missed_transactions(mock, controller):
+    account = controller.activeAccount
+    updates = []
+    controller.subscribe(updates.append)
+    waitFor(lambda: mock.stream.getSubscriptions() == 1)
+
+    stream, mock.stream = mock.stream, None
+    pay(mock, account, 2)  # Missed by the stream
+    mock.stream = stream
+    stream.disconnect()
+    waitFor(lambda: updates)
+    assert stream.connections == 2
+    history = controller.getSnapshot(account)['transactions']['transactions']
+    assert history.getId(0) == mock.accounts[account].submitted[-1]['id']
+    assert controller.getSnapshot(account)['account_info']['account_data']['Balance'] == \
+        str(mock.accounts[account].balance)
+
+
+def test_resync_does_not_hold_up_pushed_transactions(mock, controller):
+    account = controller.activeAccount
+    resynced = threading.Event()
+    updateAll = controller.updateAll
+    controller.updateAll = lambda: (updateAll(), resynced.set())
+    updates = []
+    controller.subscribe(updates.append)
+    waitFor(lambda: mock.stream.getSubscriptions() == 1)
+
+    mock.latency = 0.5  # The resync takes seconds
+    mock.stream.disconnect()
+    waitFor(lambda: mock.stream.connections == 2 and mock.stream.getSubscriptions() == 1)
+    pay(mock, account, 1)
+    waitFor(lambda: updates, timeout=1.0)
+    assert not resynced.is_set()
+    history = controller.getSnapshot(account)['transactions']['transactions']
+    assert history.getId(0) == mock.accounts[account].submitted[-1]['id']
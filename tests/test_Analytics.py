@@ -0,0 +1,26 @@
+from Analytics import AccountAnalytics
+from array import array
+from TransactionHistory import TransactionHistory
+
+
+def makeHistory(drops: list, counterparties: list) -> TransactionHistory:
+    history = TransactionHistory.__new__(TransactionHistory)
+    history.account = 'rAccount'
+    history.origin = object()
+    history.length = len(drops)
+    history.ledgers = array('q', range(len(drops)))
+    history.times = array('q', range(len(drops)))
+    history.drops = array('q', drops)
+    history.fees = array('q', [0] * len(drops))
+    history.counterparties = array('I', counterparties)
+    history.addresses = ['rFirst', 'rSecond']
+    return history
+
+
+def test_counterparty_totals_are_exact_above_float_precision():
+    large = 2 ** 53 + 1
+    history = makeHistory([large, 1, -large, -1, 3], [0, 0, 1, 1, 1])
+    analytics = AccountAnalytics(history, 10 ** 17)
+    assert analytics.counterpartyIn.dtype == analytics.counterpartyOut.dtype == 'int64'
+    assert analytics.getTopCounterparties() == [('rSecond', 3, -large - 1, 3),
+                                                ('rFirst', large + 1, 0, 2)]
@@ -0,0 +1,73 @@
+from ApiClient import ApiClient, Server
+from MockXrpApi import MockXrpApi
+from Metrics import metrics
+import pytest
+import threading
+import time
+
+
+@pytest.fixture
+def servers():
+    mocks = [MockXrpApi([10]), MockXrpApi([10])]
+    for mock in mocks:
+        mock.start()
+    yield mocks
+    for mock in mocks:
+        mock.stop()
+
+
+def test_fails_over_to_the_next_server(servers):
+    down = MockXrpApi([10])
+    down.start()
+    down.stop()
+    client = ApiClient([down.url, servers[0].url])
+    address = next(iter(servers[0].accounts))
+    assert client.get_account_info(address)['status'] == 'ok'
+    assert not client.servers[0].healthy
+    assert client.url == servers[0].url
+    client.close()
+
+
+def test_lone_server_is_retried_after_the_cooldown(servers, monkeypatch):
+    monkeypatch.setattr(Server, 'cooldown', 0.1)
+    client = ApiClient(servers[0].url)
+    server = client.servers[0]
+    server.fail()
+    assert not server.healthy
+    time.sleep(0.15)
+    assert server.healthy
+    server.fail()
+    address = next(iter(servers[0].accounts))
+    assert client.get_account_info(address)['status'] == 'ok'
+    assert server.healthy
+    client.close()
+
+
+def test_server_updates_from_many_threads():
+    server = Server('http://localhost')
+    samples = [0.01 * (i % 10 + 1) for i in range(1000)]
+
+    def update(offset: int):
+        for i, seconds in enumerate(samples):
+            server.record(seconds)
+            if (i + offset) % 7 == 0:
+                server.fail()
+    threads = [threading.Thread(target=update, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert min(samples) <= server.latency <= max(samples)
+
+
+def test_hedged_read_is_answered_by_the_faster_server(servers):
+    servers[0].latency = 0.5
+    client = ApiClient([servers[0].url, servers[1].url], hedgeDelay=0.05)
+    address = next(iter(servers[0].accounts))  # Both mocks serve the same accounts
+    key = ('zerpy_api_hedged_total', (('endpoint', 'account_info'),))
+    hedged = metrics.counters.get(key, 0)
+    started = time.perf_counter()
+    assert client.get_account_info(address)['status'] == 'ok'
+    assert time.perf_counter() - started < 0.4
+    assert metrics.counters.get(key, 0) == hedged + 1
+    client.close()
@@ -0,0 +1,121 @@
+from BatchPayments import BatchPayment, loadPayments
+import json
+import pytest
+import time
+
+
+@pytest.fixture
+def batch(mock, controller, tmp_path):
+    def makeBatch(count: int) -> BatchPayment:
+        account = mock.accounts[controller.activeAccount]
+        fileName = tmp_path / 'payments.csv'
+        fileName.write_text('destination,amount\n' + ''.join(
+            f'{account.counterparties[i % 5]},{i + 1}\n' for i in range(count)))
+        return BatchPayment(controller, account.address, loadPayments(str(fileName)),
+                            str(tmp_path / 'payments.journal'))
+    return makeBatch
+
+
+def journal(batch: BatchPayment, payment: dict, **entry):
+    ''' Writes a journal entry like an interrupted run would have left
+    '''
+    entry = dict({'key': payment['key'], 'message': '', 'time': time.time()}, **entry)
+    with open(batch.journalFileName, 'a') as outfile:
+        outfile.write(json.dumps(entry) + '\n')
+
+
+def getApplied(account, payment: dict) -> list:
+    return [tx for tx in account.submitted
+            if tx['specification']['destination']['address'] == payment['destination'] and
+            tx['outcome']['deliveredAmount']['value'] == payment['amount']]
+
+
+def test_batch_pays_every_payment_once(mock, controller, batch):
+    account = mock.accounts[controller.activeAccount]
+    payments = batch(30).run()
+    assert [payment['state'] for payment in payments] == ['paid'] * 30
+    assert len(account.submitted) == 30
+    assert {tx['id'] for tx in account.submitted} == {payment['message'] for payment in payments}
+
+    payments = batch(30).run()
+    assert [payment['state'] for payment in payments] == ['paid'] * 30
+    assert len(account.submitted) == 30
+
+
+def test_payment_validated_during_the_resume_sync_is_not_sent_again(mock, controller, batch):
+    account = mock.accounts[controller.activeAccount]
+    first = batch(3)
+    payment = first.payments[0]
+    journal(first, payment, sequence=account.sequence, state='submitted',
+            maxLedger=account.getValidatedLedger() + 20)
+    original = dict(payment, sequence=account.sequence)
+
+    resumed = batch(3)
+    syncStore = controller.syncStore
+
+    def syncThenValidate(address):
+        result = syncStore(address)
+        if not account.submitted:
+            # The submission of the interrupted run validates right after the sync
+            account.submitPayment({'destination_address': original['destination'],
+                                   'source_amount': {'currency': 'XRP', 'value': original['amount']},
+                                   'destination_amount': {'currency': 'XRP',
+                                                          'value': original['amount']}},
+                                  original['sequence'])
+        return result
+    controller.syncStore = syncThenValidate
+
+    payments = resumed.run()
+    assert [payment['state'] for payment in payments] == ['paid'] * 3
+    assert len(getApplied(account, payments[0])) == 1
+    assert len(account.submitted) == 3
+
+
+def test_slow_submission_keeps_its_sequence(mock, controller, batch):
+    account = mock.accounts[controller.activeAccount]
+    first = batch(2)
+    payment = first.payments[0]
+    sequence = account.sequence + 1
+    # Sent an hour ago, behind a sequence that never arrived, and still valid
+    # for 20 more ledgers
+    journal(first, payment, sequence=sequence, state='submitting',
+            maxLedger=account.getValidatedLedger() + 20, time=time.time() - 3600)
+
+    resumed = batch(2)
+    submitPayment = controller.api.submit_payment
+    arrived = []
+
+    def arriveFirst(**kwargs):
+        if not arrived:
+            # The slow submission reaches the server before the batch resumes
+            arrived.append(account.submitPayment(
+                {'destination_address': payment['destination'],
+                 'source_amount': {'currency': 'XRP', 'value': payment['amount']},
+                 'destination_amount': {'currency': 'XRP', 'value': payment['amount']}},
+                sequence))
+        return submitPayment(**kwargs)
+    controller.api.submit_payment = arriveFirst
+
+    payments = resumed.run()
+    assert arrived[0]['engine_result'] == 'terPRE_SEQ'
+    assert [payment['state'] for payment in payments] == ['paid', 'paid']
+    assert payments[0]['sequence'] == sequence
+    assert len(getApplied(account, payments[0])) == 1
+    assert len(account.submitted) == 2
+
+
+def test_expired_submission_is_sent_again(mock, controller, batch):
+    account = mock.accounts[controller.activeAccount]
+    first = batch(2)
+    payment = first.payments[0]
+    # Never reached the server, and the ledgers it was valid for are validated
+    journal(first, payment, sequence=account.sequence + 5, state='submitted',
+            maxLedger=account.getValidatedLedger() - 1)
+
+    payments = batch(2).run()
+    assert [payment['state'] for payment in payments] == ['paid', 'paid']
+    assert len(getApplied(account, payments[0])) == 1
+    assert payments[0]['maxLedger'] > account.getValidatedLedger() - 2
+    entries = [json.loads(line) for line in open(first.journalFileName)]
+    assert all(entry['maxLedger'] is not None for entry in entries
+               if entry['state'] == 'submitting')
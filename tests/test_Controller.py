@@ -0,0 +1,99 @@
+from conftest import pay
+import threading
+import time
+
+
+def test_sync_fetches_and_reads_only_new_transactions(mock, controller):
+    account = controller.activeAccount
+    history = controller.syncTransactions(account)['transactions']
+    assert len(history) == controller.store.count(account, 'tesSUCCESS')
+    synced = controller.store.getSyncedLedger(account)
+
+    requests, reads = [], []
+    getPage, getColumns = controller.api.get_account_transactions, controller.store.getColumnsSince
+    controller.api.get_account_transactions = \
+        lambda address, minLedgerVersion=None, *args, **kwargs: \
+        requests.append(minLedgerVersion) or getPage(address, minLedgerVersion, *args, **kwargs)
+    controller.store.getColumnsSince = \
+        lambda *args: reads.append(getColumns(*args)) or reads[-1]
+
+    pay(mock, account, 3)
+    controller.invalidateAccount(account)
+    updated = controller.syncTransactions(account)['transactions']
+    assert requests == [synced]
+    assert [len(rows) for rows, lastRow in reads] == [3]
+    assert len(updated) == len(history) + 3
+    assert updated.getKey(3) == history.getKey(0)
+
+
+def test_payment_invalidates_accounts_once_validated(mock, controller):
+    account = controller.activeAccount
+    destination = mock.accounts[account].counterparties[0]
+    controller.validationPoll = 0.05
+    invalidated = []
+    controller.invalidateAccount = invalidated.append
+    # Cached from before the payment, for longer than the test
+    sequence = controller.api.get_account_info(account)['account_data']['Sequence']
+
+    validated = threading.Event()
+    threading.Thread(target=controller.awaitValidation,
+                     args=(account, destination, sequence, validated.set), daemon=True).start()
+    assert not validated.wait(0.3)
+    assert invalidated == []
+
+    pay(mock, account, 1, destination)
+    assert validated.wait(1)
+    assert invalidated == [account, destination]
+    assert controller.cache.peek(('account_info', account))['account_data']['Sequence'] == sequence
+
+    validated.clear()
+    assert controller.sendPayment('1', destination, '', onValidated=validated.set)['status'] == 'ok'
+    assert validated.wait(1)
+    assert invalidated[2:] == [account, destination]
+
+    # Waits are given up when stopped
+    waiting = controller.validationExecutor.submit(controller.awaitValidation,
+                                                   account, destination, sequence + 10)
+    while not waiting.running():
+        time.sleep(0.01)
+    controller.stopValidation()
+    assert waiting.result(timeout=1) is False
+
+
+def test_prefetches_leave_the_api_pool_free(controller):
+    release = threading.Event()
+    running, peak = [], []
+
+    def getTransaction(id):
+        running.append(id)
+        peak.append(len(running))
+        release.wait(5)
+        running.remove(id)
+        return {'status': 'ok'}
+    controller.api.get_transaction = getTransaction
+
+    controller.prefetchTransactionDetails([f'{i:064X}' for i in range(2 * controller.maxPrefetch)])
+    assert len(controller.prefetching) == controller.maxPrefetch
+    # The details of a clicked row do not wait for the prefetches
+    assert controller.api.submit(lambda: 'clicked').result(timeout=1) == 'clicked'
+    release.set()
+    controller.prefetchExecutor.shutdown(wait=True)
+    assert max(peak) <= 2 and not controller.prefetching
+
+
+def test_failed_fetch_keeps_the_last_data(controller):
+    account = controller.activeAccount
+    assert controller.getHistory() is None
+    assert controller.fetchAccount(account)['error'] is None
+    controller.setActiveAccount(account)
+    balance, count = controller.getBalance(), controller.getTransactionCount()
+
+    controller.cache.clear()
+    controller.api.get_account_info = lambda address: {'status': 'error', 'message': 'Unreachable'}
+    snapshot = controller.fetchAccount(account)
+    assert snapshot['account_info']['status'] == 'error' and snapshot['error'] == 'Unreachable'
+    controller.setActiveAccount(account)
+    assert controller.getBalance() == balance
+    assert controller.getTransactionCount() == count and controller.getTxIDByIndex(0)
+    assert controller.fetchError == 'Unreachable'
+    assert abs(controller.fetchTime - time.time()) < 5
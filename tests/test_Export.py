@@ -0,0 +1,87 @@
+from Export import Export
+import csv
+import json
+import os
+import pytest
+
+
+class Crash(Exception):
+    pass
+
+
+def crashAfter(batches: int):
+    def onProgress(rows, total):
+        if rows >= batches * 100:
+            raise Crash()
+    return onProgress
+
+
+def readIds(fileName: str, format: str) -> list:
+    with open(fileName, newline='') as infile:
+        if format == 'csv':
+            return [row['id'] for row in csv.DictReader(infile)]
+        return [json.loads(line)['id'] for line in infile]
+
+
+@pytest.fixture
+def account(controller):
+    account = controller.activeAccount
+    assert controller.syncStore(account)['status'] == 'ok'
+    return account
+
+
+def getStoredIds(controller, account: str) -> list:
+    return [tx['id'] for tx in controller.store.getTransactionsAfter(account, limit=10 ** 6)]
+
+
+@pytest.mark.parametrize('format', ['csv', 'jsonl'])
+def test_interrupted_export_resumes(controller, account, tmp_path, format):
+    fileName = str(tmp_path / f'export.{format}')
+    with pytest.raises(Crash):
+        Export(controller, account, fileName, batchSize=100, onProgress=crashAfter(2)).run()
+    with open(fileName + '.export') as infile:
+        assert json.load(infile)['rows'] == 200
+    # A batch torn by the crash is cut off on resume
+    with open(fileName, 'a') as outfile:
+        outfile.write('torn,row\n' if format == 'csv' else '{"id": "torn"')
+
+    exporter = Export(controller, account, fileName, batchSize=100)
+    rows = exporter.run()
+    ids = getStoredIds(controller, account)
+    assert rows == len(ids) == controller.store.count(account)
+    assert readIds(fileName, format) == ids
+    assert exporter.complete and not os.path.exists(fileName + '.export')
+
+
+def test_state_of_another_export_is_ignored(controller, account, tmp_path):
+    fileName = str(tmp_path / 'export.csv')
+    with pytest.raises(Crash):
+        Export(controller, account, fileName, batchSize=100, onProgress=crashAfter(2)).run()
+
+    # The state is for the store, so an export from the API starts over
+    assert Export(controller, account, fileName, source='api', batchSize=100).readState() is None
+    rows = Export(controller, account, fileName, source='api', batchSize=100).run()
+    assert readIds(fileName, 'csv') == getStoredIds(controller, account)
+    assert rows == controller.store.count(account)
+
+    # So does one with resume disabled
+    with pytest.raises(Crash):
+        Export(controller, account, fileName, batchSize=100, onProgress=crashAfter(3)).run()
+    Export(controller, account, fileName, batchSize=100).run(resume=False)
+    assert readIds(fileName, 'csv') == getStoredIds(controller, account)
+
+
+def test_interrupted_parquet_export_resumes(controller, account, tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    directory = str(tmp_path / 'export.parquet')
+    with pytest.raises(Crash):
+        Export(controller, account, directory, batchSize=100, onProgress=crashAfter(2)).run()
+    # Parts left by the crash, complete or not, are removed on resume
+    for name in ('part-00002.parquet', 'part-00003.parquet.tmp'):
+        with open(os.path.join(directory, name), 'w') as outfile:
+            outfile.write('partial')
+
+    Export(controller, account, directory, batchSize=100).run()
+    table = parquet.read_table(directory)
+    assert table.column('id').to_pylist() == getStoredIds(controller, account)
+    assert not any(name.endswith('.tmp') for name in os.listdir(directory))
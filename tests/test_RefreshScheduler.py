@@ -0,0 +1,112 @@
+from RefreshScheduler import RefreshScheduler
+import threading
+import time
+
+
+def makeSnapshot(balance: str='100', status: str='ok') -> dict:
+    info = {'status': status, 'account_data': {'Balance': balance}, 'message': 'Unreachable'}
+    return {'account_info': info,
+            'transactions': {'status': 'ok', 'transactions': []},
+            'time': time.monotonic()}
+
+
+def test_refreshes_stay_within_the_rate_budget(controller):
+    fetches = []
+    controller.fetchAccount = lambda account: fetches.append(account) or makeSnapshot()
+    scheduler = RefreshScheduler(controller, rate=5, minInterval=0.01, maxInterval=0.01)
+    scheduler.start()
+    time.sleep(1)
+    scheduler.stop()
+    # One token to start with plus rate a second
+    assert 2 <= len(fetches) <= 7
+    assert set(fetches) == set(controller.config.accounts)
+
+
+def test_errors_back_off_the_account_and_the_rate(controller):
+    account = controller.activeAccount
+    controller.fetchAccount = lambda account: makeSnapshot(status='error')
+    scheduler = RefreshScheduler(controller, minInterval=10, maxInterval=100)
+    for failures in (1, 2, 3):
+        started = time.monotonic()
+        scheduler.fetch(account)
+        state = scheduler.states[account]
+        assert state.failures == failures and state.error == 'Unreachable'
+        assert scheduler.rateFactor == 0.5 ** failures
+        delay = 10 * 2 ** failures
+        assert started + delay / 2 <= state.nextTime <= time.monotonic() + delay
+
+    controller.fetchAccount = lambda account: makeSnapshot()
+    scheduler.fetch(account)
+    assert scheduler.states[account].failures == 0
+    assert scheduler.rateFactor == 0.125 * 1.5
+
+
+def test_recent_snapshots_are_not_fetched(controller):
+    account = controller.activeAccount
+    scheduler = RefreshScheduler(controller, minInterval=10)
+    controller.snapshots[account] = makeSnapshot()
+
+    # Snapshots are read under the controller lock
+    checked = threading.Event()
+    with controller.snapshotsLock:
+        threading.Thread(target=lambda: scheduler.isRecent(account) and checked.set(),
+                         daemon=True).start()
+        assert not checked.wait(0.2)
+    assert checked.wait(1)
+    assert scheduler.states[account].nextTime > time.monotonic() + 9
+
+    controller.snapshots[account] = dict(makeSnapshot(), time=time.monotonic() - 10)
+    assert not scheduler.isRecent(account)
+
+
+def test_stale_accounts_are_reported_until_refreshed(controller):
+    account = controller.activeAccount
+    stale, refreshed = [], []
+    controller.fetchAccount = lambda account: makeSnapshot()
+    scheduler = RefreshScheduler(controller, minInterval=10,
+                                 onRefresh=refreshed.append, onStale=stale.append)
+    scheduler.fetch(account)
+    assert refreshed == [account]
+    controller.snapshots[account] = makeSnapshot()
+
+    state = scheduler.states[account]
+    scheduler.sweep(state.lastSuccess + scheduler.getStaleAfter(state) - 1)
+    assert stale == []
+    scheduler.sweep(state.lastSuccess + scheduler.getStaleAfter(state) + 1)
+    scheduler.sweep(state.lastSuccess + scheduler.getStaleAfter(state) + 2)
+    assert stale == [account]
+    assert scheduler.getStatus(account)['stale']
+
+    # An unchanged refresh is reported when it ends the staleness
+    scheduler.fetch(account)
+    assert refreshed == [account, account]
+    assert not scheduler.getStatus(account)['stale']
+
+
+def test_fetch_exceptions_back_off_the_account(controller):
+    account = controller.activeAccount
+
+    def fetchAccount(account):
+        raise ValueError('Malformed response')
+    controller.fetchAccount = fetchAccount
+    scheduler = RefreshScheduler(controller, minInterval=10)
+    scheduler.states[account].running = True
+    started = time.monotonic()
+    scheduler.fetch(account)
+    state = scheduler.states[account]
+    assert not state.running and state.failures == 1
+    assert state.error == 'Refresh error: Malformed response'
+    assert state.nextTime >= started + 10
+
+
+def test_accounts_never_refreshed_go_stale(controller):
+    account = controller.activeAccount
+    stale = []
+    scheduler = RefreshScheduler(controller, minInterval=10, onStale=stale.append)
+    state = scheduler.states[account]
+    scheduler.sweep(state.added + scheduler.getStaleAfter(state) - 1)
+    assert stale == []
+    scheduler.sweep(state.added + scheduler.getStaleAfter(state) + 1)
+    assert account in stale
+    status = scheduler.getStatus(account)
+    assert status['stale'] and status['age'] is None and status['staleSince'] is not None
@@ -0,0 +1,38 @@
+from Metrics import metrics
+
+
+def test_worker_metrics_are_merged(controller):
+    account = controller.activeAccount
+    controller.startWorker()
+    try:
+        metrics.reset()
+        snapshot = controller.fetchAccount(account)
+        assert snapshot['transactions']['status'] == 'ok'
+        requests = {dict(labels)['endpoint']: histogram.count
+                    for (name, labels), histogram in metrics.histograms.items()
+                    if name == 'zerpy_api_request_seconds'}
+        assert requests['account_info'] == 1 and requests['account_transactions'] >= 1
+
+        # Only stopWorker closes and drops the worker
+        controller.stopAutoRefresh()
+        controller.unsubscribe()
+        assert controller.worker is not None
+    finally:
+        controller.stopWorker()
+    assert controller.worker is None
+
+
+def test_merge_adds_drained_metrics():
+    metrics.reset()
+    metrics.increment('zerpy_test_total', 2, kind='a')
+    metrics.observe('zerpy_test_seconds', 0.2)
+    delta = metrics.drain()
+    assert not metrics.counters and not metrics.histograms
+    metrics.increment('zerpy_test_total', 1, kind='a')
+    metrics.observe('zerpy_test_seconds', 3.0)
+    metrics.merge(delta)
+    assert metrics.counters[('zerpy_test_total', (('kind', 'a'),))] == 3
+    histogram = metrics.histograms[('zerpy_test_seconds', ())]
+    assert histogram.count == 2 and sum(histogram.counts) == 2
+    assert abs(histogram.sum - 3.2) < 1e-9
+    metrics.reset()
@@ -0,0 +1,28 @@
+from TaskScheduler import TaskScheduler
+from conftest import processEventsUntil
+import time
+
+
+def test_finished_task_is_not_joined(qapp):
+    scheduler = TaskScheduler()
+    first, second = [], []
+    task = scheduler.schedule('k', lambda: 1, first.append)
+    assert task.done.wait(5)
+
+    # Its result is emitted but not delivered yet
+    scheduler.schedule('k', lambda: 2, second.append)
+    assert processEventsUntil(lambda: first and second)
+    assert first == [1] and second == [2]
+    assert processEventsUntil(lambda: not scheduler.isRunning('k'))
+    assert scheduler.replaced == []
+    scheduler.pool.waitForDone()
+
+
+def test_running_task_is_joined(qapp):
+    scheduler = TaskScheduler()
+    results = []
+    scheduler.schedule('k', lambda: time.sleep(0.2) or 1, results.append)
+    scheduler.schedule('k', lambda: 2, results.append)
+    assert processEventsUntil(lambda: len(results) == 2)
+    assert results == [1, 1] and not scheduler.isRunning('k')
+    scheduler.pool.waitForDone()
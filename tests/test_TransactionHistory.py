@@ -0,0 +1,69 @@
+from MockXrpApi import MockAccount, makeAddress
+from TransactionHistory import TransactionHistory, parseQuery
+from TransactionStore import TransactionStore
+import pytest
+
+
+@pytest.fixture
+def history(tmp_path):
+    account = MockAccount(0, makeAddress(0), 2000)
+    store = TransactionStore(str(tmp_path / 'store.db'))
+    store.add(account.address, [account.getTransaction(i) for i in range(2000)])
+    yield TransactionHistory(store, account.address)
+    store.close()
+
+
+def test_repeated_terms_narrow_the_query():
+    assert parseQuery('>100 >200 <=500 10..300') == {'minDrops': 200000001, 'maxDrops': 300000000}
+    assert parseQuery('2020-06 2020-06-10..2020-07-31') == \
+        {'since': parseQuery('2020-06-10')['since'], 'until': parseQuery('2020-06')['until']}
+    assert parseQuery('rAb cD') == {'counterparty': ['rAb', 'cD']}
+
+
+def test_every_counterparty_word_must_match(history):
+    address = history.addresses[0]
+    words = [address[1:6], address[-5:]]
+    view = history.search(**parseQuery(' '.join(words)))
+    assert len(view) > 0
+    assert all(history.addresses[history.counterparties[view.getPosition(i)]] == address
+               for i in range(len(view)))
+    assert len(history.search(**parseQuery(f'{words[0]} {words[0]}zzz'))) == 0
+    assert len(history.search(counterparty=words[0])) == len(history.search(counterparty=words))
+
+
+def test_refresh_appends_to_the_shared_columns(history):
+    store, address = history.store, history.account
+    assert history.refresh() is history
+    before = len(history.search(minDrops=0))
+    newest = history.getId(0)
+
+    account = MockAccount(0, address, 2010)
+    store.add(address, [account.getTransaction(i) for i in range(2000, 2010)])
+    refreshed = history.refresh()
+    assert refreshed.ledgers is history.ledgers
+    assert len(refreshed) == store.count(address, 'tesSUCCESS') > len(history)
+    assert refreshed.getKey(len(refreshed) - len(history)) == history.getKey(0)
+    # The extended history keeps its rows
+    assert history.getId(0) == newest
+    assert len(history.search(minDrops=0)) == before
+    assert len(refreshed.search(minDrops=0)) == len(refreshed)
+
+    # Extending it again copies, as the columns already hold more rows
+    again = history.refresh()
+    assert again.ledgers is not history.ledgers
+    assert [again.getId(i) for i in range(len(again))] == \
+        [refreshed.getId(i) for i in range(len(refreshed))]
+
+
+def test_refresh_rereads_when_older_transactions_are_stored(tmp_path):
+    account = MockAccount(0, makeAddress(0), 100)
+    transactions = [account.getTransaction(i) for i in range(100)]
+    store = TransactionStore(str(tmp_path / 'store.db'))
+    store.add(account.address, transactions[:50] + transactions[60:])
+    history = TransactionHistory(store, account.address)
+    store.add(account.address, transactions[50:60])
+    refreshed = history.refresh()
+    assert refreshed.origin is not history.origin
+    assert [refreshed.getId(i) for i in range(len(refreshed))] == \
+        [row[0] for row in reversed(store.getColumns(account.address, 'tesSUCCESS'))]
+    store.close()
@@ -0,0 +1,32 @@
+from MockXrpApi import MockAccount, makeAddress
+from TransactionStore import TransactionStore
+import json
+import sqlite3
+
+
+def test_migrates_store_without_result_column(tmp_path):
+    fileName = str(tmp_path / 'store.db')
+    account = MockAccount(0, makeAddress(0), 100)
+    transactions = [account.getTransaction(i) for i in range(100)]
+    db = sqlite3.connect(fileName)
+    db.execute('CREATE TABLE transactions (account TEXT NOT NULL, id TEXT NOT NULL, '
+               'ledgerVersion INTEGER NOT NULL, indexInLedger INTEGER NOT NULL, '
+               'data TEXT NOT NULL, PRIMARY KEY (account, id))')
+    db.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?)',
+                   [(account.address, tx['id'], tx['outcome']['ledgerVersion'], 0, json.dumps(tx))
+                    for tx in transactions[:60]])
+    db.commit()
+    db.close()
+
+    store = TransactionStore(fileName)
+    assert store.add(account.address, transactions) == 40
+    assert store.count(account.address) == 100
+    assert store.count(account.address, 'tesSUCCESS') == 98
+    assert store.get(account.address, transactions[10]['id']) == transactions[10]
+    assert store.getColumns(account.address, 'tesSUCCESS')[0][0] == transactions[1]['id']
+    store.close()
+
+    store = TransactionStore(fileName)
+    assert store.db.execute('PRAGMA user_version').fetchone()[0] == TransactionStore.schemaVersion
+    assert store.count(account.address, 'tesSUCCESS') == 98
+    store.close()
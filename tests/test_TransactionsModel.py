@@ -0,0 +1,72 @@
+from PyQt5.QtTest import QAbstractItemModelTester
+from TransactionsModel import TransactionsModel
+import random
+
+
+class FakeHistory:
+    account = 'rAccount'
+
+    def __init__(self, keys: list):
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def getKey(self, i: int) -> str:
+        return self.keys[i]
+
+
+class FakeController:
+    def __init__(self, keys: list):
+        self.transactions = {'status': 'ok', 'transactions': FakeHistory(keys)}
+
+    def getHistory(self) -> FakeHistory:
+        return self.transactions['transactions']
+
+    def formatTransaction(self, history: FakeHistory, i: int) -> str:
+        return history.getKey(i)
+
+
+def getRows(model: TransactionsModel) -> list:
+    return [model.data(model.index(row, 0)) for row in range(model.rowCount())]
+
+
+def test_updates_keep_the_model_consistent(qapp):
+    rng = random.Random(1)
+    universe = [f'tx{i:04d}' for i in range(300, 0, -1)]  # Newest first
+    controller = FakeController(universe[100:140])
+    model = TransactionsModel(controller)
+    model.pageSize = 10
+    QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    model.reset()
+
+    # Exceptions in slots abort the process, so they are checked afterwards
+    inserted, errors = [], []
+
+    def onRowsInserted(parent, first, last):
+        try:
+            inserted.append(getRows(model)[first:last + 1])
+        except Exception as e:
+            errors.append(e)
+    model.rowsInserted.connect(onRowsInserted)
+
+    for step in range(300):
+        if rng.random() < 0.3:
+            if model.canFetchMore():
+                model.fetchMore()
+        else:
+            top = rng.randrange(0, 100)
+            keys = [key for key in universe[top:top + rng.randrange(1, 120)] if rng.random() < 0.9]
+            controller.transactions = {'status': 'ok', 'transactions': FakeHistory(keys)}
+            anchor = rng.randrange(-1, model.rowCount())
+            anchorKey = getRows(model)[anchor] if anchor >= 0 else None
+            del inserted[:]
+            row = model.update(anchor)
+            if row >= 0:
+                assert getRows(model)[row] == anchorKey
+            # Listeners see the new rows
+            assert errors == []
+            for rows in inserted:
+                assert set(rows) <= set(keys)
+        rows = getRows(model)
+        assert rows == controller.getHistory().keys[:len(rows)]
@@ -0,0 +1,76 @@
+from MockXrpApi import MockAccount
+from TransactionStore import TransactionStore
+from conftest import processEventsUntil
+import os
+import pytest
+import socket
+import time
+
+
+@pytest.fixture
+def makeWindow(config, qapp):
+    from Zerpy import MainWindow
+    windows = []
+
+    def makeWindow(**kwargs):
+        windows.append(MainWindow(config, **kwargs))
+        return windows[-1]
+    yield makeWindow
+    for window in windows:
+        window.close()
+        window.scheduler.pool.waitForDone()
+
+
+def test_window_starts_when_the_metrics_port_is_in_use(config, makeWindow, capsys):
+    with socket.create_server(('localhost', 0)) as busy:
+        config.metricsPort = busy.getsockname()[1]
+        makeWindow()
+    assert f'cannot serve the metrics on port {config.metricsPort}' in capsys.readouterr().err
+
+
+def test_selecting_the_active_account_again_refreshes_it(makeWindow):
+    window = makeWindow()
+    account = window.controller.activeAccount
+    window.scheduler.cancelAll()
+    window.controller.fetchAccount(account)
+    window.controller.setActiveAccount(account)
+
+    window.addressDropdown.activated.emit(window.addressDropdown.currentIndex())
+    assert window.scheduler.isRunning(f'fetch:{account}')
+
+
+def test_first_paint_does_not_wait_for_a_large_stored_history(mock, config, makeWindow):
+    from Zerpy import firstPaintBudget
+    account = next(iter(config.accounts))
+    store = TransactionStore(os.path.join(os.path.dirname(config.fileName), '.zerpy_store.db'))
+    stored = MockAccount(mock.accounts[account].index, account, 50000)
+    store.add(account, [stored.getTransaction(i) for i in range(len(stored))])
+    store.setSyncedLedger(account, stored.getTransaction(len(stored) - 1)['outcome']['ledgerVersion'])
+    store.setAccountInfo(account, {'status': 'ok',
+                                   'account_data': {'Balance': '123000000', 'Sequence': 1}})
+    store.close()
+
+    window = makeWindow(startTime=time.perf_counter())
+    widget = window.transactionsWidget
+    # The stored balance is shown while the history loads in the background
+    assert widget.balaceAmountLabel.text() == '123.000000 XRP'
+    assert widget.transactionsLabel.text() == 'Transactions (loading)'
+    window.show()
+    assert processEventsUntil(lambda: window.firstPaintTime is not None)
+    assert window.firstPaintTime < firstPaintBudget
+
+    assert processEventsUntil(lambda: widget.tableModel.getCount() >= 49000, 30)
+    assert window.controller.getTotalTransactionCount() == widget.tableModel.getCount()
+
+
+def test_failed_details_are_shown(makeWindow):
+    window = makeWindow()
+    widget = window.transactionsWidget
+    assert processEventsUntil(lambda: widget.tableModel.rowCount() > 0)
+
+    def getTransactionDetails(account, id):
+        raise ValueError('Malformed response')
+    window.controller.getTransactionDetails = getTransactionDetails
+    widget.tableView.setCurrentIndex(widget.tableModel.index(0, 0))
+    assert processEventsUntil(lambda: widget.detailView.toPlainText() != 'Loading...')
+    assert widget.detailView.toPlainText() == 'Cannot load the transaction: Malformed response'
@@ -0,0 +1,63 @@
+from MockXrpApi import makeAddress
+from ZerpyCLI import main
+import json
+import pytest
+
+
+@pytest.fixture
+def configFileName(mock, tmp_path):
+    # The last account is unknown to the server
+    accounts = {address: {'apiKey': 'mock', 'secret': 'mock', 'alias': f'mock{i}'}
+                for i, address in enumerate(list(mock.accounts) + [makeAddress(7)])}
+    return mock.writeConfig(str(tmp_path / 'config.js'), accounts=accounts)
+
+
+def run(capsys, *argv) -> tuple:
+    code = main(list(argv))
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+def test_balance(mock, configFileName, capsys):
+    first, second = list(mock.accounts)
+    code, out, err = run(capsys, 'balance', '--config', configFileName, '--json',
+                         '--account', second)
+    assert code == 0
+    assert json.loads(out) == {second: {'balance': '100000.000000', 'sequence': 301}}
+
+    code, out, err = run(capsys, 'balance', '--config', configFileName, '--json', '--all')
+    assert code == 1 and 'Error: ' + makeAddress(7) in err
+    assert set(json.loads(out)) == {first, second}
+
+    code, out, err = run(capsys, 'balance', '--config', configFileName, '--account', 'rNobody')
+    assert code == 2 and 'rNobody' in err
+
+
+def test_txs(mock, configFileName, capsys):
+    account = list(mock.accounts)[1]
+    code, out, err = run(capsys, 'txs', '--config', configFileName, '--json',
+                         '--account', account, '--limit', '5')
+    assert code == 0
+    records = json.loads(out)
+    assert len(records) == 5 and all(record['result'] == 'tesSUCCESS' for record in records)
+    assert records[0]['ledger'] >= records[-1]['ledger']
+
+    code, out, err = run(capsys, 'txs', '--config', configFileName, '--account', account,
+                         '--offline', '--since', str(records[2]['ledger']))
+    assert code == 0 and len(out.splitlines()) == 3
+
+    code, out, err = run(capsys, 'txs', '--config', configFileName, '--account', makeAddress(7))
+    assert code == 1 and err.startswith('Error: ')
+
+
+def test_send(mock, configFileName, capsys):
+    source, destination = list(mock.accounts)
+    code, out, err = run(capsys, 'send', '--config', configFileName, '--json',
+                         '--account', source, '2.5', destination)
+    assert code == 0 and json.loads(out) == {'status': 'ok'}
+    assert mock.accounts[source].balance == 100000 * 10 ** 6 - 2500012
+
+    code, out, err = run(capsys, 'send', '--config', configFileName, '--json',
+                         '--account', makeAddress(7), '1', destination)
+    assert code == 1 and json.loads(out)['status'] == 'error'
+    assert 'Unknown source account' in err